@@ -0,0 +1,206 @@
+# ai_responder/automaton.py
+import re
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+
+class Automaton:
+    """
+    Aho-Corasick: все шаблоны ищутся в тексте за один проход.
+    Использование: add(...) для каждого шаблона -> build() -> find(text).
+    """
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._own: List[List[Any]] = [[]]
+        self._out: List[List[Any]] = [[]]
+        self._built = False
+
+    def add(self, pattern: str, value: Any):
+        if not pattern:
+            return
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._own.append([])
+            node = nxt
+        self._own[node].append(value)
+        self._built = False
+
+    def build(self):
+        self._out = [list(own) for own in self._own]
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                # выходы суффиксов наследуются сразу — при поиске не нужно ходить по fail-цепочке
+                if self._out[self._fail[nxt]]:
+                    self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+        self._built = True
+
+    def find(self, text: str) -> Iterator[Tuple[int, Any]]:
+        """Отдаёт (позиция конца совпадения, value) для каждого вхождения."""
+        if not self._built:
+            self.build()
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for i, ch in enumerate(text or ""):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                for value in out[node]:
+                    yield i, value
+
+
+# границы фразы в тексте: NONE — где угодно (как `in`), START — с начала слова
+# («код» не найдётся в «промокод», но найдётся в «кода»), WORD — отдельным словом («go» не в «google»)
+NONE, START, WORD = "none", "start", "word"
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+def contains(text: str, phrase: str, boundary: str = NONE) -> bool:
+    """
+    Одна фраза в уже приведённом к нижнему регистру тексте, с учётом границ.
+    Для коротких списков и наборов, которые меняются от вызова к вызову
+    (заголовки вариантов), дешевле цикла с `in` перед вызовом, чем PhraseMatcher.
+    """
+    if not phrase:
+        return False
+    start = text.find(phrase)
+    while start != -1:
+        end = start + len(phrase)
+        if boundary == NONE or (
+            (not start or not _is_word_char(text[start - 1]))
+            and (boundary == START or end == len(text) or not _is_word_char(text[end]))
+        ):
+            return True
+        start = text.find(phrase, start + 1)
+    return False
+
+
+def _trie_pattern(phrases: Iterable[str]) -> str:
+    """Регулярное выражение-бор: общие префиксы разбираются один раз, на каждой позиции — самое длинное совпадение."""
+    trie: Dict[str, Any] = {}
+    for phrase in phrases:
+        node = trie
+        for ch in phrase:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def walk(node: Dict[str, Any]) -> str:
+        alts = [re.escape(ch) + walk(sub) for ch, sub in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        return "(?:" + body + ")?" if "" in node else body
+
+    return walk(trie)
+
+
+class PhraseMatcher:
+    """
+    Небольшие наборы фраз с метками (классами): за один проход по тексту —
+    все найденные фразы, с проверкой границ слова.
+
+    Для десятков коротких фраз Automaton на чистом Python медленнее цепочки
+    `in` (см. bench/phrases.py), поэтому фразы компилируются в одно
+    регулярное выражение-бор и ищутся движком re: на каждой позиции текста —
+    самое длинное совпадение, а более короткие фразы, которые являются его
+    префиксами, проверяются по заранее собранному списку. Текст приводится
+    к нижнему регистру здесь же. Выигрыш есть на списках из десятков фраз
+    (фильтр оффтопа); для нескольких фраз цикл с `in` быстрее.
+    """
+
+    def __init__(self, phrases: Iterable[Tuple[str, Any]] = (), boundary: str = NONE):
+        self.boundary = boundary
+        self._phrases: Dict[str, List[Tuple[Any, str]]] = {}
+        self._regex = None
+        for phrase, label in phrases:
+            self.add(phrase, label)
+
+    @classmethod
+    def from_classes(cls, classes: Dict[Any, Iterable[str]], boundary: str = NONE) -> "PhraseMatcher":
+        """{метка: [фразы]} — например {"mobile": ["смартфон", ...], "desktop": [...]}."""
+        return cls(((p, label) for label, phrases in classes.items() for p in phrases), boundary)
+
+    def add(self, phrase: str, label: Any, boundary: Optional[str] = None):
+        phrase = (phrase or "").lower()
+        if phrase:
+            self._phrases.setdefault(phrase, []).append((label, boundary or self.boundary))
+            self._regex = None
+
+    def build(self):
+        # для каждой фразы — она сама и все более короткие фразы-префиксы: (длина, метка, граница)
+        self._prefixes: Dict[str, List[Tuple[int, Any, str]]] = {
+            phrase: [
+                (len(p), label, b)
+                for p in self._phrases if phrase.startswith(p)
+                for label, b in self._phrases[p]
+            ]
+            for phrase in self._phrases
+        }
+        # бор без проверок границ: re сам пропускает позиции, с которых не начинается ни одна фраза
+        self._regex = re.compile(_trie_pattern(self._phrases)) if self._phrases else None
+
+    def _first(self, text: str) -> Tuple[str, Any]:
+        """(текст в нижнем регистре, первый кандидат или None)."""
+        if self._regex is None:
+            if not self._phrases:
+                return "", None
+            self.build()
+        t = (text or "").lower()
+        return t, self._regex.search(t)
+
+    def _hits(self, t: str, m) -> List[Tuple[int, int, Any]]:
+        """Фразы, которые начинаются в позиции кандидата m и проходят проверку границ."""
+        start = m.start()
+        left_ok = not start or not _is_word_char(t[start - 1])
+        hits = []
+        for length, label, boundary in self._prefixes[m.group()]:
+            end = start + length
+            if boundary == NONE or (
+                left_ok and (boundary == START or end == len(t) or not _is_word_char(t[end]))
+            ):
+                hits.append((start, end, label))
+        return hits
+
+    def scan(self, text: str) -> Iterator[Tuple[int, int, Any]]:
+        """(начало, конец, метка) каждого вхождения с учётом границ; конец — не включительно."""
+        t, m = self._first(text)
+        while m is not None:
+            yield from self._hits(t, m)
+            # следующая позиция: так находятся и фразы, начинающиеся внутри только что найденной
+            m = self._regex.search(t, m.start() + 1)
+
+    def labels(self, text: str) -> Set[Any]:
+        """Все метки, фразы которых есть в тексте."""
+        found = set()
+        t, m = self._first(text)
+        while m is not None:
+            found.update(label for _, _, label in self._hits(t, m))
+            m = self._regex.search(t, m.start() + 1)
+        return found
+
+    def search(self, text: str) -> bool:
+        """Есть ли в тексте хоть одна фраза."""
+        t, m = self._first(text)
+        while m is not None:
+            if self._hits(t, m):
+                return True
+            m = self._regex.search(t, m.start() + 1)
+        return False
@@ -0,0 +1,255 @@
+# ai_responder/cache.py
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+def make_key(*parts: str) -> str:
+    h = hashlib.sha1()
+    for part in parts:
+        h.update((part or "").encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+class AnswerCache:
+    """
+    LRU + TTL кэш готовых (очеловеченных) ответов.
+    В памяти — OrderedDict с ограничением по размеру; если задан path,
+    записи дублируются в SQLite и переживают перезапуск процесса.
+    SQLite не трогается из event loop: промах в памяти читается из базы
+    в потоке (aget), а записи копятся и уходят одной транзакцией в flush()
+    (run_flusher зовёт его в потоке раз в interval секунд).
+    Считает попадания/промахи и сколько секунд LLM сэкономлено.
+    """
+
+    def __init__(self, max_size: int = 1000, ttl: float = 24 * 3600, path: Optional[str] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        # key -> (ответ, время записи, сколько длился вызов LLM)
+        self._items: "OrderedDict[str, Tuple[str, float, float]]" = OrderedDict()
+        # ещё не записанное в SQLite: key -> запись (None — удалить)
+        self._unsaved: Dict[str, Optional[Tuple[str, float, float]]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._db: Optional[sqlite3.Connection] = None
+        # соединение общее для потоков чтения и записи
+        self._db_lock = threading.Lock()
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS answers ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, cost REAL NOT NULL)"
+                )
+                self._db.execute("DELETE FROM answers WHERE created < ?", (time.time() - ttl,))
+                self._db.execute(
+                    "DELETE FROM answers WHERE key NOT IN "
+                    "(SELECT key FROM answers ORDER BY created DESC LIMIT ?)",
+                    (max_size,),
+                )
+                self._db.commit()
+            except sqlite3.Error:
+                self._db = None
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl > 0 and time.time() - created > self.ttl
+
+    def _load(self, key: str) -> Optional[Tuple[str, float, float]]:
+        if self._db is None:
+            return None
+        try:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT value, created, cost FROM answers WHERE key = ?", (key,)
+                ).fetchone()
+        except sqlite3.Error:
+            return None
+        return tuple(row) if row else None
+
+    def get(self, key: str) -> Optional[str]:
+        """Только память (без SQLite) — можно звать откуда угодно."""
+        return self._found(key, self._items.get(key))
+
+    async def aget(self, key: str) -> Optional[str]:
+        """get() с дочиткой из SQLite при промахе (запись другого воркера или прошлого запуска) — в потоке."""
+        item = self._items.get(key)
+        if item is None:
+            # вытеснено из памяти, но ещё не записано (None здесь — ждёт удаления)
+            item = self._unsaved.get(key)
+            if item is None and key not in self._unsaved and self._db is not None:
+                item = await asyncio.to_thread(self._load, key)
+            if item is not None and key not in self._items:
+                self._remember(key, item)
+        return self._found(key, item)
+
+    def _found(self, key: str, item: Optional[Tuple[str, float, float]]) -> Optional[str]:
+        if item is not None and self._expired(item[1]):
+            self.delete(key)
+            item = None
+        if item is None:
+            self.misses += 1
+            return None
+        if key in self._items:
+            self._items.move_to_end(key)
+        self.hits += 1
+        self.saved_seconds += item[2]
+        return item[0]
+
+    def set(self, key: str, value: str, cost: float = 0.0):
+        item = (value, time.time(), cost)
+        self._remember(key, item)
+        if self._db is not None:
+            self._unsaved[key] = item
+
+    def _remember(self, key: str, item: Tuple[str, float, float]):
+        self._items[key] = item
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def delete(self, key: str):
+        self._items.pop(key, None)
+        if self._db is not None:
+            self._unsaved[key] = None
+
+    def flush(self) -> int:
+        """Записывает накопленное в SQLite одной транзакцией; возвращает число записей."""
+        return self._write(self._take())
+
+    def _take(self) -> Dict[str, Optional[Tuple[str, float, float]]]:
+        # забираем пачку в потоке event loop: set() в это время не пишет в неё
+        batch, self._unsaved = self._unsaved, {}
+        return batch
+
+    def _write(self, batch: Dict[str, Optional[Tuple[str, float, float]]]) -> int:
+        if self._db is None or not batch:
+            return 0
+        upserts = [(key, *item) for key, item in batch.items() if item is not None]
+        deletes = [(key,) for key, item in batch.items() if item is None]
+        try:
+            with self._db_lock:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO answers (key, value, created, cost) VALUES (?, ?, ?, ?)", upserts,
+                )
+                self._db.executemany("DELETE FROM answers WHERE key = ?", deletes)
+                self._db.commit()
+        except sqlite3.Error:
+            return 0
+        return len(batch)
+
+    async def run_flusher(self, interval: float = 1.0):
+        while True:
+            await asyncio.sleep(interval)
+            if self._unsaved:
+                await asyncio.to_thread(self._write, self._take())
+
+    def close(self):
+        self.flush()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "saved_seconds": round(self.saved_seconds, 3),
+            "unsaved": len(self._unsaved),
+        }
+
+
+class FrozenDict(dict):
+    """dict только для чтения: результат поиска из кэша общий для всех пользователей."""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("FrozenDict is read-only")
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+    __ior__ = _readonly
+
+    def __reduce__(self):
+        return FrozenDict, (dict(self),)
+
+
+def freeze(value: Any) -> Any:
+    """Глубокая неизменяемая копия: dict -> FrozenDict, list -> tuple (в JSON сессий это те же объект и массив)."""
+    if isinstance(value, dict):
+        return value if isinstance(value, FrozenDict) else FrozenDict((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+class SearchCache:
+    """
+    LRU кэш результатов поиска по базе: ключ — нормализованный вопрос, устройство
+    и версия базы, так что после перезагрузки старые результаты не находятся
+    (invalidate убирает их сразу). Результаты хранятся замороженными (freeze):
+    один и тот же кортеж отдаётся всем, кто задал этот вопрос, и попадает в
+    sessions.set_pending — изменить его там нельзя. Пустой результат
+    («не нашёл») тоже кэшируется. max_size=0 — кэш выключен.
+    """
+
+    def __init__(self, max_size: int = 5000):
+        self.max_size = max_size
+        self._items: "OrderedDict[Tuple[str, str, str], Tuple[Dict, ...]]" = OrderedDict()
+        # search_matches можно звать из потоков — OrderedDict под локом
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Tuple[str, str, str]) -> Optional[Tuple[Dict, ...]]:
+        with self._lock:
+            found = self._items.get(key)
+            if found is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return found
+
+    def set(self, key: Tuple[str, str, str], matches: Sequence[Dict]) -> Tuple[Dict, ...]:
+        """Запоминает результат и возвращает его замороженную копию — её и нужно отдавать дальше."""
+        frozen = freeze(matches)
+        if self.max_size <= 0:
+            return frozen
+        with self._lock:
+            self._items[key] = frozen
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+                self.evictions += 1
+        return frozen
+
+    def invalidate(self, version: Optional[str] = None) -> int:
+        """Удаляет результаты других версий базы (без version — все); возвращает, сколько удалено."""
+        with self._lock:
+            stale: List[Tuple[str, str, str]] = [k for k in self._items if version is None or k[2] != version]
+            for key in stale:
+                del self._items[key]
+        return len(stale)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,112 @@
+# ai_responder/embeddings.py
+"""
+Функции эмбеддингов для смыслового поиска (ai_responder/vectors.py).
+
+Эмбеддер — объект с полями name, dim и методом embed(texts) -> матрица
+float32 (len(texts), dim) с L2-нормированными строками. name записывается
+в артефакт векторов: вопрос должен кодироваться тем же эмбеддером, что и база.
+remote — embed ходит в сеть (из синхронного поиска такой эмбеддер не зовётся).
+
+  - "hashing" — локальный детерминированный: хэширование слов, их префиксов
+    и символьных 3-грамм в dim корзин. Без сети и ключей — для разработки,
+    бенчмарков и как запасной вариант;
+  - "openai"  — модель эмбеддингов через тот же API, что и чат (OPENAI_BASE_URL).
+    Бот кодирует вопрос через aembed (AsyncLLM: общий лимит и повторы, event
+    loop не ждёт сеть); синхронный embed — для офлайн-сборки векторов.
+"""
+import zlib
+from typing import List, Optional, Sequence
+
+from ai_responder.index import TOKEN_RE, normalize
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - зависит от окружения
+    np = None
+
+# длина префикса слова: грубая замена стемминга («вывести» / «вывод» -> «выв...»)
+PREFIX = 4
+
+
+def available() -> bool:
+    return np is not None
+
+
+def _normalize_rows(m: "np.ndarray") -> "np.ndarray":
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (m / norms).astype(np.float32, copy=False)
+
+
+class HashingEmbedder:
+    """Детерминированный эмбеддер без модели: одинаковый результат в любом процессе."""
+
+    remote = False
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.name = f"hashing:{dim}"
+
+    def _features(self, text: str):
+        t = normalize(text)
+        for tok in TOKEN_RE.findall(t):
+            yield "w:" + tok, 1.0
+            if len(tok) > PREFIX:
+                yield "p:" + tok[:PREFIX], 0.7
+            padded = f" {tok} "
+            for i in range(len(padded) - 2):
+                yield "c:" + padded[i:i + 3], 0.35
+
+    def embed(self, texts: Sequence[str]) -> "np.ndarray":
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, weight in self._features(text):
+                # crc32, а не hash(): hash() строк меняется между запусками
+                h = zlib.crc32(feature.encode("utf-8"))
+                out[row, (h >> 1) % self.dim] += weight if h & 1 else -weight
+        return _normalize_rows(out)
+
+
+class OpenAIEmbedder:
+    """Эмбеддинги через API: embed — синхронный клиент для CLI, aembed — общий AsyncLLM бота."""
+
+    remote = True
+
+    def __init__(self, model: str, api_key: str, base_url: Optional[str] = None, timeout: float = 10.0, batch: int = 256):
+        from openai import OpenAI
+
+        self.model = model
+        self.name = f"openai:{model}"
+        self.batch = batch
+        self.dim = 0  # становится известна после первого вызова
+        self.client = OpenAI(api_key=api_key, base_url=base_url, timeout=timeout)
+
+    def embed(self, texts: Sequence[str]) -> "np.ndarray":
+        rows: List[List[float]] = []
+        for start in range(0, len(texts), self.batch):
+            resp = self.client.embeddings.create(model=self.model, input=list(texts[start:start + self.batch]))
+            rows.extend(item.embedding for item in resp.data)
+        return self._matrix(rows, len(texts))
+
+    async def aembed(self, llm, texts: Sequence[str]) -> "np.ndarray":
+        resp = await llm.embed(self.model, list(texts))
+        return self._matrix([item.embedding for item in resp.data], len(texts))
+
+    def _matrix(self, rows: List[List[float]], n: int) -> "np.ndarray":
+        m = np.asarray(rows, dtype=np.float32)
+        if m.size:
+            self.dim = m.shape[1]
+        return _normalize_rows(m.reshape(n, -1))
+
+
+def make_embedder(kind: str, model: str = "", dim: int = 256, api_key: Optional[str] = None, base_url: Optional[str] = None):
+    """kind: "hashing" / "openai"; пустая строка или нет numpy — None (смысловой поиск выключен)."""
+    if not kind or np is None:
+        return None
+    if kind == "hashing":
+        return HashingEmbedder(dim)
+    if kind == "openai":
+        if not api_key:
+            return None
+        return OpenAIEmbedder(model, api_key, base_url=base_url)
+    raise ValueError(f"unknown embedder: {kind!r}")
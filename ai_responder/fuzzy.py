@@ -0,0 +1,60 @@
+# ai_responder/fuzzy.py
+import difflib
+from collections import Counter
+from typing import Dict, List, Set, Tuple
+
+
+class FuzzyIndex:
+    """
+    Нечёткий поиск по keyword'ам с той же семантикой, что и
+    difflib.SequenceMatcher(None, q, kw).ratio() >= threshold.
+
+    ratio = 2*M / (len(q) + len(kw)), где M — число совпавших символов.
+    M не больше пересечения мультимножеств символов (это quick_ratio у difflib),
+    поэтому сначала по символьным posting-спискам считаем эту верхнюю оценку
+    сразу для всех keyword'ов, отбрасываем всё, что заведомо не дотягивает
+    до порога, и только оставшихся кандидатов проверяем настоящим difflib.
+    """
+
+    def __init__(self, keywords: List[str], threshold: float):
+        self.keywords = keywords
+        self.threshold = threshold
+        self.lengths: List[int] = [len(kw) for kw in keywords]
+        # символ -> [(id keyword'а, сколько раз символ в нём встречается)]
+        self.char_postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.empty: List[int] = []
+        for kw_id, kw in enumerate(keywords):
+            if not kw:
+                self.empty.append(kw_id)
+                continue
+            for ch, n in Counter(kw).items():
+                self.char_postings.setdefault(ch, []).append((kw_id, n))
+
+    def candidates(self, q: str) -> Set[int]:
+        """id keyword'ов, у которых ratio с q МОЖЕТ быть не ниже порога."""
+        if not q:
+            # ratio("", "") == 1.0, с непустым keyword'ом — 0.0
+            return set(self.empty)
+
+        # верхняя оценка M для каждого keyword'а, у которого есть общие символы
+        bound: Dict[int, int] = {}
+        for ch, n in Counter(q).items():
+            for kw_id, m in self.char_postings.get(ch, ()):
+                bound[kw_id] = bound.get(kw_id, 0) + (n if n < m else m)
+
+        len_q = len(q)
+        lengths = self.lengths
+        threshold = self.threshold
+        return {
+            kw_id for kw_id, m in bound.items()
+            if 2.0 * m / (len_q + lengths[kw_id]) >= threshold
+        }
+
+    def ratio(self, q: str, kw_id: int) -> float:
+        try:
+            return difflib.SequenceMatcher(None, q, self.keywords[kw_id]).ratio()
+        except Exception:
+            return 0.0
+
+    def is_match(self, q: str, kw_id: int) -> bool:
+        return self.ratio(q, kw_id) >= self.threshold
@@ -0,0 +1,235 @@
+# ai_responder/index.py
+import hashlib
+import json
+import re
+import sys
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from ai_responder.automaton import Automaton
+from ai_responder.fuzzy import FuzzyIndex
+
+TOKEN_RE = re.compile(r'\w+')
+SPACES_RE = re.compile(r'\s+')
+
+OVERLAP_THRESHOLD = 0.4
+FUZZY_THRESHOLD = 0.72
+
+# уровни совпадения (порядок важен только для читаемости)
+TIER_EXACT = "exact"
+TIER_SUBSTRING = "substring"
+TIER_OVERLAP = "overlap"
+TIER_FUZZY = "fuzzy"
+
+# ранжировщик строится лениво, при первом запросе; лок — чтобы потоки пула не строили его дважды
+_ranker_lock = threading.Lock()
+
+
+def normalize(text: str) -> str:
+    """Та же нормализация, что и для вопроса: регистр + схлопывание пробелов."""
+    return SPACES_RE.sub(' ', (text or "").lower().strip())
+
+
+def tokenize(text: str) -> set:
+    return set(TOKEN_RE.findall((text or "").lower()))
+
+
+def title_of(item: Dict, default: str) -> str:
+    t = item.get("title") or item.get("name")
+    if not t:
+        kws = item.get("keywords") or []
+        if kws:
+            t = kws[0]
+    if not t:
+        txt = item.get("hint") or item.get("answer") or ""
+        t = (txt[:60] + "...") if txt else default
+    return t
+
+
+def entry_id(item_type: str, item: Dict) -> str:
+    """Стабильный id записи: зависит от содержимого ответа, а не от позиции в файле."""
+    val = item.get("answer") if item.get("answer") is not None else item.get("hint", "")
+    raw = json.dumps([item_type, val], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+class KeywordIndex:
+    """
+    Индекс базы знаний для одного устройства (навигация + правила).
+    Строится один раз при загрузке:
+      - exact:    нормализованный keyword -> id
+      - automaton: Aho-Corasick по всем keyword'ам (уровень "keyword входит в вопрос")
+      - postings: токен -> id keyword'ов, в которых он встречается (token overlap)
+      - fuzzy:    символьный индекс, отбирающий кандидатов для difflib (опечатки)
+    Результат совпадает с прежним линейным проходом: для каждого элемента
+    побеждает ПЕРВЫЙ по порядку keyword, прошедший любой из уровней.
+    """
+
+    def __init__(self, navigation: List[Any], rules: List[Any]):
+        # элементы в порядке обхода: сначала навигация, затем правила
+        self.entries: List[Tuple[str, Dict]] = []
+        for item in navigation or []:
+            if isinstance(item, dict):
+                self.entries.append(("navigation", item))
+        for rule in rules or []:
+            if isinstance(rule, dict):
+                self.entries.append(("rules", rule))
+        self.entry_ids: List[str] = [entry_id(t, item) for t, item in self.entries]
+        self.entry_by_id: Dict[str, int] = {eid: no for no, eid in enumerate(self.entry_ids)}
+
+        # уникальные нормализованные keyword'ы
+        self.keywords: List[str] = []
+        self.keyword_tokens: List[int] = []
+        # номер элемента -> список id keyword'ов в исходном порядке
+        self.entry_keywords: List[List[int]] = []
+
+        self.exact: Dict[str, int] = {}
+        self.postings: Dict[str, List[int]] = {}
+        self.automaton = Automaton()
+
+        for _, item in self.entries:
+            ids = []
+            for kw in item.get("keywords", []) or []:
+                kw_l = normalize(kw)
+                kw_id = self.exact.get(kw_l)
+                if kw_id is None:
+                    kw_id = self._add_keyword(kw_l)
+                ids.append(kw_id)
+            self.entry_keywords.append(ids)
+
+        self.automaton.build()
+        self.fuzzy = FuzzyIndex(self.keywords, FUZZY_THRESHOLD)
+        self._ranker = None
+
+    def _add_keyword(self, kw_l: str) -> int:
+        kw_l = sys.intern(kw_l)
+        kw_id = len(self.keywords)
+        self.keywords.append(kw_l)
+        self.exact[kw_l] = kw_id
+        tokens = tokenize(kw_l)
+        self.keyword_tokens.append(len(tokens))
+        for tok in tokens:
+            self.postings.setdefault(sys.intern(tok), []).append(kw_id)
+        if kw_l:
+            self.automaton.add(kw_l, kw_id)
+        return kw_id
+
+    # --- уровни совпадения ---
+    def _substring_hits(self, q: str) -> set:
+        return {kw_id for _, kw_id in self.automaton.find(q)}
+
+    def _overlap_hits(self, q: str) -> set:
+        q_tokens = tokenize(q)
+        if not q_tokens:
+            return set()
+        counts: Dict[int, int] = {}
+        for tok in q_tokens:
+            for kw_id in self.postings.get(tok, ()):
+                counts[kw_id] = counts.get(kw_id, 0) + 1
+        n_q = len(q_tokens)
+        return {
+            kw_id for kw_id, inter in counts.items()
+            if inter / max(n_q, self.keyword_tokens[kw_id]) >= OVERLAP_THRESHOLD
+        }
+
+    def _fuzzy_hit(self, q: str, kw_id: int, candidates: set, cache: Dict[int, bool]) -> bool:
+        if kw_id not in candidates:
+            return False
+        hit = cache.get(kw_id)
+        if hit is None:
+            hit = self.fuzzy.is_match(q, kw_id)
+            cache[kw_id] = hit
+        return hit
+
+    def _classify(self, q: str) -> List[Optional[Tuple[str, int]]]:
+        """Для каждого элемента — (уровень, id keyword'а), которым он совпал, или None."""
+        exact_id = self.exact.get(q) if q else None
+        substring = self._substring_hits(q)
+        overlap = self._overlap_hits(q)
+        fuzzy_candidates = self.fuzzy.candidates(q)
+        fuzzy_cache: Dict[int, bool] = {}
+
+        result: List[Optional[Tuple[str, int]]] = []
+        for ids in self.entry_keywords:
+            hit = None
+            for kw_id in ids:
+                tier = None
+                if kw_id == exact_id:
+                    tier = TIER_EXACT
+                elif kw_id in substring:
+                    tier = TIER_SUBSTRING
+                elif kw_id in overlap:
+                    tier = TIER_OVERLAP
+                elif self._fuzzy_hit(q, kw_id, fuzzy_candidates, fuzzy_cache):
+                    tier = TIER_FUZZY
+                if tier:
+                    hit = (tier, kw_id)
+                    break
+            result.append(hit)
+        return result
+
+    def describe(self, entry_no: int, tier: str, kw_id: Optional[int] = None) -> Dict:
+        """Результат поиска для элемента; title по умолчанию — совпавший (или первый) keyword."""
+        item_type, item = self.entries[entry_no]
+        if kw_id is None:
+            ids = self.entry_keywords[entry_no]
+            kw_id = ids[0] if ids else None
+        # value берём из answer (приоритет) -> hint fallback
+        val = item.get("answer") if item.get("answer") is not None else item.get("hint", "")
+        return {
+            "id": self.entry_ids[entry_no],
+            "type": item_type,
+            "title": title_of(item, self.keywords[kw_id] if kw_id is not None else ""),
+            "value": val,
+            "tier": tier,
+        }
+
+    def search(self, question: str) -> List[Dict]:
+        q = normalize(question)
+
+        matches: List[Dict] = []
+        exact_matches: List[Dict] = []
+
+        for entry_no, hit in enumerate(self._classify(q)):
+            if hit is None:
+                continue
+            tier, kw_id = hit
+            found = self.describe(entry_no, tier, kw_id)
+            if tier == TIER_EXACT:
+                exact_matches.append(found)
+            else:
+                matches.append(found)
+
+        # 🔥 ЕСЛИ ЕСТЬ ТОЧНОЕ СОВПАДЕНИЕ — ВОЗВРАЩАЕМ ТОЛЬКО ЕГО
+        if exact_matches:
+            return exact_matches
+
+        # 🧹 Удаляем дубликаты (одинаковый смысл)
+        unique = []
+        seen = set()
+        for m in matches:
+            key = (m["type"], str(m["value"]))
+            if key not in seen:
+                seen.add(key)
+                unique.append(m)
+
+        return unique
+
+    # --- ранжирование (RANKING_MODE=tfidf, см. ai_responder/ranking.py) ---
+    def ranker(self):
+        ranker = getattr(self, "_ranker", None)
+        if ranker is None:
+            from ai_responder.ranking import TfidfRanker
+            with _ranker_lock:
+                ranker = getattr(self, "_ranker", None)
+                if ranker is None:
+                    ranker = self._ranker = TfidfRanker(
+                        self.entries,
+                        [[self.keywords[i] for i in ids] for ids in self.entry_keywords],
+                        self.entry_ids,
+                    )
+        return ranker
+
+    def rank(self, question: str, **params) -> List[Dict]:
+        """top-k записей с оценкой "score"; один результат — если лидер уверенный."""
+        return self.ranker().rank(question, **params)
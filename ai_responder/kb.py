@@ -0,0 +1,193 @@
+# ai_responder/kb.py
+"""
+База знаний: загрузка, проверка и предкомпилированный артефакт.
+
+    python -m ai_responder.kb            # проверить JSON и собрать data/kb.bin
+    python -m ai_responder.kb --check    # только проверить
+
+Артефакт — один pickle с уже построенными индексами (нормализованные и
+интернированные keyword'ы, posting-списки, автомат, нечёткий индекс) и
+исходными записями. Он привязан к хэшам исходных JSON и кода индексов:
+если что-то из них поменялось, артефакт считается устаревшим и база
+собирается из JSON как раньше.
+
+Воркерам пула процессов (MATCHING_MODE=process) основной процесс отдаёт
+срез базы неизменяемым файлом своей версии (snapshot_path / save_kb):
+воркер загружает ровно ту базу, по которой задан вопрос, а не то, что
+сейчас лежит в JSON.
+"""
+import argparse
+import gc
+import hashlib
+import json
+import os
+import pickle
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from ai_responder.index import KeywordIndex
+
+KB_FORMAT = 1
+_HERE = Path(__file__).resolve().parent
+# от этих модулей зависит устройство pickle — их правка инвалидирует артефакт
+_CODE_FILES = ("index.py", "fuzzy.py", "automaton.py", "kb.py")
+
+
+class KnowledgeBaseError(ValueError):
+    pass
+
+
+class KnowledgeBase:
+    """Записи базы и индексы по устройствам."""
+
+    def __init__(self, navigation_desktop: List, navigation_mobile: List, rules: List, version: str = ""):
+        self.navigation_desktop = navigation_desktop
+        self.navigation_mobile = navigation_mobile
+        self.rules = rules
+        self.version = version
+        self.indexes: Dict[str, KeywordIndex] = build_indexes(navigation_desktop, navigation_mobile, rules)
+
+    def index(self, device: str) -> KeywordIndex:
+        return self.indexes["mobile" if device == "mobile" else "desktop"]
+
+
+def build_indexes(navigation_desktop: List, navigation_mobile: List, rules: List) -> Dict[str, KeywordIndex]:
+    return {
+        "desktop": KeywordIndex(navigation_desktop, rules),
+        "mobile": KeywordIndex(navigation_mobile, rules),
+    }
+
+
+def load_json(p: Path):
+    try:
+        return json.loads(p.read_text(encoding="utf-8"))
+    except Exception:
+        return []
+
+
+def validate(name: str, data) -> List[str]:
+    """Список ошибок структуры файла (пустой — всё в порядке)."""
+    if not isinstance(data, list):
+        return [f"{name}: ожидается список записей"]
+    errors = []
+    for i, item in enumerate(data):
+        where = f"{name}[{i}]"
+        if not isinstance(item, dict):
+            errors.append(f"{where}: запись должна быть объектом")
+            continue
+        kws = item.get("keywords")
+        if not isinstance(kws, list) or not kws:
+            errors.append(f"{where}: нет keywords")
+        elif not all(isinstance(k, str) and k.strip() for k in kws):
+            errors.append(f"{where}: keywords должны быть непустыми строками")
+        answer = item.get("answer") if item.get("answer") is not None else item.get("hint")
+        if isinstance(answer, dict):
+            if not isinstance(answer.get("steps"), list) or not answer.get("title"):
+                errors.append(f"{where}: answer-объект должен содержать title и steps")
+        elif not isinstance(answer, str) or not answer.strip():
+            errors.append(f"{where}: нет answer / hint")
+    return errors
+
+
+def source_version(paths: Sequence[Path]) -> str:
+    """Хэш исходных файлов базы и кода индексов."""
+    h = hashlib.sha1(str(KB_FORMAT).encode())
+    for p in list(paths) + [_HERE / f for f in _CODE_FILES]:
+        try:
+            h.update(Path(p).read_bytes())
+        except OSError:
+            h.update(b"<missing>")
+        h.update(b"\x00")
+    return h.hexdigest()[:16]
+
+
+def build_kb(paths: Sequence[Path]) -> KnowledgeBase:
+    """paths — (navigation desktop, navigation mobile, rules)."""
+    version = source_version(paths)
+    return KnowledgeBase(*(load_json(Path(p)) for p in paths), version=version)
+
+
+def compile_kb(paths: Sequence[Path], artifact: Path) -> KnowledgeBase:
+    errors = []
+    for p in paths:
+        try:
+            data = json.loads(Path(p).read_text(encoding="utf-8"))
+        except Exception as e:
+            errors.append(f"{Path(p).name}: {e}")
+            continue
+        errors.extend(validate(Path(p).name, data))
+    if errors:
+        raise KnowledgeBaseError("\n".join(errors))
+
+    kb = build_kb(paths)
+    save_kb(kb, artifact)
+    return kb
+
+
+def save_kb(kb: KnowledgeBase, artifact: Path):
+    # у каждого процесса свой временный файл — несколько воркеров могут пересобирать одновременно
+    tmp = artifact.with_suffix(f"{artifact.suffix}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        pickle.dump({"format": KB_FORMAT, "version": kb.version, "kb": kb}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, artifact)
+
+
+def snapshot_path(artifact: Path, version: str) -> Path:
+    """Файл среза базы версии version рядом с артефактом: data/kb.bin -> data/kb.<version>.bin."""
+    return artifact.with_name(f"{artifact.stem}.{version}{artifact.suffix}")
+
+
+def read_artifact(artifact: Path, version: str) -> Optional[KnowledgeBase]:
+    """База из артефакта, если он есть, цел и ровно этой версии; иначе None."""
+    # десятки тысяч мелких объектов: сборщик мусора во время загрузки только мешает
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        with open(artifact, "rb") as f:
+            blob = pickle.load(f)
+        if blob.get("format") == KB_FORMAT and blob.get("version") == version:
+            return blob["kb"]
+    except Exception:
+        pass
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return None
+
+
+def load_kb(paths: Sequence[Path], artifact: Optional[Path] = None) -> KnowledgeBase:
+    """Свежий артефакт — одна десериализация; иначе сборка из JSON."""
+    if artifact is not None:
+        kb = read_artifact(artifact, source_version(paths))
+        if kb is not None:
+            return kb
+    return build_kb(paths)
+
+
+def _cli() -> int:
+    from ai_responder.paths import KB_ARTIFACT, KB_SOURCES
+
+    parser = argparse.ArgumentParser(description="Validate the knowledge base and build the precompiled artifact")
+    parser.add_argument("--check", action="store_true", help="only validate the JSON files")
+    args = parser.parse_args()
+    try:
+        if args.check:
+            problems = [e for p in KB_SOURCES for e in validate(p.name, load_json(p))]
+            if problems:
+                raise KnowledgeBaseError("\n".join(problems))
+            print("ok")
+        else:
+            kb = compile_kb(KB_SOURCES, KB_ARTIFACT)
+            print(f"{KB_ARTIFACT} version={kb.version}")
+    except KnowledgeBaseError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    # классы в pickle должны ссылаться на ai_responder.kb, а не на __main__ — запускаем CLI из импортированного модуля
+    import ai_responder.kb as kb_module
+
+    sys.exit(kb_module._cli())
@@ -0,0 +1,222 @@
+# ai_responder/llm.py
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from bot.config import (
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+    OPENAI_MAX_CONCURRENCY,
+    OPENAI_TIMEOUT,
+    OPENAI_RATE,
+    OPENAI_BURST,
+    OPENAI_QUEUE_LIMIT,
+    OPENAI_MAX_RETRIES,
+    OPENAI_MAX_WAIT,
+)
+from ai_responder.metrics import RETRIES, SHED
+from ai_responder.ratelimit import Overloaded, TokenBucket, backoff, parse_retry_after
+from ai_responder.warmup import Lazy
+
+log = logging.getLogger(__name__)
+
+
+def _import_sdk():
+    # httpx SDK импортирует сам; AsyncLLM берёт его уже из sys.modules
+    import openai
+
+    return openai
+
+
+# SDK модели — самый тяжёлый импорт бота: грузится в фоновом прогреве или при первом вызове, а не при старте
+sdk = Lazy(_import_sdk, "openai")
+
+# статусы, после которых запрос можно повторить: 408/409 — по рекомендации API, 429 — лимит, 5xx — сбой на стороне провайдера
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+
+def extract_content(resp: Any, fallback: str) -> str:
+    """Достаёт текст из ответа chat.completions (объект SDK или dict)."""
+    if not resp or not getattr(resp, "choices", None):
+        return fallback
+    choice0 = resp.choices[0]
+    message = getattr(choice0, "message", None)
+    if isinstance(message, dict):
+        return message.get("content") or fallback
+    if message is not None and getattr(message, "content", None):
+        return message.content
+    if hasattr(message, "get"):
+        return message.get("content") or fallback
+    if hasattr(choice0, "text"):
+        return choice0.text or fallback
+    return fallback
+
+
+def delta_content(chunk: Any) -> str:
+    """Текст очередного куска потокового ответа ("" для служебных кусков, например с usage)."""
+    choices = getattr(chunk, "choices", None)
+    if not choices:
+        return ""
+    delta = getattr(choices[0], "delta", None)
+    if isinstance(delta, dict):
+        return delta.get("content") or ""
+    return getattr(delta, "content", None) or ""
+
+
+def retry_delay(error: Exception) -> Optional[float]:
+    """
+    Через сколько повторить вызов после ошибки: Retry-After ответа, если он есть,
+    иначе 0.0 (значит — по экспоненциальной задержке); None — повторять нельзя.
+    """
+    openai = sdk.get()
+    if isinstance(error, openai.APIStatusError):
+        if error.status_code not in RETRY_STATUSES:
+            return None
+        return parse_retry_after(error.response.headers) or 0.0
+    if isinstance(error, openai.APIConnectionError):  # в т.ч. APITimeoutError
+        return 0.0
+    return None
+
+
+class AsyncLLM:
+    """
+    Асинхронный клиент модели: один общий httpx.AsyncClient с keep-alive,
+    таймаут на каждый вызов и ограничение числа одновременных запросов —
+    ожидание ответа модели не блокирует event loop и чужие чаты.
+
+    Частота вызовов ограничена ведром токенов (rate в секунду, 0 — без
+    ограничения). 429 / 5xx / сетевые ошибки повторяются до max_retries раз:
+    после Retry-After — не раньше указанного (и с паузой для всех вызовов),
+    иначе с экспоненциальной задержкой со случайным разбросом. Ждать лимита
+    и повторов дольше max_wait секунд вызов не будет — Overloaded / исходная
+    ошибка, а отвечающий код отдаёт текст из базы без модели.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: Optional[str] = None,
+        timeout: float = OPENAI_TIMEOUT,
+        max_concurrency: int = OPENAI_MAX_CONCURRENCY,
+        rate: float = OPENAI_RATE,
+        burst: float = OPENAI_BURST,
+        queue_limit: int = OPENAI_QUEUE_LIMIT,
+        max_retries: int = OPENAI_MAX_RETRIES,
+        max_wait: float = OPENAI_MAX_WAIT,
+    ):
+        openai = sdk.get()
+        import httpx
+
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_wait = max_wait
+        self.limiter = TokenBucket(rate, burst, max_waiters=queue_limit)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_concurrency,
+                max_keepalive_connections=max_concurrency,
+                keepalive_expiry=60.0,
+            ),
+            timeout=httpx.Timeout(timeout, connect=5.0),
+        )
+        # повторы делает _call (общий лимит и пауза по Retry-After), встроенные повторы SDK выключены
+        self.client = openai.AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=self._http, max_retries=0)
+
+    async def _call(self, make: Callable[[], Awaitable[Any]]) -> Any:
+        deadline = time.monotonic() + self.max_wait
+        attempt = 0
+        while True:
+            try:
+                await self.limiter.acquire(max_wait=deadline - time.monotonic())
+            except Overloaded:
+                SHED.inc("llm")
+                raise
+            try:
+                return await make()
+            except Exception as e:
+                delay = retry_delay(e)
+                if delay is None or attempt >= self.max_retries:
+                    raise
+                if delay > 0:
+                    reason = "retry_after"
+                else:
+                    delay = backoff(attempt)
+                    reason = "network" if isinstance(e, sdk.get().APIConnectionError) else "server"
+                # вызов, который всё равно сдаётся, не должен останавливать остальных
+                if time.monotonic() + delay > deadline:
+                    raise
+                if reason == "retry_after":
+                    self.limiter.pause(delay)  # лимит провайдера общий: ждут все вызовы
+                RETRIES.inc("llm", reason)
+                log.info("llm call failed (%s), retry %d in %.1fs", e.__class__.__name__, attempt + 1, delay)
+                attempt += 1
+                if reason != "retry_after":
+                    await asyncio.sleep(delay)  # после pause() задержку выдержит acquire()
+
+    async def complete(self, model: str, messages: List[Dict], temperature: float = 0.2) -> Any:
+        async with self._semaphore:
+            return await self._call(lambda: self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                timeout=self.timeout,
+            ))
+
+    async def stream(self, model: str, messages: List[Dict], temperature: float = 0.2) -> AsyncIterator[Any]:
+        """Куски ответа по мере генерации; слот семафора занят до конца потока. Повторяется только открытие потока."""
+        async with self._semaphore:
+            stream = await self._call(lambda: self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                timeout=self.timeout,
+                stream=True,
+                stream_options={"include_usage": True},
+            ))
+            async for chunk in stream:
+                yield chunk
+
+    async def embed(self, model: str, texts: List[str]) -> Any:
+        """Эмбеддинги (смысловой поиск) — через тот же семафор, лимит и повторы, что и чат."""
+        async with self._semaphore:
+            return await self._call(lambda: self.client.embeddings.create(
+                model=model,
+                input=texts,
+                timeout=self.timeout,
+            ))
+
+    async def aclose(self):
+        await self._http.aclose()
+
+
+_llm: Optional[AsyncLLM] = None
+
+
+def get_llm() -> Optional[AsyncLLM]:
+    """Общий клиент процесса; создаётся при первом обращении (внутри event loop)."""
+    global _llm
+    if _llm is None and OPENAI_API_KEY:
+        try:
+            _llm = AsyncLLM(OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
+        except Exception:
+            _llm = None
+    return _llm
+
+
+async def ready_llm() -> Optional[AsyncLLM]:
+    """get_llm() для запроса, пришедшего до конца прогрева: импорт SDK ждём в потоке, а не в event loop."""
+    if _llm is None and OPENAI_API_KEY and not sdk.ready:
+        try:
+            await sdk.wait()
+        except ImportError:
+            return None
+    return get_llm()
+
+
+async def close_llm():
+    global _llm
+    if _llm is not None:
+        await _llm.aclose()
+        _llm = None
@@ -0,0 +1,55 @@
+# ai_responder/looplag.py
+import asyncio
+from typing import Dict, List
+
+
+class LoopLagMonitor:
+    """
+    Задержка event loop: задача просыпается каждые interval секунд и меряет,
+    насколько позже запланированного её разбудили. Если loop занят
+    синхронной работой (например, поиском по базе), лаг растёт.
+    """
+
+    def __init__(self, interval: float = 0.01, keep: int = 10_000):
+        self.interval = interval
+        self.keep = keep
+        self.samples: List[float] = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - started - self.interval
+            self.samples.append(max(lag, 0.0))
+            if len(self.samples) > self.keep:
+                del self.samples[: len(self.samples) - self.keep]
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def report(self) -> Dict[str, float]:
+        s = sorted(self.samples)
+        if not s:
+            return {"samples": 0}
+
+        def pct(p: float) -> float:
+            return round(s[min(len(s) - 1, int(len(s) * p))] * 1000, 3)
+
+        return {
+            "samples": len(s),
+            "p50_ms": pct(0.50),
+            "p99_ms": pct(0.99),
+            "max_ms": round(s[-1] * 1000, 3),
+        }
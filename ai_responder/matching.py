@@ -0,0 +1,257 @@
+# ai_responder/matching.py
+"""
+Разбор сообщения (поиск по базе, выбор варианта, офтоп) и сервис, который
+выполняет эту CPU-работу вне event loop: в пуле потоков или процессов.
+В каждом процессе-воркере база знаний загружается один раз (инициализатор пула),
+а после перезагрузки — из неизменяемого среза той версии, по которой задан вопрос.
+"""
+import asyncio
+import logging
+import tempfile
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from ai_responder.automaton import START, WORD, PhraseMatcher, contains
+from ai_responder.kb import KnowledgeBase, load_kb, read_artifact, save_kb, snapshot_path
+from ai_responder.ranking import available as ranking_available
+from ai_responder.vectors import SemanticSearch
+
+MODES = ("inline", "thread", "process")
+# сколько последних срезов базы держать на диске для воркеров (вопросы, заданные до перезагрузки, ещё в пути)
+KEEP_SNAPSHOTS = 2
+
+log = logging.getLogger(__name__)
+
+
+_CHOICE_NUMBERS = {
+    "1": 0, "первое": 0, "первый": 0,
+    "2": 1, "второе": 1, "второй": 1,
+    "3": 2, "третье": 2, "третий": 2,
+    "4": 3, "четвёртое": 3, "четвертое": 3, "четвёртый": 3, "четвертый": 3,
+    "5": 4, "пятое": 4, "пятый": 4
+}
+
+
+def parse_choice(text: str, options: List[Dict]) -> Optional[int]:
+    if not text or not options:
+        return None
+    t = text.strip().lower()
+
+    if t in _CHOICE_NUMBERS and _CHOICE_NUMBERS[t] < len(options):
+        return _CHOICE_NUMBERS[t]
+
+    # «можно» и «где» — только с начала слова: не «невозможно», «нигде»
+    if "правил" in t or "услов" in t or "запрещ" in t or ("можно" in t and contains(t, "можно", START)):
+        for i, opt in enumerate(options):
+            if opt.get("type") == "rules":
+                return i
+    if ("раздел" in t or "куда" in t or "найти" in t or "странице" in t or "зайти" in t
+            or ("где" in t and contains(t, "где", START))):
+        for i, opt in enumerate(options):
+            if opt.get("type") == "navigation":
+                return i
+
+    for i, opt in enumerate(options):
+        title = (opt.get("title") or "").lower()
+        for word in title.split():
+            # предлоги и союзы («и», «в») — только отдельным словом, иначе они есть почти в любом ответе
+            if word in t and (len(word) > 2 or contains(t, word, WORD)):
+                return i
+
+    for token in t.replace(")", " ").replace(".", " ").split():
+        if token.isdigit():
+            idx = int(token) - 1
+            if 0 <= idx < len(options):
+                return idx
+
+    return None
+
+
+OFF_TOPIC_KEYWORDS = [
+    "python", "код", "программа", "function", "array", "массив", "счётчик", "счетчик", "counter",
+    "for", "while", "list", "class", "javascript", "java", "c++", "go", "rust", "sql", "база данных"
+]
+# короткие английские слова — только отдельным словом («go» нет в «google» и в «gotovo»),
+# остальные — с начала слова («код» нет в «промокод»)
+_OFF_TOPIC_WHOLE_WORDS = {"for", "while", "list", "class", "java", "c++", "go", "rust", "sql"}
+_off_topic = PhraseMatcher(boundary=START)
+for _kw in OFF_TOPIC_KEYWORDS:
+    _off_topic.add(_kw, _kw, WORD if _kw in _OFF_TOPIC_WHOLE_WORDS else None)
+_off_topic.build()
+
+
+def is_off_topic(question: str) -> bool:
+    return _off_topic.search(question)
+
+
+# --- состояние процесса-воркера (ProcessPoolExecutor) ---
+_worker_kb: Optional[KnowledgeBase] = None
+
+
+def _init_worker(paths: Sequence[str], artifact: Optional[str]):
+    global _worker_kb
+    _worker_kb = load_kb([Path(p) for p in paths], Path(artifact) if artifact else None)
+
+
+def _search_index(index, question: str, rank_params: Optional[Dict[str, Any]]) -> List[Dict]:
+    if rank_params is not None:
+        return index.rank(question, **rank_params)
+    return index.search(question)
+
+
+def _ping() -> bool:
+    return _worker_kb is not None
+
+
+def _search_in_worker(
+    question: str,
+    device: str,
+    version: str,
+    snapshot: str,
+    rank_params: Optional[Dict[str, Any]],
+) -> Optional[List[Dict]]:
+    """None — базы этой версии у воркера нет: ответ по другой версии был бы неверным (и попал бы в кэш поиска)."""
+    global _worker_kb
+    # основной процесс перезагрузил базу — берём срез именно этой версии, а не то, что сейчас в JSON
+    # (там может быть уже следующая правка или невалидный файл); не вышло — остаёмся на прежней базе
+    if _worker_kb is None or _worker_kb.version != version:
+        kb = read_artifact(Path(snapshot), version)
+        if kb is None:
+            return None
+        _worker_kb = kb
+    return _search_index(_worker_kb.index(device), question, rank_params)
+
+
+class MatchingService:
+    """
+    mode:
+      - "inline"  — прямо в event loop (тесты, отладка);
+      - "thread"  — пул потоков, индексы общие с основным процессом;
+      - "process" — пул процессов, каждый воркер сам загружает базу из kb_paths
+                    (desktop, mobile, rules) или kb_artifact — GIL основного процесса не занят;
+                    после перезагрузки базы воркеры берут её срез из файла рядом с kb_artifact
+                    (kb.<версия>.bin), а если не смогли — вопрос ищется в потоке основного процесса.
+    ranking — параметры TfidfRanker.rank (top_k, confidence, ...): вместо обычного
+    поиска возвращаются ранжированные варианты; None — обычный поиск.
+    semantic — смысловой поиск по эмбеддингам, если основной ничего не нашёл; идёт
+    в основном процессе (SemanticSearch.asearch): эмбеддинг вопроса — сетевой вызов.
+    """
+
+    def __init__(
+        self,
+        mode: str = "inline",
+        workers: int = 2,
+        kb_paths: Optional[Sequence[str]] = None,
+        kb_artifact: Optional[str] = None,
+        ranking: Optional[Dict[str, Any]] = None,
+        semantic: Optional[SemanticSearch] = None,
+    ):
+        if mode not in MODES:
+            raise ValueError(f"unknown matching mode: {mode!r}")
+        if mode == "process" and not kb_paths:
+            raise ValueError("process mode needs kb_paths")
+        self.mode = mode
+        self.workers = workers
+        self.kb_paths = [str(p) for p in kb_paths] if kb_paths else None
+        self.kb_artifact = str(kb_artifact) if kb_artifact else None
+        if ranking is not None and not ranking_available():
+            log.warning("RANKING_MODE needs numpy, falling back to keyword search")
+            ranking = None
+        self.ranking = ranking
+        self.semantic = semantic
+        self._executor: Optional[Executor] = None
+        # срезы базы для воркеров: версия -> файл, в порядке публикации
+        self._snapshots: Dict[str, str] = {}
+        self._snapshots_lock = threading.Lock()
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.mode == "process":
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    initializer=_init_worker,
+                    initargs=(self.kb_paths, self.kb_artifact),
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="matching")
+        return self._executor
+
+    def warm_up(self, kb: KnowledgeBase):
+        """
+        Построить то, что иначе строится на первом запросе: ранжировщики, векторный
+        индекс и пул; в режиме process воркеры стартуют по первой задаче и сами
+        загружают базу — это тоже лучше сделать до первого вопроса.
+        """
+        if self.ranking is not None:
+            for index in kb.indexes.values():
+                index.ranker()
+        if self.semantic is not None:
+            self.semantic.warm_up()
+        if self.mode != "inline":
+            executor = self._get_executor()
+            if self.mode == "process":
+                self._publish(kb)
+                for future in [executor.submit(_ping) for _ in range(self.workers)]:
+                    future.result()
+
+    async def _run(self, fn, *args):
+        if self.mode == "inline":
+            return fn(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), partial(fn, *args))
+
+    def search_sync(self, question: str, device: str, kb: KnowledgeBase) -> Optional[List[Dict]]:
+        found = _search_index(kb.index(device), question, self.ranking)
+        # запасной уровень: формулировка, которой нет среди keyword'ов;
+        # None — ничего не нашли, но смысловой уровень был недоступен
+        if not found and self.semantic is not None:
+            found = self.semantic.search(kb.index(device), question)
+        return found
+
+    def _publish(self, kb: KnowledgeBase) -> str:
+        """Файл среза базы этой версии для воркеров; пишется один раз, старые срезы удаляются."""
+        with self._snapshots_lock:
+            path = self._snapshots.get(kb.version)
+            if path is not None:
+                return path
+            base = Path(self.kb_artifact) if self.kb_artifact else Path(tempfile.gettempdir()) / "kb.bin"
+            target = snapshot_path(base, kb.version)
+            # файл версии неизменяем: уже записанный (другим процессом бота) переписывать не нужно
+            if not target.exists():
+                save_kb(kb, target)
+            path = self._snapshots[kb.version] = str(target)
+            while len(self._snapshots) > KEEP_SNAPSHOTS:
+                old = self._snapshots.pop(next(iter(self._snapshots)))
+                Path(old).unlink(missing_ok=True)
+            return path
+
+    async def search(self, question: str, device: str, kb: KnowledgeBase) -> Optional[List[Dict]]:
+        index = kb.index(device)
+        if self.mode == "process":
+            snapshot = self._snapshots.get(kb.version) or await asyncio.to_thread(self._publish, kb)
+            found = await self._run(_search_in_worker, question, device, kb.version, snapshot, self.ranking)
+            if found is None:
+                # срез могли удалить (другой процесс бота с тем же data/) — следующий вопрос запишет его заново
+                with self._snapshots_lock:
+                    self._snapshots.pop(kb.version, None)
+                log.warning("matching worker has no knowledge base %s, searching in a thread", kb.version)
+                found = await asyncio.to_thread(_search_index, index, question, self.ranking)
+        else:
+            found = await self._run(_search_index, index, question, self.ranking)
+        if not found and self.semantic is not None:
+            found = await self.semantic.asearch(index, question)
+        return found
+
+    async def parse_choice(self, text: str, options: List[Dict]) -> Optional[int]:
+        return await self._run(parse_choice, text, options)
+
+    async def is_off_topic(self, question: str) -> bool:
+        return await self._run(is_off_topic, question)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
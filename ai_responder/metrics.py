@@ -0,0 +1,220 @@
+# ai_responder/metrics.py
+"""
+Метрики процесса без внешних зависимостей: счётчики, гистограммы и
+вычисляемые значения в текстовом формате Prometheus.
+
+Запись — пара словарных операций под локом (потоки пула поиска тоже пишут),
+поэтому метрики можно оставлять включёнными всегда. Отдаются они по
+/metrics (см. METRICS_PORT в bot/config.py). В webhook-режиме под gunicorn
+у каждого воркера свои значения — скрейпить нужно каждый процесс.
+"""
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from ai_responder.index import TIER_EXACT, TIER_FUZZY, TIER_OVERLAP, TIER_SUBSTRING
+
+# границы корзин гистограмм, секунды: от микросекунд поиска до десятков секунд LLM
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _num(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for values, v in items:
+            lines.append(f"{self.name}{_labels(self.label_names, values)} {_num(v)}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("hist", "label_values", "started")
+
+    def __init__(self, hist: "Histogram", label_values: Tuple[str, ...]):
+        self.hist = hist
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.started, *self.label_values)
+        return False
+
+
+class Histogram:
+    """Кумулятивные корзины считаются при выдаче, запись — один bisect и два сложения."""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [счётчики по корзинам + корзина +Inf, сумма]
+        self._series: Dict[Tuple[str, ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def time(self, *label_values: str) -> _Timer:
+        """with STAGE_SECONDS.time("search"): ..."""
+        return _Timer(self, label_values)
+
+    def count(self, *label_values: str) -> int:
+        series = self._series.get(label_values)
+        return sum(series[0]) if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1])) for k, v in self._series.items())
+        for values, (counts, total) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = f'le="{_num(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, values)} {_num(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, values)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Значение, вычисляемое в момент выдачи (размер хранилища сессий, попадания кэша и т.п.)."""
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float]):
+        self.name = name
+        self.help = help
+        self.fn = fn
+
+    def render(self) -> List[str]:
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {_num(value)}"]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def _add(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"metric {metric.name!r} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name: str, help: str, fn: Callable[[], float]) -> Gauge:
+        return self._add(Gauge(name, help, fn))
+
+    def collect(self) -> Iterable[object]:
+        return list(self._metrics.values())
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.collect():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# --- метрики конвейера ответа ---
+# stage: device_routing, ask_ai (целиком), parse_choice, off_topic, search, humanize, failure_check, send
+STAGE_SECONDS = REGISTRY.histogram(
+    "bot_stage_seconds", "Time spent in each stage of answering a message", ("stage",))
+# handler: message / callback — от входа в хендлер до отправки ответа
+REQUEST_SECONDS = REGISTRY.histogram(
+    "bot_request_seconds", "End-to-end handler time", ("handler",))
+# лучший уровень совпадения на запрос: exact / substring / overlap / fuzzy / ranked / semantic / none
+MATCH_TIER = REGISTRY.counter(
+    "bot_match_total", "Searches by the best matching tier", ("tier",))
+# откуда взят текст ответа: pregenerated / cache / llm / shared (ждали такой же вызов модели)
+# / raw (модель недоступна или упала)
+HUMANIZE_SOURCE = REGISTRY.counter(
+    "bot_humanize_total", "Humanized answers by source", ("source",))
+LLM_CALLS = REGISTRY.counter(
+    "bot_llm_calls_total", "LLM calls by result", ("result",))
+LLM_SECONDS = REGISTRY.histogram(
+    "bot_llm_seconds", "LLM call duration")
+LLM_FIRST_TOKEN_SECONDS = REGISTRY.histogram(
+    "bot_llm_first_token_seconds", "Time to the first streamed token")
+# type: prompt / completion / cached (часть prompt, взятая провайдером из кэша префикса)
+LLM_TOKENS = REGISTRY.counter(
+    "bot_llm_tokens_total", "Tokens reported by the LLM API", ("type",))
+# исходящие вызовы (target: telegram / llm): повторы после отказа (reason: retry_after / server / network)
+# и отброшенные без вызова, потому что очередь к лимиту переполнена
+RETRIES = REGISTRY.counter(
+    "bot_retries_total", "Outbound calls retried after a refusal", ("target", "reason"))
+SHED = REGISTRY.counter(
+    "bot_shed_total", "Outbound calls dropped by rate limiting", ("target",))
+# offered — показали список вариантов; resolved / unresolved — ответ пользователя распознан или нет
+PENDING_CHOICES = REGISTRY.counter(
+    "bot_pending_choices_total", "Pending-choice round trips", ("result",))
+# reason: keyword («помощь оператора») / failures (серия неудачных ответов)
+LIVE_SUPPORT = REGISTRY.counter(
+    "bot_live_support_total", "Escalations to live support", ("reason",))
+HANDLER_ERRORS = REGISTRY.counter(
+    "bot_handler_errors_total", "Exceptions caught in handlers", ("handler",))
+
+
+def best_tier(matches: List[Dict]) -> str:
+    """Лучший уровень среди результатов поиска (exact выигрывает у всех)."""
+    tiers = {m.get("tier") for m in matches}
+    for tier in (TIER_EXACT, TIER_SUBSTRING, TIER_OVERLAP, TIER_FUZZY):
+        if tier in tiers:
+            return tier
+    if not matches:
+        return "none"
+    return matches[0].get("tier") or "unknown"
@@ -0,0 +1,19 @@
+# ai_responder/paths.py
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# файлы данных
+PATH_NAV_DESKTOP = ROOT / "data" / "navigation.json"
+PATH_NAV_MOBILE = ROOT / "data" / "navigation_mobile.json"
+PATH_RULES = ROOT / "data" / "rules.json"
+PATH_PROMPT = ROOT / "prompts" / "system_prompt.txt"
+PATH_HUMANIZED = ROOT / "data" / "humanized.json"  # собирается python -m ai_responder.pregenerated
+
+# исходники базы знаний в порядке (desktop, mobile, rules) и её скомпилированный артефакт
+KB_SOURCES = (PATH_NAV_DESKTOP, PATH_NAV_MOBILE, PATH_RULES)
+KB_ARTIFACT = ROOT / "data" / "kb.bin"  # собирается python -m ai_responder.kb
+
+# эмбеддинги записей (memmap-матрица) и IVF-индекс к ним; собираются python -m ai_responder.vectors
+VECTORS_PATH = ROOT / "data" / "vectors.npy"
+VECTORS_INDEX = ROOT / "data" / "vectors.idx.npz"
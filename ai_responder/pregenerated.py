@@ -0,0 +1,121 @@
+# ai_responder/pregenerated.py
+"""
+Заранее сгенерированные «человеческие» ответы для статичных записей базы.
+
+Сборка (нужен OPENAI_API_KEY, можно указать OPENAI_BASE_URL на локальный стенд):
+    python -m ai_responder.pregenerated [--concurrency 8] [--force]
+
+Результат — data/humanized.json. Артефакт привязан к версии промпта/модели,
+а каждая запись — к хэшу исходного текста: если правило поменялось или
+промпт обновился, запись считается устаревшей и ответ генерируется вживую.
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from ai_responder.cache import make_key
+
+ARTIFACT_FORMAT = 1
+
+
+def entry_key(short_answer: str) -> str:
+    return make_key(short_answer)
+
+
+def load_pregenerated(path: Path, version: str) -> Dict[str, str]:
+    """entry_key -> готовый текст; пусто, если файла нет или он собран под другой промпт."""
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+    if data.get("format") != ARTIFACT_FORMAT or data.get("version") != version:
+        return {}
+    entries = data.get("entries") or {}
+    return {k: v for k, v in entries.items() if isinstance(v, str) and v}
+
+
+def _collect(rules: List) -> Dict[str, Dict]:
+    """Записи, которые отвечают через LLM: строковые answer/hint (шаги навигации рендерятся без модели)."""
+    items: Dict[str, Dict] = {}
+    for rule in rules:
+        if not isinstance(rule, dict):
+            continue
+        val = rule.get("answer") if rule.get("answer") is not None else rule.get("hint", "")
+        if isinstance(val, str) and val.strip():
+            kws = rule.get("keywords") or []
+            items[entry_key(val)] = {"answer": val, "question": kws[0] if kws else val[:60]}
+    return items
+
+
+async def build(
+    path: Path,
+    items: Dict[str, Dict],
+    version: str,
+    humanize,
+    concurrency: int = 8,
+    force: bool = False,
+) -> Dict[str, int]:
+    """Догенерирует недостающие записи пачками по concurrency штук и атомарно пишет файл."""
+    done = {} if force else load_pregenerated(path, version)
+    todo = [k for k in items if k not in done]
+    entries = {k: done[k] for k in items if k in done}
+    failed = 0
+
+    for start in range(0, len(todo), concurrency):
+        batch = todo[start:start + concurrency]
+        results = await asyncio.gather(
+            *(humanize(items[k]["answer"], items[k]["question"]) for k in batch),
+            return_exceptions=True,
+        )
+        for k, text in zip(batch, results):
+            # модель недоступна / вернула исходник — запись не кладём, останется живая генерация
+            if isinstance(text, str) and text and text != items[k]["answer"]:
+                entries[k] = text
+            else:
+                failed += 1
+
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(
+        json.dumps(
+            {"format": ARTIFACT_FORMAT, "version": version, "entries": entries},
+            ensure_ascii=False,
+            indent=1,
+        ),
+        encoding="utf-8",
+    )
+    os.replace(tmp, path)
+    return {"total": len(items), "reused": len(items) - len(todo), "generated": len(todo) - failed, "failed": failed}
+
+
+async def _main(concurrency: int, force: bool) -> Optional[Dict[str, int]]:
+    from ai_responder import responder
+    from ai_responder.llm import close_llm, get_llm
+
+    if not get_llm():
+        print("OPENAI_API_KEY не задан — генерировать нечем")
+        return None
+    snap = responder.current()
+    try:
+        return await build(
+            responder.PATH_HUMANIZED,
+            _collect(snap.kb.rules),
+            snap.prompt_version,
+            # в артефакт попадают только правила — тот же вариант промпта, что и вживую
+            functools.partial(responder.generate_humanized, kind="rules"),
+            concurrency=concurrency,
+            force=force,
+        )
+    finally:
+        await close_llm()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-generate humanized answers for the knowledge base")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--force", action="store_true", help="regenerate everything, ignoring the existing artifact")
+    args = parser.parse_args()
+    print(asyncio.run(_main(args.concurrency, args.force)))
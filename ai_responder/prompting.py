@@ -0,0 +1,186 @@
+# ai_responder/prompting.py
+"""
+Сборка сообщений для модели с подсчётом токенов и бюджетом.
+
+Системный промпт делится на разделы по заголовкам вида
+
+    =========================
+    НАЗВАНИЕ РАЗДЕЛА
+    =========================
+
+и собирается в несколько фиксированных вариантов (для навигации — целиком,
+для правил — без разделов про навигацию). Вариант строится один раз на
+версию промпта и дальше побайтно одинаков, поэтому провайдер может
+переиспользовать кэш префикса (у OpenAI — от 1024 токенов). Всё, что
+меняется от запроса к запросу, идёт в конце последнего сообщения.
+
+Если вариант больше PROMPT_SYSTEM_BUDGET, разделы отбрасываются с конца
+файла (вступление остаётся всегда): порядок разделов в файле — их приоритет.
+Данные из базы обрезаются так, чтобы весь запрос уложился в PROMPT_MAX_TOKENS.
+
+Токены считает tiktoken; если его нет или словарь кодировки не скачать,
+используется консервативная оценка по длине в байтах.
+"""
+import logging
+import re
+from typing import Dict, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+
+def _tiktoken():
+    """tiktoken импортируется при создании TokenCounter, а не при импорте модуля (холодный старт)."""
+    try:
+        import tiktoken
+    except ImportError:  # pragma: no cover - зависит от окружения
+        return None
+    return tiktoken
+
+
+# накладные токены формата chat на одно сообщение (роль, разделители)
+MESSAGE_OVERHEAD = 4
+
+KIND_NAVIGATION = "navigation"
+KIND_RULES = "rules"
+
+_RULE_RE = re.compile(r"^={3,}\s*$")
+_NAVIGATION_TITLE_RE = re.compile(r"navigation|навигац", re.IGNORECASE)
+# признаки однострочного пути по меню в тексте ответа
+_PATH_RE = re.compile(r"→|->|—>|»|\s>\s")
+
+QUESTION_PREFIX = "Сформулируй коротко и по-человечески ответ на вопрос: "
+DATA_PREFIX = "\n\nИнформация:\n"
+
+
+class TokenCounter:
+    def __init__(self, model: str):
+        self.model = model
+        self._encoding = None
+        tiktoken = _tiktoken()
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self._encoding = self._get("o200k_base")
+            except Exception:
+                self._encoding = None
+            if self._encoding is None:
+                log.warning("tiktoken encoding for %s is unavailable, token counts are estimated", model)
+
+    @staticmethod
+    def _get(name: str):
+        try:
+            return _tiktoken().get_encoding(name)
+        except Exception:  # нет словаря в кэше и нет сети
+            return None
+
+    @property
+    def exact(self) -> bool:
+        return self._encoding is not None
+
+    def count(self, text: str) -> int:
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        # ~4 байта на токен: кириллица (2 байта на букву) получается с запасом
+        return (len(text.encode("utf-8")) + 3) // 4
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+        if self._encoding is not None:
+            return self._encoding.decode(self._encoding.encode(text, disallowed_special=())[:max_tokens])
+        raw = text.encode("utf-8")[: max_tokens * 4]
+        return raw.decode("utf-8", errors="ignore")
+
+
+def split_sections(prompt: str) -> List[Tuple[str, str]]:
+    """[(заголовок, текст раздела с заголовком)]; первый элемент — вступление с пустым заголовком."""
+    lines = prompt.splitlines(keepends=True)
+    starts = [(0, "")]
+    i = 0
+    while i < len(lines) - 2:
+        if _RULE_RE.match(lines[i]) and _RULE_RE.match(lines[i + 2]) and lines[i + 1].strip():
+            starts.append((i, lines[i + 1].strip()))
+            i += 3
+        else:
+            i += 1
+    sections = []
+    for n, (start, title) in enumerate(starts):
+        end = starts[n + 1][0] if n + 1 < len(starts) else len(lines)
+        text = "".join(lines[start:end])
+        if text.strip():
+            sections.append((title, text))
+    return sections
+
+
+def answer_kind(short_answer: str) -> str:
+    return KIND_NAVIGATION if _PATH_RE.search(short_answer or "") else KIND_RULES
+
+
+class PromptBuilder:
+    """Варианты системного промпта считаются один раз; build() — сообщения одного запроса."""
+
+    def __init__(self, system_prompt: str, counter: TokenCounter, max_tokens: int = 0, system_budget: int = 0):
+        self.counter = counter
+        self.max_tokens = max_tokens
+        self.system_budget = system_budget
+        sections = split_sections(system_prompt) or [("", system_prompt)]
+        self.variants: Dict[str, str] = {
+            KIND_NAVIGATION: self._fit(sections),
+            KIND_RULES: self._fit([s for s in sections if not s[0] or not _NAVIGATION_TITLE_RE.search(s[0])]),
+        }
+        self.variant_tokens = {k: counter.count(v) + MESSAGE_OVERHEAD for k, v in self.variants.items()}
+        self._prefix_tokens = counter.count(QUESTION_PREFIX + DATA_PREFIX) + MESSAGE_OVERHEAD
+
+    def _fit(self, sections: List[Tuple[str, str]]) -> str:
+        kept = list(sections)
+        if self.system_budget > 0:
+            while len(kept) > 1 and self.counter.count("".join(t for _, t in kept)) > self.system_budget:
+                dropped = kept.pop()
+                log.debug("system prompt section dropped for budget: %s", dropped[0])
+        return "".join(t for _, t in kept).strip()
+
+    def build(self, short_answer: str, user_question: str, kind: Optional[str] = None) -> Tuple[List[Dict], Dict]:
+        """
+        (messages, usage): usage — оценка токенов запроса до отправки.
+        kind — тип записи; если неизвестен, угадывается по тексту ответа.
+        """
+        if kind not in self.variants:
+            kind = answer_kind(short_answer)
+        system = self.variants[kind]
+        question = self.counter.truncate(user_question, 200)
+        used = self.variant_tokens[kind] + self._prefix_tokens + self.counter.count(question)
+        data = short_answer
+        trimmed = 0
+        if self.max_tokens > 0:
+            data_tokens = self.counter.count(short_answer)
+            room = self.max_tokens - used
+            if data_tokens > room:
+                data = self.counter.truncate(short_answer, room)
+                trimmed = data_tokens - self.counter.count(data)
+        usage = {
+            "kind": kind,
+            "system": self.variant_tokens[kind],
+            "prompt": used + self.counter.count(data),
+            "trimmed": trimmed,
+        }
+        messages = [
+            {"role": "system", "content": system},
+            {"role": "user", "content": f"{QUESTION_PREFIX}{question}{DATA_PREFIX}{data}"},
+        ]
+        return messages, usage
+
+
+def response_usage(resp) -> Optional[Dict[str, int]]:
+    """Фактические токены из ответа API (prompt / completion / cached), если они есть."""
+    usage = getattr(resp, "usage", None)
+    if usage is None:
+        return None
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt": getattr(usage, "prompt_tokens", 0) or 0,
+        "completion": getattr(usage, "completion_tokens", 0) or 0,
+        "cached": (getattr(details, "cached_tokens", 0) or 0) if details is not None else 0,
+    }
@@ -0,0 +1,176 @@
+# ai_responder/ranking.py
+"""
+Ранжирование записей базы по TF-IDF (слова + символьные 3-граммы keyword'ов).
+
+Обычный поиск (KeywordIndex.search) отдаёт все записи, прошедшие хоть
+какой-то уровень совпадения, без порядка — и часто это несколько вариантов
+и лишний вопрос «напишите номер». Ранжировщик оценивает вопрос сразу по всем
+keyword'ам одним разреженным умножением матрицы на вектор и возвращает
+top-k записей с оценкой близости (косинус, 0..1):
+  - если лучшая оценка уверенная и заметно выше второй — одна запись, ответ сразу;
+  - иначе — до k вариантов выше нижнего порога и не сильно хуже лидера.
+
+Нужен numpy (необязательная зависимость): без него RANKING_MODE игнорируется
+и работает обычный поиск.
+"""
+import math
+from typing import Dict, List, Sequence, Tuple
+
+from ai_responder.index import TOKEN_RE, normalize, title_of
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - зависит от окружения
+    np = None
+
+TIER_RANKED = "ranked"
+
+NGRAM = 3
+
+
+def available() -> bool:
+    return np is not None
+
+
+def features(text: str) -> Dict[str, float]:
+    """Признаки строки: слова и символьные 3-граммы с границами; вес — сублинейный tf."""
+    t = normalize(text)
+    counts: Dict[str, int] = {}
+    for tok in TOKEN_RE.findall(t):
+        key = "w:" + tok
+        counts[key] = counts.get(key, 0) + 1
+    padded = f" {t} "
+    for i in range(len(padded) - NGRAM + 1):
+        key = "c:" + padded[i:i + NGRAM]
+        counts[key] = counts.get(key, 0) + 1
+    return {k: 1.0 + math.log(c) for k, c in counts.items()}
+
+
+class TfidfRanker:
+    """
+    Строки матрицы — пары (запись, keyword), столбцы — признаки.
+    Матрица хранится по столбцам (CSC): для вопроса берутся только столбцы
+    его признаков, их вклад складывается в оценки строк одним np.bincount.
+    Оценка записи — максимум по её keyword'ам.
+    """
+
+    def __init__(
+        self,
+        entries: Sequence[Tuple[str, Dict]],
+        entry_keywords: Sequence[Sequence[str]],
+        entry_ids: Sequence[str],
+    ):
+        if np is None:
+            raise RuntimeError("numpy is required for TF-IDF ranking")
+        self.entries = list(entries)
+        self.entry_ids = list(entry_ids)
+        # первый keyword записи — название варианта, если у записи нет title
+        self.first_keyword = [kws[0] if kws else "" for kws in entry_keywords]
+
+        rows: List[Dict[str, float]] = []
+        row_entry: List[int] = []
+        for entry_no, kws in enumerate(entry_keywords):
+            for kw in kws:
+                if kw:
+                    rows.append(features(kw))
+                    row_entry.append(entry_no)
+
+        df: Dict[str, int] = {}
+        for feats in rows:
+            for f in feats:
+                df[f] = df.get(f, 0) + 1
+        n_rows = len(rows)
+        self.vocab: Dict[str, int] = {f: i for i, f in enumerate(sorted(df))}
+        self.idf = np.array(
+            [math.log((1 + n_rows) / (1 + df[f])) + 1.0 for f in sorted(df)], dtype=np.float32
+        )
+
+        # CSC: по каждому признаку — строки и нормированные веса
+        columns: List[List[Tuple[int, float]]] = [[] for _ in self.vocab]
+        for row_no, feats in enumerate(rows):
+            weights = {self.vocab[f]: w * float(self.idf[self.vocab[f]]) for f, w in feats.items()}
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+            for col, w in weights.items():
+                columns[col].append((row_no, w / norm))
+        self.indptr = np.zeros(len(columns) + 1, dtype=np.int64)
+        self.indptr[1:] = np.cumsum([len(c) for c in columns])
+        self.indices = np.fromiter((r for c in columns for r, _ in c), dtype=np.int32, count=int(self.indptr[-1]))
+        self.data = np.fromiter((w for c in columns for _, w in c), dtype=np.float32, count=int(self.indptr[-1]))
+
+        self.n_rows = n_rows
+        self.row_entry = np.asarray(row_entry, dtype=np.int32)
+        # строки идут по записям подряд: начало каждого непустого отрезка для reduceat
+        self.segment_entry = np.unique(self.row_entry)
+        self.segment_start = np.searchsorted(self.row_entry, self.segment_entry).astype(np.int64)
+
+    def scores(self, question: str) -> "np.ndarray":
+        """Косинусная близость вопроса к каждой записи (по лучшему keyword'у)."""
+        out = np.zeros(len(self.entries), dtype=np.float32)
+        q = [(self.vocab[f], w) for f, w in features(question).items() if f in self.vocab]
+        if not q or not self.n_rows:
+            return out
+        cols = np.fromiter((c for c, _ in q), dtype=np.int64, count=len(q))
+        qw = np.fromiter((w for _, w in q), dtype=np.float32, count=len(q)) * self.idf[cols]
+        qw /= np.linalg.norm(qw) or 1.0
+
+        starts, ends = self.indptr[cols], self.indptr[cols + 1]
+        lengths = ends - starts
+        if not lengths.sum():
+            return out
+        # позиции всех ненулевых элементов выбранных столбцов одним массивом
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        row_scores = np.bincount(
+            self.indices[offsets],
+            weights=self.data[offsets] * np.repeat(qw, lengths),
+            minlength=self.n_rows,
+        )
+        out[self.segment_entry] = np.maximum.reduceat(row_scores, self.segment_start)
+        return out
+
+    def rank(
+        self,
+        question: str,
+        top_k: int = 5,
+        confidence: float = 0.6,
+        margin: float = 0.1,
+        min_score: float = 0.45,
+        spread: float = 0.8,
+    ) -> List[Dict]:
+        """
+        Те же dict'ы, что у KeywordIndex.search, плюс "score".
+        Уверенный лидер (score >= confidence и отрыв от второго >= margin) — один результат;
+        иначе варианты не ниже min_score и не ниже spread * оценки лидера.
+        """
+        scores = self.scores(question)
+        k = min(top_k, len(scores))
+        if not k:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+
+        results: List[Dict] = []
+        seen = set()
+        for entry_no in top.tolist():
+            score = float(scores[entry_no])
+            if score < min_score or (results and score < results[0]["score"] * spread):
+                break
+            item_type, item = self.entries[entry_no]
+            val = item.get("answer") if item.get("answer") is not None else item.get("hint", "")
+            key = (item_type, str(val))
+            if key in seen:
+                continue
+            seen.add(key)
+            results.append({
+                "id": self.entry_ids[entry_no],
+                "type": item_type,
+                "title": title_of(item, self.first_keyword[entry_no]),
+                "value": val,
+                "tier": TIER_RANKED,
+                "score": round(score, 4),
+            })
+
+        if results and results[0]["score"] >= confidence:
+            second = results[1]["score"] if len(results) > 1 else 0.0
+            if results[0]["score"] - second >= margin:
+                return results[:1]
+        return results
@@ -0,0 +1,184 @@
+# ai_responder/ratelimit.py
+"""
+Ограничение частоты исходящих вызовов (Bot API, модель) и повторы после отказа.
+
+TokenBucket — ведро токенов в форме GCRA: одна временная шкала резервирований.
+Каждый вызов сразу получает свой момент отправки (не раньше предыдущего
++ 1/rate, с запасом на burst) и спит до него. Порядок — FIFO, блокировок нет.
+Очередь ограничена двумя способами: числом ждущих (max_waiters) и временем
+ожидания (max_wait) — если ждать дольше, вызов сразу получает Overloaded,
+а не копится в памяти.
+
+pause(seconds) — ответ сервера «повторите через N секунд» (retry_after у
+Telegram, Retry-After у OpenAI): шкала сдвигается так, что первый ждущий
+уходит по окончании паузы, а остальные — с прежним интервалом за ним, а не
+все разом (такой залп сразу после отказа и вызвал бы следующий).
+"""
+import asyncio
+import email.utils
+import random
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Mapping, Optional
+
+
+class Overloaded(Exception):
+    """Лимит исчерпан и очередь к нему переполнена: вызов не выполнялся."""
+
+
+def backoff(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    """Экспоненциальная задержка с полным джиттером: случайно в [0, min(cap, base * 2^attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def parse_retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """Секунды из retry-after-ms / Retry-After (число или HTTP-дата); None, если заголовка нет."""
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """rate — токенов в секунду (0 — без ограничения, но pause() соблюдается), burst — ёмкость ведра."""
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float = 1.0,
+        max_waiters: int = 0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_waiters = max_waiters
+        self.clock = clock
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        # допуск на всплеск: на сколько раньше своей «теоретической» очереди может уйти вызов
+        self.tolerance = (self.burst - 1.0) * self.interval
+        now = clock()
+        self.tat = now          # теоретическое время прихода следующего вызова (GCRA)
+        self.resume_at = now    # до этого момента не выдаётся ничего (pause)
+        self.shift = 0.0        # на сколько pause() сдвинула уже выданные резервирования
+        self._ticket = 0        # номер последнего резервирования
+        self.waiting = 0
+        self.shed = 0
+
+    def _next_slot(self, now: float) -> float:
+        """Момент, когда уйдёт вызов, если зарезервировать его сейчас."""
+        slot = self.resume_at
+        if self.rate > 0:
+            slot = max(slot, max(self.tat, now) - self.tolerance)
+        return max(slot, now)
+
+    def delay(self) -> float:
+        """Сколько придётся ждать, если встать в очередь сейчас (без ограничения — только пауза)."""
+        now = self.clock()
+        return self._next_slot(now) - now
+
+    def idle(self) -> bool:
+        """Ведро полное, паузы нет и никто не ждёт — его можно выбросить без потери состояния."""
+        now = self.clock()
+        return not self.waiting and self.resume_at <= now and self.tat <= now
+
+    async def acquire(self, max_wait: Optional[float] = None):
+        now = self.clock()
+        slot = self._next_slot(now)
+        wait = slot - now
+        if (self.max_waiters and wait > 0 and self.waiting >= self.max_waiters) or (
+            max_wait is not None and wait > max_wait
+        ):
+            self.shed += 1
+            raise Overloaded(f"rate limit queue is full (wait {wait:.1f}s, {self.waiting} waiting)")
+        if self.rate > 0:
+            self.tat = max(self.tat, slot) + self.interval
+        self._ticket += 1
+        if wait <= 0:
+            return
+        ticket, shift = self._ticket, self.shift
+        self.waiting += 1
+        try:
+            # pause() может сдвинуть шкалу, пока ждём, — момент пересчитывается после каждого сна
+            while True:
+                at = max(slot + self.shift - shift, self.resume_at)
+                now = self.clock()
+                if at <= now:
+                    break
+                await asyncio.sleep(at - now)
+        except asyncio.CancelledError:
+            # последнее резервирование так и не использовано — вернуть его очереди;
+            # из середины очереди не возвращаем: остальные сохраняют интервал
+            if self.rate > 0 and ticket == self._ticket:
+                self.tat -= self.interval
+                self._ticket -= 1
+            raise
+        finally:
+            self.waiting -= 1
+
+    def pause(self, seconds: float):
+        """
+        Ничего не выдавать seconds секунд. Уже ждущие сдвигаются вместе со шкалой
+        (первый — на конец паузы, остальные — с прежним интервалом), после паузы —
+        без накопленного запаса.
+        """
+        if seconds <= 0:
+            return
+        now = self.clock()
+        resume = now + seconds
+        if self.rate > 0:
+            # резервирования идут с шагом interval; последнее — tat - tolerance - interval
+            last = self.tat - self.tolerance - self.interval
+            if last > now:
+                queued = int((last - now) / self.interval)
+                first = last - queued * self.interval
+                if first <= now:
+                    first += self.interval
+                delta = resume - first
+                if delta > 0:
+                    self.shift += delta
+                    self.tat += delta
+            self.tat = max(self.tat, resume + self.tolerance)
+        self.resume_at = max(self.resume_at, resume)
+
+
+class KeyedBuckets:
+    """Отдельное ведро на ключ (например, на чат); полные простаивающие вёдра выбрасываются."""
+
+    def __init__(self, factory: Callable[[Hashable], TokenBucket], max_keys: int = 10000):
+        self.factory = factory
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[Hashable, TokenBucket]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def get(self, key: Hashable) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._prune()
+            bucket = self._buckets[key] = self.factory(key)
+        self._buckets.move_to_end(key)
+        return bucket
+
+    def _prune(self):
+        for key in [k for k, b in self._buckets.items() if b.idle()]:
+            del self._buckets[key]
+        # все заняты — выбрасываем самые давние: лимит станет мягче, но память ограничена
+        while len(self._buckets) >= self.max_keys:
+            self._buckets.popitem(last=False)
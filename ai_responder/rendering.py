@@ -0,0 +1,118 @@
+# ai_responder/rendering.py
+"""
+Тексты ответов в том виде, в котором они уходят в Telegram.
+
+Записи базы (шаги навигации, строковые answer/hint) и готовые ответы из
+офлайн-сборки между перезагрузками не меняются, поэтому их текст собирается,
+экранируется под parse_mode="HTML" и режется на сообщения один раз — при
+построении среза (Snapshot). В ask_ai ответ из базы — поиск в словаре.
+
+Rendered — обычная строка (готовый HTML), у которой дополнительно есть
+parts: тот же текст, нарезанный по лимиту длины сообщения.
+"""
+import html
+from typing import Dict, Optional, Tuple
+
+from ai_responder.kb import KnowledgeBase
+from ai_responder.pregenerated import entry_key
+
+# лимит длины текста сообщения в Telegram (считается после разбора HTML-сущностей)
+MESSAGE_LIMIT = 4096
+
+
+class Rendered(str):
+    """Экранированный текст ответа и его части по MESSAGE_LIMIT; неизменяем, как и str."""
+
+    def __new__(cls, text: str, parts: Tuple[str, ...]):
+        self = super().__new__(cls, text)
+        object.__setattr__(self, "parts", parts)
+        return self
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Rendered is immutable")
+
+    def __reduce__(self):
+        return Rendered, (str(self), self.parts)
+
+
+def split_message(text: str, limit: int = MESSAGE_LIMIT) -> Tuple[str, ...]:
+    """Части не длиннее limit: режем по абзацу, затем по строке, по пробелу и только потом по символу."""
+    parts = []
+    while len(text) > limit:
+        cut, skip = limit, 0
+        for sep in ("\n\n", "\n", " "):
+            pos = text.rfind(sep, limit // 2, limit)
+            if pos != -1:
+                cut, skip = pos, len(sep)
+                break
+        parts.append(text[:cut])
+        text = text[cut + skip:]
+    if text or not parts:
+        parts.append(text)
+    return tuple(parts)
+
+
+def render(text: str) -> Rendered:
+    """
+    Экранирование и нарезка. Режется исходный текст, а не экранированный: лимит
+    Telegram считает «&lt;» одним символом, и сущность не разрезается пополам.
+    """
+    parts = tuple(html.escape(p, quote=False) for p in split_message(text))
+    return Rendered(html.escape(text, quote=False), parts)
+
+
+def message_parts(answer: str) -> Tuple[str, ...]:
+    """Сообщения для отправки: у готовых ответов — заранее нарезанные, остальное режется сейчас."""
+    if isinstance(answer, Rendered):
+        return answer.parts
+    return split_message(answer)
+
+
+def steps_text(value: Dict) -> str:
+    lines = [f"Чтобы {value.get('title')}, выполните следующие шаги:"]
+    for i, step in enumerate(value.get("steps") or [], start=1):
+        lines.append(f"{i}. {step}.")
+    return "\n".join(lines)
+
+
+def _answer_of(item: Dict):
+    return item.get("answer") if item.get("answer") is not None else item.get("hint", "")
+
+
+class RenderedAnswers:
+    """
+    Готовые тексты одного среза:
+      - шаги навигации — по id записи (он есть в каждом результате поиска);
+      - строковые ответы без LLM и готовые ответы офлайн-сборки — по entry_key исходного текста.
+    Если записи нет (результат из другой версии базы), текст собирается на месте тем же кодом.
+    """
+
+    def __init__(self, kb: KnowledgeBase, pregenerated: Dict[str, str]):
+        self._steps: Dict[str, Rendered] = {}
+        self._raw: Dict[str, Rendered] = {}
+        for index in kb.indexes.values():
+            for eid, (_, item) in zip(index.entry_ids, index.entries):
+                val = _answer_of(item)
+                # правила входят в индексы обоих устройств — каждую запись рендерим один раз
+                if isinstance(val, dict) and "steps" in val:
+                    if eid not in self._steps:
+                        self._steps[eid] = render(steps_text(val))
+                elif isinstance(val, str) and val.strip():
+                    key = entry_key(val)
+                    if key not in self._raw:
+                        self._raw[key] = render(val)
+        self._pregenerated: Dict[str, Rendered] = {k: render(v) for k, v in pregenerated.items()}
+
+    def __len__(self) -> int:
+        return len(self._steps) + len(self._raw) + len(self._pregenerated)
+
+    def steps(self, match: Dict) -> Rendered:
+        ready = self._steps.get(match.get("id"))
+        return ready if ready is not None else render(steps_text(match.get("value") or {}))
+
+    def pregenerated(self, key: str) -> Optional[Rendered]:
+        return self._pregenerated.get(key)
+
+    def raw(self, key: str, short_answer: str) -> Rendered:
+        ready = self._raw.get(key)
+        return ready if ready is not None else render(short_answer)
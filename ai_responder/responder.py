@@ -1,142 +1,137 @@
 # ai_responder/responder.py
-import json
-import re
-import difflib
-from pathlib import Path
-from typing import List, Dict, Optional, Any
-from openai import OpenAI
-from bot.config import OPENAI_API_KEY, OPENAI_MODEL
-
-ROOT = Path(__file__).resolve().parents[1]
-
-# файлы данных
-PATH_NAV_DESKTOP = ROOT / "data" / "navigation.json"
-PATH_NAV_MOBILE = ROOT / "data" / "navigation_mobile.json"
-PATH_RULES = ROOT / "data" / "rules.json"
-PATH_PROMPT = ROOT / "prompts" / "system_prompt.txt"
-
-# загрузка json
-def load_json(p: Path):
+import logging
+import time
+from functools import lru_cache
+from typing import List, Dict, Optional, Any, Tuple
+from bot.config import (
+    OPENAI_API_KEY, OPENAI_MODEL, OPENAI_BASE_URL,
+    ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_PATH, SEARCH_CACHE_SIZE,
+    SESSION_MAX_USERS, SESSION_TTL, SESSION_HISTORY_LIMIT,
+    SESSION_BACKEND, SESSION_DB_PATH, SESSION_SYNC_INTERVAL,
+    MATCHING_MODE, MATCHING_WORKERS,
+    RANKING_MODE, RANKING_TOP_K, RANKING_CONFIDENCE, RANKING_MARGIN, RANKING_MIN_SCORE,
+    EMBEDDING_MODE, EMBEDDING_MODEL, EMBEDDING_DIM, EMBEDDING_TOP_K, EMBEDDING_MIN_SCORE, EMBEDDING_NPROBE,
+    PROMPT_MAX_TOKENS, PROMPT_SYSTEM_BUDGET,
+)
+from ai_responder.automaton import WORD, contains
+from ai_responder.cache import AnswerCache, SearchCache, make_key
+from ai_responder.index import normalize
+from ai_responder.kb import KnowledgeBase, compile_kb, load_kb
+from ai_responder.llm import delta_content, extract_content, get_llm, ready_llm, sdk
+from ai_responder.metrics import (
+    HUMANIZE_SOURCE, LLM_CALLS, LLM_FIRST_TOKEN_SECONDS, LLM_SECONDS, LLM_TOKENS, MATCH_TIER, PENDING_CHOICES, STAGE_SECONDS, best_tier,
+)
+from ai_responder.matching import (  # noqa: F401  (parse_choice / is_off_topic — публичный API модуля)
+    MatchingService, OFF_TOPIC_KEYWORDS, is_off_topic, parse_choice,
+)
+from ai_responder.paths import (  # noqa: F401
+    ROOT, PATH_NAV_DESKTOP, PATH_NAV_MOBILE, PATH_RULES, PATH_PROMPT, PATH_HUMANIZED,
+    KB_SOURCES, KB_ARTIFACT, VECTORS_PATH, VECTORS_INDEX,
+)
+from ai_responder.pregenerated import entry_key, load_pregenerated
+from ai_responder.prompting import PromptBuilder, TokenCounter, response_usage
+from ai_responder.rendering import render
+from ai_responder.session_backends import make_backend
+from ai_responder.sessions import SessionStore
+from ai_responder.singleflight import SingleFlight
+from ai_responder.snapshot import Snapshot, SnapshotHolder
+from ai_responder.vectors import SemanticSearch
+from ai_responder.warmup import Lazy, warm_up as run_warm_up
+
+log = logging.getLogger(__name__)
+
+def _read_prompt() -> str:
     try:
-        return json.loads(p.read_text(encoding="utf-8"))
+        return PATH_PROMPT.read_text(encoding="utf-8")
     except Exception:
-        return []
+        return "Ты — оператор поддержки. Отвечай строго по базе."
 
-navigation_desktop = load_json(PATH_NAV_DESKTOP)
-navigation_mobile = load_json(PATH_NAV_MOBILE)
-rules = load_json(PATH_RULES)
 
-try:
-    SYSTEM_PROMPT = PATH_PROMPT.read_text(encoding="utf-8")
-except Exception:
-    SYSTEM_PROMPT = "Ты — оператор поддержки. Отвечай строго по базе."
+def _snapshot_for(kb: KnowledgeBase) -> Snapshot:
+    system_prompt = _read_prompt()
+    # версия промпта: при смене модели, system_prompt.txt или бюджета токенов старые ответы из кэша не используются
+    prompt_version = make_key(OPENAI_MODEL, system_prompt, f"{PROMPT_MAX_TOKENS}:{PROMPT_SYSTEM_BUDGET}")[:12]
+    # готовые ответы из офлайн-сборки (пусто, если артефакта нет или он устарел)
+    return Snapshot(kb, system_prompt, prompt_version, load_pregenerated(PATH_HUMANIZED, prompt_version))
 
-# OpenAI клиент (опционально, если нужен)
-try:
-    openai_client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
-except Exception:
-    openai_client = None
 
+def build_snapshot() -> Snapshot:
+    # база знаний: предкомпилированный артефакт, если он свежий, иначе разбор JSON
+    return _snapshot_for(load_kb(KB_SOURCES, KB_ARTIFACT))
 
-# Сессии: история + выбор устройства + ожидаемые варианты
-class SessionStore:
-    def __init__(self):
-        self.history: Dict[int, List[Dict]] = {}
-        self.device: Dict[int, str] = {}           # "mobile" / "desktop"
-        self.pending: Dict[int, List[Dict]] = {}   # user_id -> list of options
-        self.first_seen: set = set()               # чтобы поприветствовать один раз
 
-    # history helpers (new API)
-    def add_history(self, user_id: int, role: str, content: str):
-        self.history.setdefault(user_id, []).append({"role": role, "content": content})
+def rebuild_snapshot() -> Snapshot:
+    """Для горячей перезагрузки: невалидный JSON -> исключение, старый срез остаётся."""
+    return _snapshot_for(compile_kb(KB_SOURCES, KB_ARTIFACT))
 
-    def get_history(self, user_id: int):
-        return self.history.get(user_id, [])
 
-    # Backwards-compatible methods used by handlers (sessions.add / get / clear)
-    def add(self, user_id: int, role: str, content: str):
-        """Compatibility: sessions.add(user_id, role, content)"""
-        return self.add_history(user_id, role, content)
+# первый срез собирается в фоновом прогреве (warm_up) или первым запросом, которому нужна база
+snapshots = SnapshotHolder(build=build_snapshot)
 
-    def get(self, user_id: int):
-        """Compatibility: sessions.get(user_id) -> history list"""
-        return self.get_history(user_id)
 
-    def clear(self, user_id: int):
-        """Compatibility: clear all user data (history, pending, device, seen)"""
-        self.history.pop(user_id, None)
-        self.pending.pop(user_id, None)
-        self.device.pop(user_id, None)
-        self.first_seen.discard(user_id)
+def current() -> Snapshot:
+    return snapshots.get()
 
-    # device
-    def set_device(self, user_id: int, device: str):
-        if device in ("mobile", "desktop"):
-            self.device[user_id] = device
 
-    def get_device(self, user_id: int) -> Optional[str]:
-        return self.device.get(user_id)
+answer_cache = AnswerCache(
+    max_size=ANSWER_CACHE_SIZE,
+    ttl=ANSWER_CACHE_TTL,
+    path=ANSWER_CACHE_PATH or None,
+)
+# вызовы модели, которые сейчас выполняются, по ключу кэша ответов
+inflight = SingleFlight()
+# результаты поиска по базе: один и тот же вопрос от разных пользователей ищется один раз
+search_cache = SearchCache(max_size=SEARCH_CACHE_SIZE)
 
-    def has_device(self, user_id: int) -> bool:
-        return user_id in self.device
 
-    # pending
-    def set_pending(self, user_id: int, options: List[Dict]):
-        self.pending[user_id] = options
-
-    def get_pending(self, user_id: int) -> Optional[List[Dict]]:
-        return self.pending.get(user_id)
-
-    def clear_pending(self, user_id: int):
-        self.pending.pop(user_id, None)
-
-    # greeting flag
-    def mark_seen(self, user_id: int):
-        self.first_seen.add(user_id)
-
-    def was_seen(self, user_id: int) -> bool:
-        return user_id in self.first_seen
-
-
-sessions = SessionStore()
-
-# Global map for handlers that import user_device
-user_device: Dict[int, str] = {}
-
-def _sync_user_device_from_sessions():
-    for uid, dev in sessions.device.items():
-        user_device[uid] = dev
-
-_sync_user_device_from_sessions()
-
-
-def _title_of(item: Dict, default: str) -> str:
-    t = item.get("title") or item.get("name")
-    if not t:
-        kws = item.get("keywords") or []
-        if kws:
-            t = kws[0]
-    if not t:
-        txt = item.get("hint") or item.get("answer") or ""
-        t = (txt[:60] + "...") if txt else default
-    return t
-
-
-# вспомогательные метрики
-def _token_overlap_score(a: str, b: str) -> float:
-    a_tokens = set(re.findall(r'\w+', (a or "").lower()))
-    b_tokens = set(re.findall(r'\w+', (b or "").lower()))
-    if not a_tokens or not b_tokens:
-        return 0.0
-    inter = a_tokens.intersection(b_tokens)
-    return len(inter) / max(len(a_tokens), len(b_tokens))
-
-
-def _fuzzy_ratio(a: str, b: str) -> float:
+def _sync_client():
+    """Синхронный OpenAI клиент (опционально, если нужен) — только для humanize_answer."""
+    if not OPENAI_API_KEY:
+        return None
     try:
-        return difflib.SequenceMatcher(None, a, b).ratio()
+        return sdk.get().OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
     except Exception:
-        return 0.0
+        return None
+
+
+openai_client = Lazy(_sync_client, "openai sync client")
+
+# все сессии пользователей (ограничены по числу, времени простоя и длине истории)
+sessions = SessionStore(
+    max_users=SESSION_MAX_USERS,
+    ttl=SESSION_TTL,
+    history_limit=SESSION_HISTORY_LIMIT,
+    backend=make_backend(SESSION_BACKEND, SESSION_DB_PATH),
+    sync_interval=SESSION_SYNC_INTERVAL,
+)
+
+# CPU-работа разбора сообщения выполняется вне event loop (см. MATCHING_MODE)
+matcher = MatchingService(
+    mode=MATCHING_MODE,
+    workers=MATCHING_WORKERS,
+    kb_paths=KB_SOURCES,
+    kb_artifact=KB_ARTIFACT,
+    ranking=dict(
+        top_k=RANKING_TOP_K,
+        confidence=RANKING_CONFIDENCE,
+        margin=RANKING_MARGIN,
+        min_score=RANKING_MIN_SCORE,
+    ) if RANKING_MODE == "tfidf" else None,
+    semantic=SemanticSearch(
+        VECTORS_PATH,
+        VECTORS_INDEX,
+        embedder=dict(
+            kind=EMBEDDING_MODE,
+            model=EMBEDDING_MODEL,
+            dim=EMBEDDING_DIM,
+            api_key=OPENAI_API_KEY,
+            base_url=OPENAI_BASE_URL,
+        ),
+        top_k=EMBEDDING_TOP_K,
+        min_score=EMBEDDING_MIN_SCORE,
+        nprobe=EMBEDDING_NPROBE,
+    ) if EMBEDDING_MODE else None,
+)
 
 
 # Основная функция поиска совпадений — минимальные правки от исходной логики
@@ -148,171 +143,223 @@ def search_matches(question: str, device: str) -> List[Dict]:
       - затем — token-overlap / fuzzy (поймает опечатки и близкие формулировки)
       - навигация и правила просматриваются одинаково; value = answer (приоритет) или hint
     """
-    q_raw = (question or "").strip()
-    # нормализуем: пробелы, регистр
-    q = re.sub(r'\s+', ' ', q_raw.lower())
-
-    matches: List[Dict] = []
-    exact_matches: List[Dict] = []
-
-    nav = navigation_mobile if device == "mobile" else navigation_desktop
-
-    def check_item(item: Dict, item_type: str):
-        # value берём из answer (приоритет) -> hint fallback
-        val = item.get("answer") if item.get("answer") is not None else item.get("hint", "")
-        for kw in item.get("keywords", []) or []:
-            kw_l = re.sub(r'\s+', ' ', (kw or "").lower().strip())
-
-            # 1) Точное совпадение — ВЫСШИЙ ПРИОРИТЕТ
-            if q == kw_l and kw_l:
-                exact_matches.append({
-                    "type": item_type,
-                    "title": _title_of(item, kw_l),
-                    "value": val
-                })
-                return
-
-            # 2) Простое вхождение ключевого слова
-            if kw_l and kw_l in q:
-                matches.append({
-                    "type": item_type,
-                    "title": _title_of(item, kw_l),
-                    "value": val
-                })
-                return
-
-            # 3) Token overlap
-            try:
-                if _token_overlap_score(q, kw_l) >= 0.4:
-                    matches.append({
-                        "type": item_type,
-                        "title": _title_of(item, kw_l),
-                        "value": val
-                    })
-                    return
-            except Exception:
-                pass
-
-            # 4) Fuzzy match (опечатки / близкие формы)
-            try:
-                ratio = _fuzzy_ratio(q, kw_l)
-                if ratio >= 0.72:
-                    matches.append({
-                        "type": item_type,
-                        "title": _title_of(item, kw_l),
-                        "value": val
-                    })
-                    return
-            except Exception:
-                pass
-
-    # 🔹 Навигация
-    for item in nav:
-        # защита: ожидаем, что nav элемент — dict
-        if isinstance(item, dict):
-            check_item(item, "navigation")
-
-    # 🔹 Правила
-    for rule in rules:
-        if isinstance(rule, dict):
-            check_item(rule, "rules")
-
-    # 🔥 ЕСЛИ ЕСТЬ ТОЧНОЕ СОВПАДЕНИЕ — ВОЗВРАЩАЕМ ТОЛЬКО ЕГО
-    if exact_matches:
-        return exact_matches
-
-    # 🧹 Удаляем дубликаты (одинаковый смысл)
-    unique = []
-    seen = set()
-    for m in matches:
-        key = (m["type"], str(m["value"]))
-        if key not in seen:
-            seen.add(key)
-            unique.append(m)
-
-    return unique
-
-
-def parse_choice(text: str, options: List[Dict]) -> Optional[int]:
-    if not text or not options:
-        return None
-    t = text.strip().lower()
-
-    map_num = {
-        "1": 0, "первое": 0, "первый": 0,
-        "2": 1, "второе": 1, "второй": 1,
-        "3": 2, "третье": 2, "третий": 2,
-        "4": 3, "четвёртое": 3, "четвертое": 3, "четвёртый": 3, "четвертый": 3,
-        "5": 4, "пятое": 4, "пятый": 4
-    }
-    if t in map_num and map_num[t] < len(options):
-        return map_num[t]
-
-    if "правил" in t or "правила" in t or "услов" in t or "можно" in t or "запрещ" in t:
-        for i, opt in enumerate(options):
-            if opt.get("type") == "rules":
-                return i
-    if "раздел" in t or "где" in t or "куда" in t or "найти" in t or "странице" in t or "зайти" in t:
-        for i, opt in enumerate(options):
-            if opt.get("type") == "navigation":
-                return i
-
-    for i, opt in enumerate(options):
-        title = (opt.get("title") or "").lower()
-        if title:
-            for word in title.split():
-                if word and word in t:
-                    return i
-
-    for token in t.replace(")", " ").replace(".", " ").split():
-        if token.isdigit():
-            idx = int(token) - 1
-            if 0 <= idx < len(options):
-                return idx
-
+    kb = current().kb
+    key = _search_key(question, device, kb)
+    found = search_cache.get(key)
+    if found is None:
+        found = matcher.search_sync(key[0], device, kb)
+        if found is None:
+            return []  # смысловой уровень недоступен — «не найдено» не кэшируем
+        found = search_cache.set(key, found)
+    return list(found)
+
+
+def _search_key(question: str, device: str, kb: KnowledgeBase) -> Tuple[str, str, str]:
+    # поиск зависит только от нормализованного вопроса (его нормализуют все уровни:
+    # keyword'ы, ранжировщик, эмбеддинги), устройства и версии базы
+    return normalize(question), device, kb.version
+
+
+async def _search_cached(question: str, device: str, kb: KnowledgeBase) -> Tuple[Dict, ...]:
+    """matcher.search через кэш; результат неизменяем — его можно отдавать в set_pending как есть."""
+    key = _search_key(question, device, kb)
+    found = search_cache.get(key)
+    if found is None:
+        found = await matcher.search(key[0], device, kb)
+        if found is None:
+            return ()  # смысловой уровень недоступен — «не найдено» не кэшируем
+        found = search_cache.set(key, found)
+    return found
+
+
+# словарь tiktoken может скачиваться по сети — тоже не при импорте
+token_counter = Lazy(lambda: TokenCounter(OPENAI_MODEL), "tokenizer")
+
+# устройство из свободного ответа на вопрос «с какого устройства?»; если названы оба — смартфон
+def device_from_text(text: str) -> Optional[str]:
+    t = text.lower()
+    if "смартфон" in t or "телефон" in t or "mobile" in t or "мобил" in t:
+        return "mobile"
+    # «пк» — только отдельным словом: не «ПКМ»
+    if "компьютер" in t or "desktop" in t or "ноут" in t or ("пк" in t and contains(t, "пк", WORD)):
+        return "desktop"
     return None
 
 
-OFF_TOPIC_KEYWORDS = [
-    "python", "код", "программа", "function", "array", "массив", "счётчик", "счетчик", "counter",
-    "for", "while", "list", "class", "javascript", "java", "c++", "go", "rust", "sql", "база данных"
-]
+@lru_cache(maxsize=4)
+def prompt_builder(system_prompt: str) -> PromptBuilder:
+    """Варианты системного промпта и их размер в токенах — один раз на версию промпта."""
+    return PromptBuilder(system_prompt, token_counter.get(), PROMPT_MAX_TOKENS, PROMPT_SYSTEM_BUDGET)
 
-def is_off_topic(question: str) -> bool:
-    q = (question or "").lower()
-    for kw in OFF_TOPIC_KEYWORDS:
-        if kw in q:
-            return True
-    return False
+
+async def warm_up() -> Dict[str, float]:
+    """
+    Фоновый прогрев после старта (main.on_startup), в порядке важности для
+    первых запросов: срез базы, поиск (ранжировщик, векторы, воркеры пула),
+    SDK модели, токенизатор и варианты системного промпта.
+    """
+    return await run_warm_up((
+        ("snapshot", snapshots.get),
+        ("matching", lambda: matcher.warm_up(current().kb)),
+        ("openai", lambda: sdk.get() if OPENAI_API_KEY else None),
+        ("prompt", lambda: prompt_builder(current().system_prompt)),
+    ))
+
+
+def _humanize_messages(
+    short_answer: str, user_question: str, system_prompt: str, kind: Optional[str] = None,
+) -> Tuple[List[Dict], Dict[str, int]]:
+    return prompt_builder(system_prompt).build(short_answer, user_question, kind)
+
+
+def _log_usage(planned: Dict[str, int], resp: Any):
+    actual = response_usage(resp)
+    if actual:
+        for name in ("prompt", "completion", "cached"):
+            LLM_TOKENS.inc(name, amount=actual[name])
+    log.info(
+        "llm tokens: kind=%s system=%d prompt~%d trimmed=%d actual=%s",
+        planned["kind"], planned["system"], planned["prompt"], planned["trimmed"], actual,
+    )
 
 
 def humanize_answer(short_answer: str, user_question: str) -> str:
-    if not openai_client:
+    """Синхронный вариант — блокирует поток; из async-кода используйте humanize_answer_async."""
+    client = openai_client.get()
+    if not client:
         return short_answer
     try:
-        resp = openai_client.chat.completions.create(
+        messages, planned = _humanize_messages(short_answer, user_question, current().system_prompt)
+        resp = client.chat.completions.create(
             model=OPENAI_MODEL,
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": f"Сформулируй коротко и по-человечески ответ на вопрос: {user_question}\n\nИнформация:\n{short_answer}"}
-            ],
+            messages=messages,
             temperature=0.2,
         )
-        if resp and getattr(resp, "choices", None):
-            choice0 = resp.choices[0]
-            if hasattr(choice0, "message") and isinstance(choice0.message, dict):
-                return choice0.message.get("content") or short_answer
-            if hasattr(choice0, "message") and hasattr(choice0.message, "get"):
-                return choice0.message.get("content") or short_answer
-            if hasattr(choice0, "text"):
-                return choice0.text or short_answer
+        _log_usage(planned, resp)
+        return extract_content(resp, short_answer)
+    except Exception:
         return short_answer
+
+
+async def generate_humanized(
+    short_answer: str, user_question: str, snap: Optional[Snapshot] = None, kind: Optional[str] = None,
+) -> str:
+    """Один вызов модели без кэшей; при ошибке возвращает исходный текст."""
+    llm = get_llm()
+    if not llm:
+        return short_answer
+    snap = snap or current()
+    messages, planned = _humanize_messages(short_answer, user_question, snap.system_prompt, kind)
+    started = time.perf_counter()
+    try:
+        resp = await llm.complete(OPENAI_MODEL, messages)
     except Exception:
+        LLM_CALLS.inc("error")
         return short_answer
+    finally:
+        LLM_SECONDS.observe(time.perf_counter() - started)
+    LLM_CALLS.inc("ok")
+    _log_usage(planned, resp)
+    return extract_content(resp, short_answer)
+
+
+async def generate_humanized_stream(
+    short_answer: str, user_question: str, sink, snap: Optional[Snapshot] = None, kind: Optional[str] = None,
+) -> str:
+    """
+    То же, что generate_humanized, но ответ читается потоком и по мере генерации
+    отдаётся в sink (sink.start() — до первого куска, sink.update(весь текст на сейчас)).
+    Если поток оборвался, делается обычный вызов; итоговый текст возвращается как обычно.
+    """
+    llm = get_llm()
+    if not llm:
+        return short_answer
+    snap = snap or current()
+    messages, planned = _humanize_messages(short_answer, user_question, snap.system_prompt, kind)
+    started = time.perf_counter()
+    text = ""
+    usage_chunk = None
+    await sink.start()
+    try:
+        async for chunk in llm.stream(OPENAI_MODEL, messages):
+            if getattr(chunk, "usage", None) is not None:
+                usage_chunk = chunk
+            delta = delta_content(chunk)
+            if delta:
+                if not text:
+                    LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started)
+                text += delta
+                await sink.update(text)
+    except Exception:
+        LLM_CALLS.inc("error")
+        LLM_SECONDS.observe(time.perf_counter() - started)
+        log.warning("llm stream failed after %d chars, retrying without streaming", len(text), exc_info=True)
+        return await generate_humanized(short_answer, user_question, snap, kind)
+    LLM_SECONDS.observe(time.perf_counter() - started)
+    LLM_CALLS.inc("ok")
+    _log_usage(planned, usage_chunk)
+    return text or short_answer
+
+
+async def humanize_answer_async(
+    short_answer: str, user_question: str, snap: Optional[Snapshot] = None, kind: Optional[str] = None, sink=None,
+) -> str:
+    """
+    kind — тип записи ("navigation" / "rules"): от него зависит вариант системного промпта.
+    sink — куда отдавать ответ потоком (handlers/streaming.py); используется только
+    для живой генерации, готовые и кэшированные ответы возвращаются сразу.
+    Текст любого источника уходит через render(): под parse_mode="HTML" ответ
+    модели выглядит одинаково — готовый, из кэша или сгенерированный сейчас.
+    """
+    with STAGE_SECONDS.time("humanize"):
+        text, source = await _humanize(short_answer, user_question, snap or current(), kind, sink)
+    HUMANIZE_SOURCE.inc(source)
+    return text
+
+
+async def _humanize(short_answer: str, user_question: str, snap: Snapshot, kind: Optional[str], sink=None):
+    """(текст, источник) — источник идёт в метрику bot_humanize_total."""
+    # 1) офлайн-артефакт: статичные записи базы отдаются без LLM (уже экранированными и нарезанными)
+    entry = entry_key(short_answer)
+    ready = snap.rendered.pregenerated(entry)
+    if ready:
+        return ready, "pregenerated"
+
+    # 2) кэш живых ответов
+    if not await ready_llm():
+        return snap.rendered.raw(entry, short_answer), "raw"
+    # kind входит в ключ: у навигации и правил разные варианты системного промпта
+    key = make_key(snap.prompt_version, kind or "", short_answer, normalize(user_question))
+    cached = await answer_cache.aget(key)
+    if cached is not None:
+        return render(cached), "cache"
+
+    # 3) живая генерация: одинаковые вопросы, заданные одновременно, ждут один вызов модели
+    #    (поток правок видит только тот, кто вызов начал, остальные получают готовый текст)
+    (text, source), shared = await inflight.do(
+        key, lambda: _generate(key, entry, short_answer, user_question, snap, kind, sink),
+    )
+    return text, ("shared" if shared and source == "llm" else source)
+
+
+async def _generate(
+    key: str, entry: str, short_answer: str, user_question: str, snap: Snapshot, kind: Optional[str], sink,
+):
+    started = time.perf_counter()
+    if sink is not None:
+        text = await generate_humanized_stream(short_answer, user_question, sink, snap, kind)
+    else:
+        text = await generate_humanized(short_answer, user_question, snap, kind)
+    # кэшируем только то, что реально пришло от модели
+    if text is short_answer:
+        return snap.rendered.raw(entry, short_answer), "raw"
+    answer_cache.set(key, text, cost=time.perf_counter() - started)
+    return render(text), "llm"
 
 
 # --- Центральная функция: ask_ai (оставлен контракт как в исходнике) ---
-async def ask_ai(user_id: int, question: str) -> Any:
+async def ask_ai(user_id: int, question: str, sink=None) -> Any:
+    """sink — необязательный приёмник потокового ответа модели (см. humanize_answer_async)."""
     q = (question or "").strip()
 
     # --- обработка специальных payload'ов (callback data) ---
@@ -321,7 +368,6 @@ async def ask_ai(user_id: int, question: str) -> Any:
         val = val.strip()
         if val in ("mobile", "desktop"):
             sessions.set_device(user_id, val)
-            user_device[user_id] = val
             sessions.add_history(user_id, "assistant", f"device_set_{val}")
             return "Отлично! Слушаю вас внимательно, какой будет вопрос?"
 
@@ -339,43 +385,49 @@ async def ask_ai(user_id: int, question: str) -> Any:
 
     # 2) device selection
     if not sessions.has_device(user_id):
-        t = q.lower()
-        if any(x in t for x in ("смартфон", "телефон", "mobile", "мобил")):
+        device = device_from_text(q)
+        if device == "mobile":
             sessions.set_device(user_id, "mobile")
-            user_device[user_id] = "mobile"
             sessions.add_history(user_id, "assistant", "device_set_mobile")
             return "Отлично! Слушаю вас внимательно, какой будет вопрос?"
-        if any(x in t for x in ("компьютер", "пк", "desktop", "ноут")):
+        if device == "desktop":
             sessions.set_device(user_id, "desktop")
-            user_device[user_id] = "desktop"
             sessions.add_history(user_id, "assistant", "device_set_desktop")
             return "Отлично! Слушаю вас внимательно, какой будет вопрос?"
         return "Пожалуйста, выберите устройство: «смартфон» или «компьютер»."
 
+    # один срез базы на весь запрос — перезагрузка посреди обработки его не затронет;
+    # приветствие и выбор устройства выше его не ждут (на холодном старте база ещё может собираться)
+    snap = await snapshots.wait()
+
     # 3) if awaiting pending choice
     pending = sessions.get_pending(user_id)
     if pending:
-        idx = parse_choice(q, pending)
+        with STAGE_SECONDS.time("parse_choice"):
+            idx = await matcher.parse_choice(q, pending)
         if idx is None:
+            PENDING_CHOICES.inc("unresolved")
             return "Пожалуйста, выберите вариант: напишите номер (1, 2, ...) или напишите фразу полностью."
+        PENDING_CHOICES.inc("resolved")
         selected = pending[idx]
         sessions.clear_pending(user_id)
         answer_text = selected.get("value") or "Информация отсутствует."
-        # если value — dict со steps, сформируем шаги
+        # если value — dict со steps, текст шагов уже собран при загрузке базы
         if isinstance(answer_text, dict) and "steps" in answer_text:
-            lines = [f"Чтобы {answer_text.get('title')}, выполните следующие шаги:"]
-            for i, step in enumerate(answer_text["steps"], start=1):
-                lines.append(f"{i}. {step}.")
-            return "\n".join(lines)
-        return humanize_answer(answer_text, question)
+            return snap.rendered.steps(selected)
+        return await humanize_answer_async(answer_text, question, snap, selected.get("type"), sink)
 
     # 4) off-topic detection
-    if is_off_topic(q):
+    with STAGE_SECONDS.time("off_topic"):
+        off_topic = await matcher.is_off_topic(q)
+    if off_topic:
         return "Извините, я могу отвечать только по вопросам, связанным с работой сайта. Обратитесь по вопросам сайта."
 
     # 5) normal search
     device = sessions.get_device(user_id) or "desktop"
-    matches = search_matches(q, device)
+    with STAGE_SECONDS.time("search"):
+        matches = await _search_cached(q, device, snap.kb)
+    MATCH_TIER.inc(best_tier(matches))
 
     if not matches:
         return "Мне не удалось найти точный ответ в базе по этому вопросу. Пожалуйста, уточните, о чём именно идёт речь на сайте."
@@ -385,19 +437,17 @@ async def ask_ai(user_id: int, question: str) -> Any:
 
         # Новый формат: title + steps
         if isinstance(data, dict) and "steps" in data:
-            lines = [f"Чтобы {data.get('title')}, выполните следующие шаги:"]
-            for i, step in enumerate(data["steps"], start=1):
-                lines.append(f"{i}. {step}.")
-            return "\n".join(lines)
+            return snap.rendered.steps(matches[0])
 
         # Старый формат (строка)
         if isinstance(data, str) and data.strip():
-            return humanize_answer(data, question)
+            return await humanize_answer_async(data, question, snap, matches[0].get("type"), sink)
 
         return "Информация по этому вопросу временно недоступна."
 
     # multiple matches -> present options and save pending
     sessions.set_pending(user_id, matches)
+    PENDING_CHOICES.inc("offered")
     lines = ["Я нашёл несколько вариантов. Что вы имеете в виду:"]
     for i, m in enumerate(matches, start=1):
         label = "Правила" if m.get("type") == "rules" else "Раздел"
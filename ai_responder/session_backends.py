@@ -0,0 +1,155 @@
+# ai_responder/session_backends.py
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+
+class SessionBackend:
+    """
+    Внешнее хранилище сессий, общее для нескольких воркеров.
+    Данные сессии — JSON-совместимый dict (см. SessionStore._dump).
+
+    У каждой записи есть версия (0 — записи нет), запись — compare-and-set:
+    сохраняется, только если версия в хранилище та, от которой воркер
+    считал свои изменения, — иначе конфликт, и SessionStore сливает их
+    с чужими по полям, а не затирает.
+    """
+
+    def load(self, user_id: int) -> Optional[Tuple[Dict, float, int]]:
+        """(данные, время последней записи по time.time(), версия) или None."""
+        raise NotImplementedError
+
+    def save_many(self, items: Dict[int, Tuple[Dict, int]]) -> Dict[int, int]:
+        """
+        items: user_id -> (данные, ожидаемая версия). Возвращает новые версии
+        сохранённых записей; записи, которых в ответе нет, — конфликт.
+        """
+        raise NotImplementedError
+
+    def delete_many(self, user_ids: Iterable[int]):
+        raise NotImplementedError
+
+    def prune(self, older_than: float) -> int:
+        """Удаляет сессии, которые не обновлялись с момента older_than."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemoryBackend(SessionBackend):
+    """Реализация в памяти процесса (для локального запуска и проверок)."""
+
+    def __init__(self):
+        self._rows: Dict[int, Tuple[str, float, int]] = {}
+        self._lock = threading.Lock()
+
+    def load(self, user_id: int) -> Optional[Tuple[Dict, float, int]]:
+        row = self._rows.get(user_id)
+        return (json.loads(row[0]), row[1], row[2]) if row else None
+
+    def save_many(self, items: Dict[int, Tuple[Dict, int]]) -> Dict[int, int]:
+        now = time.time()
+        saved = {}
+        with self._lock:
+            for user_id, (data, expected) in items.items():
+                row = self._rows.get(user_id)
+                if (row[2] if row else 0) == expected:
+                    self._rows[user_id] = (json.dumps(data, ensure_ascii=False), now, expected + 1)
+                    saved[user_id] = expected + 1
+        return saved
+
+    def delete_many(self, user_ids: Iterable[int]):
+        with self._lock:
+            for user_id in user_ids:
+                self._rows.pop(user_id, None)
+
+    def prune(self, older_than: float) -> int:
+        with self._lock:
+            old = [uid for uid, (_, updated, _) in self._rows.items() if updated < older_than]
+        self.delete_many(old)
+        return len(old)
+
+
+class SQLiteBackend(SessionBackend):
+    """
+    SQLite в режиме WAL: читатели не блокируют писателя, поэтому один файл
+    могут одновременно использовать несколько процессов-воркеров.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "user_id INTEGER PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL, "
+            "version INTEGER NOT NULL DEFAULT 1)"
+        )
+        # файл от версии без compare-and-set: существующие записи получают версию 1
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(sessions)")}
+        if "version" not in columns:
+            self._db.execute("ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated)")
+        self._db.commit()
+
+    def load(self, user_id: int) -> Optional[Tuple[Dict, float, int]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data, updated, version FROM sessions WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return (json.loads(row[0]), row[1], row[2]) if row else None
+
+    def save_many(self, items: Dict[int, Tuple[Dict, int]]) -> Dict[int, int]:
+        if not items:
+            return {}
+        now = time.time()
+        saved = {}
+        with self._lock:
+            # одна транзакция на пачку; rowcount каждой записи — удалась ли её проверка версии
+            for uid, (data, expected) in items.items():
+                text = json.dumps(data, ensure_ascii=False)
+                if expected:
+                    cur = self._db.execute(
+                        "UPDATE sessions SET data = ?, updated = ?, version = version + 1"
+                        " WHERE user_id = ? AND version = ?", (text, now, uid, expected)
+                    )
+                else:
+                    cur = self._db.execute(
+                        "INSERT OR IGNORE INTO sessions (user_id, data, updated, version) VALUES (?, ?, ?, 1)",
+                        (uid, text, now),
+                    )
+                if cur.rowcount == 1:
+                    saved[uid] = expected + 1
+            self._db.commit()
+        return saved
+
+    def delete_many(self, user_ids: Iterable[int]):
+        rows = [(uid,) for uid in user_ids]
+        if not rows:
+            return
+        with self._lock:
+            self._db.executemany("DELETE FROM sessions WHERE user_id = ?", rows)
+            self._db.commit()
+
+    def prune(self, older_than: float) -> int:
+        with self._lock:
+            cur = self._db.execute("DELETE FROM sessions WHERE updated < ?", (older_than,))
+            self._db.commit()
+        return cur.rowcount
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def make_backend(kind: str, path: str) -> Optional[SessionBackend]:
+    """Бэкенд по имени из конфигурации: "" / "local" — без внешнего хранилища."""
+    if kind == "sqlite":
+        return SQLiteBackend(path)
+    if kind == "memory":
+        return MemoryBackend()
+    return None
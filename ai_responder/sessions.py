@@ -0,0 +1,430 @@
+# ai_responder/sessions.py
+import asyncio
+import logging
+import sys
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from ai_responder.session_backends import SessionBackend
+
+log = logging.getLogger(__name__)
+
+DEVICES = ("mobile", "desktop")
+# поля записи, кроме истории, — в этом порядке хранится их значение из backend'а (UserSession.base)
+FIELDS = ("device", "pending", "seen", "failed")
+EMPTY_BASE = (None, None, False, 0)
+# сколько раз перечитать и слить запись, которую одновременно пишет другой воркер
+CAS_ATTEMPTS = 5
+
+
+def merge(remote: Dict, local: Dict, base: Tuple, appended: int, history_limit: int) -> Dict:
+    """
+    Изменения этого воркера (local относительно base — того, что было в backend'е,
+    когда он их начал) поверх записи remote, которую успел сохранить другой воркер:
+    поле, которое здесь не меняли, берётся из remote; история — remote плюс
+    добавленные здесь сообщения; счётчик неудач — remote плюс свой прирост
+    (сброс в 0 побеждает).
+    """
+    merged = {"history": [], "device": None, "pending": None, "seen": False, "failed": 0}
+    merged.update(remote)
+    old = dict(zip(FIELDS, base))
+    for field in ("device", "pending", "seen"):
+        if local[field] != old[field]:
+            merged[field] = local[field]
+    if local["failed"] == 0 and old["failed"]:
+        merged["failed"] = 0
+    else:
+        merged["failed"] = max(0, int(merged["failed"] or 0) + local["failed"] - old["failed"])
+    if appended:
+        merged["history"] = (list(merged["history"]) + local["history"][-appended:])[-history_limit:]
+    return merged
+
+
+class UserSession:
+    """Всё состояние одного пользователя в одной компактной записи."""
+    __slots__ = ("history", "device", "pending", "seen", "failed", "touched", "synced", "version", "base", "appended", "reset")
+
+    def __init__(self):
+        self.history: Optional[deque] = None  # кольцевой буфер (role, content), создаётся при первой записи
+        self.device: Optional[str] = None   # "mobile" / "desktop"
+        self.pending: Optional[List[Dict]] = None
+        self.seen = False                   # чтобы поприветствовать один раз
+        self.failed = 0                     # подряд неудачных ответов
+        self.touched = 0.0
+        self.synced = 0.0                   # когда последний раз сверялись с backend
+        self.version = 0                    # версия записи в backend'е, от которой считаются изменения
+        self.base: Optional[Tuple] = None   # значения FIELDS в backend'е при этой версии
+        self.appended = 0                   # сообщений в истории, ещё не записанных в backend
+        self.reset = False                  # создана после clear(): в backend'е заменяет запись целиком
+
+
+# Сессии: история + выбор устройства + ожидаемые варианты
+class SessionStore:
+    """
+    Ограниченное по памяти хранилище сессий:
+      - одна запись UserSession на пользователя;
+      - история — кольцевой буфер на history_limit сообщений;
+      - LRU-вытеснение сверх max_users и удаление простаивающих дольше ttl
+        (sweep() / фоновый run_sweeper()).
+    Чтение для неизвестного пользователя запись не создаёт.
+
+    С backend'ом (SQLite и т.п.) память работает как кэш: перед обработкой
+    сообщения refresh() перечитывает запись, если её нет в памяти или она старше
+    sync_interval, а изменения копятся и пишутся пачкой фоновым run_flusher()
+    (write-behind). Обращения к хранилищу идут в потоке, event loop их не ждёт.
+
+    Несколько воркеров могут обслуживать одного пользователя: запись в backend —
+    compare-and-set по версии, а при конфликте изменения сливаются по полям
+    (merge), так что ни выбор варианта, ни счётчик неудач не теряются. Чтение
+    при этом может отставать от другого воркера не больше чем на sync_interval.
+    """
+
+    def __init__(
+        self,
+        max_users: int = 100_000,
+        ttl: float = 24 * 3600,
+        history_limit: int = 20,
+        backend: Optional[SessionBackend] = None,
+        sync_interval: float = 1.0,
+    ):
+        self.max_users = max_users
+        self.ttl = ttl
+        self.history_limit = history_limit
+        self.backend = backend
+        self.sync_interval = sync_interval
+        self._users: "OrderedDict[int, UserSession]" = OrderedDict()
+        # user_id -> запись для сохранения (None — удалить из backend)
+        self._dirty: Dict[int, Optional[UserSession]] = {}
+        # записи, которые сейчас пишет run_flusher: их не перечитываем
+        self._flushing: Set[int] = set()
+        self.evicted = 0
+
+    # records
+    def _peek(self, user_id: int) -> Optional[UserSession]:
+        rec = self._users.get(user_id)
+        if rec is not None and self.ttl > 0 and time.monotonic() - rec.touched > self.ttl:
+            self._users.pop(user_id, None)
+            self.evicted += 1
+            rec = None
+        return rec
+
+    async def refresh(self, user_id: int):
+        """
+        Read-through перед обработкой сообщения: запись, которой нет в памяти или
+        которая старше sync_interval, перечитывается из backend'а (её мог изменить
+        другой воркер). Запись с незаписанными изменениями не перечитывается —
+        их сольёт с чужими flush.
+        """
+        if self.backend is None or user_id in self._dirty or user_id in self._flushing:
+            return
+        rec = self._users.get(user_id)
+        if rec is not None and time.monotonic() - rec.synced <= self.sync_interval:
+            return
+        try:
+            row = await asyncio.to_thread(self.backend.load, user_id)
+        except Exception:
+            return  # хранилище недоступно — работаем с тем, что есть в памяти
+        # пока читали, запись могли изменить здесь же — свои правки свежее прочитанного
+        if user_id in self._dirty or user_id in self._flushing:
+            return
+        self._loaded(user_id, row)
+
+    def _loaded(self, user_id: int, row: Optional[Tuple[Dict, float, int]]):
+        rec = self._users.get(user_id)
+        if row is None or (self.ttl > 0 and time.time() - row[1] > self.ttl):
+            if rec is not None:
+                self._users.pop(user_id, None)
+            return
+        if rec is not None and row[2] < rec.version:
+            return  # прочитали раньше, чем записали свою версию
+        if rec is None:
+            rec = UserSession()
+            rec.touched = time.monotonic()
+            self._insert(user_id, rec)
+        self._restore(rec, row[0])
+        rec.version = row[2]
+        rec.base = self._base(row[0])
+        rec.appended = 0
+        rec.synced = time.monotonic()
+
+    def _insert(self, user_id: int, rec: UserSession):
+        self._users[user_id] = rec
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+            self.evicted += 1
+
+    def _record(self, user_id: int) -> UserSession:
+        rec = self._peek(user_id)
+        if rec is None:
+            rec = UserSession()
+            rec.synced = time.monotonic()
+            # clear() ещё не дошёл до backend'а: новая запись займёт место удаления
+            # и при конфликте не должна сливаться со старой
+            rec.reset = user_id in self._dirty and self._dirty[user_id] is None
+            self._insert(user_id, rec)
+        else:
+            self._users.move_to_end(user_id)
+        rec.touched = time.monotonic()
+        self._changed(user_id, rec)
+        return rec
+
+    def _changed(self, user_id: int, rec: UserSession):
+        if self.backend is not None:
+            self._dirty[user_id] = rec
+
+    # (де)сериализация записи для backend'а
+    def _dump(self, rec: UserSession) -> Dict:
+        return {
+            "history": list(rec.history) if rec.history else [],
+            "device": rec.device,
+            "pending": rec.pending,
+            "seen": rec.seen,
+            "failed": rec.failed,
+        }
+
+    @staticmethod
+    def _base(data: Dict) -> Tuple:
+        return tuple(data.get(field, empty) for field, empty in zip(FIELDS, EMPTY_BASE))
+
+    def _restore(self, rec: UserSession, data: Dict):
+        history = data.get("history") or []
+        rec.history = deque((tuple(m) for m in history), maxlen=self.history_limit) if history else None
+        rec.device = data.get("device")
+        rec.pending = data.get("pending")
+        rec.seen = bool(data.get("seen"))
+        rec.failed = int(data.get("failed") or 0)
+
+    def _take(self) -> Dict[int, Tuple[Optional[UserSession], Any, int, Optional[Tuple], int]]:
+        """
+        На event loop: снимок изменённых записей для _write —
+        user_id -> (запись, данные, версия, base, новых сообщений); запись None — удалить,
+        base None — записать поверх чужой версии без слияния (сброс через clear()).
+        """
+        dirty, self._dirty = self._dirty, {}
+        batch = {}
+        for uid, rec in dirty.items():
+            if rec is None:
+                batch[uid] = (None, None, 0, EMPTY_BASE, 0)
+            else:
+                base = None if rec.reset else rec.base or EMPTY_BASE
+                batch[uid] = (rec, self._dump(rec), rec.version, base, rec.appended)
+                rec.appended = 0
+        self._flushing.update(batch)
+        return batch
+
+    def _write(self, batch) -> Dict[int, Tuple[int, Optional[Dict]]]:
+        """
+        Можно в потоке: compare-and-set пачкой; запись, которую успел изменить другой
+        воркер, перечитывается, сливается (merge) и пишется снова. Возвращает
+        user_id -> (новая версия, записанные данные); чего нет — не записалось.
+        """
+        done: Dict[int, Tuple[int, Optional[Dict]]] = {}
+        todo = {uid: (item[1], item[2]) for uid, item in batch.items() if item[0] is not None}
+        try:
+            deletes = [uid for uid, item in batch.items() if item[0] is None]
+            self.backend.delete_many(deletes)
+            done.update((uid, (0, None)) for uid in deletes)
+            for _ in range(CAS_ATTEMPTS):
+                for uid, version in self.backend.save_many(todo).items():
+                    done[uid] = (version, todo.pop(uid)[0])
+                if not todo:
+                    break
+                for uid in todo:
+                    _, local, _, base, appended = batch[uid]
+                    row = self.backend.load(uid)
+                    remote, version = (row[0], row[2]) if row else ({}, 0)
+                    if base is None:
+                        todo[uid] = (local, version)
+                    else:
+                        todo[uid] = (merge(remote, local, base, appended, self.history_limit), version)
+        except Exception:
+            log.warning("session backend write failed, %d records re-queued", len(batch) - len(done), exc_info=True)
+        return done
+
+    def _finish(self, batch, done) -> int:
+        """На event loop: версии записанного; незаписанное — обратно в очередь, новые правки важнее."""
+        now = time.monotonic()
+        for uid, (rec, local, _, _, appended) in batch.items():
+            self._flushing.discard(uid)
+            if uid not in done:
+                if rec is not None:
+                    rec.appended += appended
+                self._dirty.setdefault(uid, rec)
+                continue
+            if rec is None:
+                continue
+            version, written = done[uid]
+            if written is not local:
+                self._rebase(rec, local, written)
+            rec.version = version
+            rec.base = self._base(written)
+            rec.reset = False
+            rec.synced = now
+        return len(done)
+
+    def _rebase(self, rec: UserSession, taken: Dict, merged: Dict):
+        """Слитая с чужими запись вместо своей; поля, изменённые уже после _take, остаются свежими."""
+        if rec.device == taken["device"]:
+            rec.device = merged["device"]
+        if rec.pending == taken["pending"]:
+            rec.pending = merged["pending"]
+        if rec.seen == taken["seen"]:
+            rec.seen = merged["seen"]
+        if rec.failed or not taken["failed"]:
+            rec.failed = max(0, merged["failed"] + rec.failed - taken["failed"])
+        history = [tuple(m) for m in merged["history"]]
+        if rec.appended:
+            history += list(rec.history)[-rec.appended:]
+        rec.history = deque(history, maxlen=self.history_limit) if history else None
+
+    def flush(self) -> int:
+        """Записывает накопленные изменения в backend одной пачкой (синхронно — при остановке)."""
+        if self.backend is None or not self._dirty:
+            return 0
+        batch = self._take()
+        return self._finish(batch, self._write(batch))
+
+    async def run_flusher(self, interval: float = 0.5):
+        while True:
+            await asyncio.sleep(interval)
+            if self.backend is not None and self._dirty:
+                batch = self._take()
+                write = asyncio.ensure_future(asyncio.to_thread(self._write, batch))
+                try:
+                    done = await asyncio.shield(write)
+                except asyncio.CancelledError:
+                    # остановка: пачка уже пишется в потоке — дождаться и учесть версии, иначе
+                    # close() посчитал бы эти изменения заново и слил бы их с ними же
+                    self._finish(batch, await write)
+                    raise
+                self._finish(batch, done)
+
+    def close(self):
+        self.flush()
+        if self.backend is not None:
+            self.backend.close()
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    # history helpers (new API)
+    def add_history(self, user_id: int, role: str, content: str):
+        rec = self._record(user_id)
+        if rec.history is None:
+            rec.history = deque(maxlen=self.history_limit)
+        rec.history.append((role, content))
+        rec.appended += 1
+
+    def get_history(self, user_id: int):
+        rec = self._peek(user_id)
+        if not rec or not rec.history:
+            return []
+        return [{"role": role, "content": content} for role, content in rec.history]
+
+    # Backwards-compatible methods used by handlers (sessions.add / get / clear)
+    def add(self, user_id: int, role: str, content: str):
+        """Compatibility: sessions.add(user_id, role, content)"""
+        return self.add_history(user_id, role, content)
+
+    def get(self, user_id: int):
+        """Compatibility: sessions.get(user_id) -> history list"""
+        return self.get_history(user_id)
+
+    def clear(self, user_id: int):
+        """Compatibility: clear all user data (history, pending, device, seen)"""
+        self._users.pop(user_id, None)
+        if self.backend is not None:
+            self._dirty[user_id] = None
+
+    # device
+    def set_device(self, user_id: int, device: str):
+        if device in DEVICES:
+            self._record(user_id).device = device
+
+    def get_device(self, user_id: int) -> Optional[str]:
+        rec = self._peek(user_id)
+        return rec.device if rec else None
+
+    def has_device(self, user_id: int) -> bool:
+        return self.get_device(user_id) is not None
+
+    # pending
+    def set_pending(self, user_id: int, options: List[Dict]):
+        self._record(user_id).pending = options
+
+    def get_pending(self, user_id: int) -> Optional[List[Dict]]:
+        rec = self._peek(user_id)
+        return rec.pending if rec else None
+
+    def clear_pending(self, user_id: int):
+        rec = self._peek(user_id)
+        if rec and rec.pending is not None:
+            rec.pending = None
+            self._changed(user_id, rec)
+
+    # greeting flag
+    def mark_seen(self, user_id: int):
+        self._record(user_id).seen = True
+
+    def was_seen(self, user_id: int) -> bool:
+        rec = self._peek(user_id)
+        return bool(rec and rec.seen)
+
+    # failed answers counter (для предложения живой поддержки)
+    def add_failed(self, user_id: int) -> int:
+        rec = self._record(user_id)
+        rec.failed += 1
+        return rec.failed
+
+    def reset_failed(self, user_id: int):
+        rec = self._peek(user_id)
+        if rec and rec.failed:
+            rec.failed = 0
+            self._changed(user_id, rec)
+
+    # eviction
+    def sweep(self) -> int:
+        """Удаляет простаивающие сессии; записи упорядочены по последнему обращению."""
+        if self.ttl <= 0:
+            return 0
+        deadline = time.monotonic() - self.ttl
+        removed = 0
+        while self._users:
+            rec = next(iter(self._users.values()))
+            if rec.touched > deadline:
+                break
+            self._users.popitem(last=False)
+            removed += 1
+        self.evicted += removed
+        return removed
+
+    async def run_sweeper(self, interval: float = 60.0):
+        while True:
+            await asyncio.sleep(interval)
+            self.sweep()
+            if self.backend is not None and self.ttl > 0:
+                try:
+                    await asyncio.to_thread(self.backend.prune, time.time() - self.ttl)
+                except Exception:
+                    log.warning("session backend prune failed", exc_info=True)
+
+    def memory_report(self) -> Dict[str, int]:
+        """Приблизительный объём памяти под сессии (байты, без общих строк-констант)."""
+        total = sys.getsizeof(self._users)
+        messages = 0
+        for rec in self._users.values():
+            total += sys.getsizeof(rec)
+            if rec.history:
+                total += sys.getsizeof(rec.history)
+                for m in rec.history:
+                    total += sys.getsizeof(m) + sys.getsizeof(m[1])
+                messages += len(rec.history)
+            if rec.pending:
+                total += sys.getsizeof(rec.pending)
+        return {
+            "users": len(self._users),
+            "history_messages": messages,
+            "evicted": self.evicted,
+            "approx_bytes": total,
+        }
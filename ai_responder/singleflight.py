@@ -0,0 +1,44 @@
+# ai_responder/singleflight.py
+"""
+Single-flight: одинаковые запросы, пришедшие одновременно, выполняются один раз.
+
+Первый вызов с ключом запускает работу отдельной задачей, остальные ждут
+её же результата. Каждый ждущий защищён asyncio.shield: отмена одного
+(пользователь ушёл, обработчик снят при остановке) не отменяет работу для
+других. Ошибка достаётся всем, кто ждал именно этот вызов, но ключ сразу
+освобождается — следующий запрос начнёт работу заново, а не получит старую ошибку.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self.started = 0  # сколько раз работа реально запускалась
+        self.shared = 0   # сколько вызовов получили чужой результат
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """(результат, shared): shared=True, если результат посчитал другой вызов."""
+        task = self._calls.get(key)
+        shared = task is not None
+        if shared:
+            self.shared += 1
+        else:
+            self.started += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        return await asyncio.shield(task), shared
+
+    def _done(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # ждущих могло не остаться — иначе asyncio пишет «exception was never retrieved»
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._calls), "started": self.started, "shared": self.shared}
@@ -0,0 +1,132 @@
+# ai_responder/snapshot.py
+import asyncio
+import logging
+from pathlib import Path
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+from ai_responder.kb import KnowledgeBase
+from ai_responder.rendering import RenderedAnswers
+from ai_responder.warmup import Lazy
+
+log = logging.getLogger(__name__)
+
+
+class Snapshot:
+    """
+    Неизменяемый срез всего, что читается из файлов: база знаний с индексами,
+    системный промпт, его версия, готовые ответы и отрендеренные тексты записей
+    (ai_responder/rendering.py). ask_ai берёт срез один раз в начале и работает
+    с ним до конца, даже если в это время база обновилась.
+    """
+    __slots__ = ("kb", "system_prompt", "prompt_version", "pregenerated", "rendered")
+
+    def __init__(self, kb: KnowledgeBase, system_prompt: str, prompt_version: str, pregenerated: Dict[str, str]):
+        object.__setattr__(self, "kb", kb)
+        object.__setattr__(self, "system_prompt", system_prompt)
+        object.__setattr__(self, "prompt_version", prompt_version)
+        object.__setattr__(self, "pregenerated", pregenerated)
+        object.__setattr__(self, "rendered", RenderedAnswers(kb, pregenerated))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Snapshot is immutable")
+
+    @property
+    def version(self) -> str:
+        return f"{self.kb.version}:{self.prompt_version}"
+
+
+class SnapshotHolder:
+    """
+    Текущий срез; замена — одно присваивание ссылки, то есть атомарна для читателей.
+    Вместо готового среза можно передать build: первый срез соберётся при первом
+    обращении (или в фоновом прогреве), а не при импорте.
+    """
+
+    def __init__(self, snapshot: Optional[Snapshot] = None, build: Optional[Callable[[], Snapshot]] = None):
+        if snapshot is None and build is None:
+            raise ValueError("SnapshotHolder needs a snapshot or a build function")
+        self._snapshot = snapshot
+        self._initial = Lazy(build, "snapshot") if snapshot is None else None
+        self.swaps = 0
+
+    @property
+    def ready(self) -> bool:
+        return self._snapshot is not None
+
+    def get(self) -> Snapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = self._keep(self._initial.get())
+        return snapshot
+
+    async def wait(self) -> Snapshot:
+        """get() без блокировки event loop, пока первый срез ещё собирается."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = self._keep(await self._initial.wait())
+        return snapshot
+
+    def _keep(self, built: Snapshot) -> Snapshot:
+        # пока собирали первый срез, перезагрузка могла уже подставить более новый
+        if self._snapshot is None:
+            self._snapshot = built
+        return self._snapshot
+
+    def swap(self, snapshot: Snapshot):
+        self._snapshot = snapshot
+        self.swaps += 1
+
+
+class KnowledgeReloader:
+    """
+    Следит за файлами базы и промпта (по mtime/размеру, без внешних зависимостей).
+    При изменении собирает новый срез в отдельном потоке и подменяет текущий.
+    Если сборка упала (например, битый JSON), остаётся старый срез.
+    """
+
+    def __init__(
+        self,
+        holder: SnapshotHolder,
+        build: Callable[[], Snapshot],
+        paths: Sequence[Path],
+        interval: float = 2.0,
+        on_swap: Optional[Callable[[Snapshot], None]] = None,
+    ):
+        self.holder = holder
+        self.build = build
+        self.paths = [Path(p) for p in paths]
+        self.interval = interval
+        self.on_swap = on_swap
+        self._stamp = self._read_stamp()
+
+    def _read_stamp(self) -> Tuple:
+        stamp = []
+        for p in self.paths:
+            try:
+                st = p.stat()
+                stamp.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    async def check(self) -> bool:
+        """Пересобирает срез, если файлы поменялись; True — если подменили."""
+        stamp = self._read_stamp()
+        if stamp == self._stamp:
+            return False
+        self._stamp = stamp
+        try:
+            snapshot = await asyncio.to_thread(self.build)
+        except Exception:
+            log.exception("knowledge base reload failed, keeping the current snapshot")
+            return False
+        self.holder.swap(snapshot)
+        if self.on_swap:
+            self.on_swap(snapshot)
+        log.info("knowledge base reloaded: %s", snapshot.version)
+        return True
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.check()
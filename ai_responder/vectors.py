@@ -0,0 +1,279 @@
+# ai_responder/vectors.py
+"""
+Смысловой поиск по базе: эмбеддинги записей считаются офлайн и хранятся
+матрицей float32, которая открывается через memmap (страницы общие для всех
+процессов-воркеров и подгружаются по мере обращения).
+
+    python -m ai_responder.vectors                       # эмбеддер из EMBEDDING_MODE
+    python -m ai_responder.vectors --embedder hashing --lists 64
+
+Приближённый поиск ближайших соседей — IVF на numpy: строки разбиты
+сферическим k-means на lists кластеров и лежат в матрице по кластерам
+подряд. Вопрос сравнивается с центроидами и только с nprobe ближайшими
+кластерами, так что стоимость растёт примерно как sqrt(числа строк).
+
+Строки — keyword'ы и текст ответа каждой записи; запись опознаётся по
+стабильному id (index.entry_id), поэтому после правки базы артефакт
+продолжает работать для неизменённых записей, а новые появятся после пересборки.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from ai_responder.embeddings import make_embedder
+from ai_responder.index import KeywordIndex
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - зависит от окружения
+    np = None
+
+log = logging.getLogger(__name__)
+
+VECTORS_FORMAT = 1
+TIER_SEMANTIC = "semantic"
+
+
+def entry_texts(item: Dict) -> List[str]:
+    """Что кодируем для записи: каждый keyword и текст ответа (или заголовок + шаги)."""
+    texts = [k for k in item.get("keywords") or [] if isinstance(k, str) and k.strip()]
+    val = item.get("answer") if item.get("answer") is not None else item.get("hint", "")
+    if isinstance(val, dict):
+        val = " ".join([str(val.get("title") or "")] + [str(s) for s in val.get("steps") or []])
+    if isinstance(val, str) and val.strip():
+        texts.append(val[:1000])
+    return texts
+
+
+def spherical_kmeans(x: "np.ndarray", lists: int, iterations: int = 12, seed: int = 1) -> Tuple["np.ndarray", "np.ndarray"]:
+    """Центроиды (lists, dim) и номер кластера каждой строки; близость — скалярное произведение."""
+    rng = np.random.default_rng(seed)
+    n = len(x)
+    lists = max(1, min(lists, n))
+    centroids = x[rng.choice(n, lists, replace=False)].copy()
+    assign = np.zeros(n, dtype=np.int32)
+    for _ in range(iterations):
+        for start in range(0, n, 65536):  # кусками, чтобы не держать n x lists целиком
+            assign[start:start + 65536] = np.argmax(x[start:start + 65536] @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        counts = np.bincount(assign, minlength=lists)
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = x[rng.choice(n, int(empty.sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+    return centroids, assign
+
+
+def build_store(indexes: List[KeywordIndex], embedder, vectors_path: Path, index_path: Path, lists: int = 0) -> Dict:
+    """Кодирует записи всех индексов (desktop + mobile, без повторов) и атомарно пишет артефакт."""
+    texts: List[str] = []
+    row_entry: List[str] = []
+    seen = set()
+    for index in indexes:
+        for (_, item), eid in zip(index.entries, index.entry_ids):
+            for text in entry_texts(item):
+                if (eid, text) not in seen:
+                    seen.add((eid, text))
+                    texts.append(text)
+                    row_entry.append(eid)
+    if not texts:
+        raise ValueError("knowledge base is empty")
+
+    started = time.perf_counter()
+    x = embedder.embed(texts)
+    lists = lists or max(1, int(len(x) ** 0.5))
+    centroids, assign = spherical_kmeans(x, lists)
+    order = np.argsort(assign, kind="stable")
+    offsets = np.searchsorted(assign[order], np.arange(len(centroids) + 1)).astype(np.int64)
+
+    tmp_vectors = vectors_path.with_suffix(f"{vectors_path.suffix}.{os.getpid()}.tmp")
+    matrix = np.lib.format.open_memmap(tmp_vectors, mode="w+", dtype=np.float32, shape=x.shape)
+    matrix[:] = x[order]
+    matrix.flush()
+    del matrix
+    tmp_index = index_path.with_suffix(f".{os.getpid()}.tmp.npz")
+    np.savez(
+        tmp_index,
+        centroids=centroids,
+        offsets=offsets,
+        row_entry=np.asarray(row_entry)[order],
+        meta=np.asarray(json.dumps({"format": VECTORS_FORMAT, "embedder": embedder.name, "dim": int(x.shape[1])})),
+    )
+    os.replace(tmp_vectors, vectors_path)
+    os.replace(tmp_index, index_path)
+    return {"rows": len(x), "dim": int(x.shape[1]), "lists": len(centroids), "seconds": round(time.perf_counter() - started, 2)}
+
+
+class VectorStore:
+    def __init__(self, vectors: "np.ndarray", centroids: "np.ndarray", offsets: "np.ndarray", row_entry: "np.ndarray", embedder: str):
+        self.vectors = vectors
+        self.centroids = centroids
+        self.offsets = offsets
+        self.row_entry = row_entry
+        self.embedder = embedder
+
+    @classmethod
+    def load(cls, vectors_path: Path, index_path: Path) -> Optional["VectorStore"]:
+        """None, если артефакта нет или он другого формата."""
+        try:
+            with np.load(index_path, allow_pickle=False) as z:
+                meta = json.loads(str(z["meta"]))
+                if meta.get("format") != VECTORS_FORMAT:
+                    return None
+                centroids, offsets, row_entry = z["centroids"], z["offsets"], z["row_entry"]
+            vectors = np.load(vectors_path, mmap_mode="r")
+        except (OSError, ValueError, KeyError):
+            return None
+        if vectors.shape[0] != len(row_entry) or vectors.shape[1] != meta.get("dim"):
+            return None
+        return cls(vectors, centroids, offsets, row_entry, meta.get("embedder", ""))
+
+    def nearest(self, q: "np.ndarray", k: int = 10, nprobe: int = 8) -> Tuple["np.ndarray", "np.ndarray"]:
+        """Номера строк и их косинусы — лучшие k из nprobe ближайших кластеров, по убыванию."""
+        nprobe = min(nprobe, len(self.centroids))
+        near = np.argpartition(-(self.centroids @ q), nprobe - 1)[:nprobe]
+        rows, scores = [], []
+        for c in near.tolist():
+            a, b = int(self.offsets[c]), int(self.offsets[c + 1])
+            if a < b:
+                rows.append(np.arange(a, b))
+                scores.append(np.asarray(self.vectors[a:b]) @ q)
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows, scores = np.concatenate(rows), np.concatenate(scores)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return rows[top], scores[top]
+
+    def query(self, q: "np.ndarray", k: int = 10, nprobe: int = 8) -> List[Tuple[str, float]]:
+        """(entry id, косинус) лучших строк, по убыванию."""
+        rows, scores = self.nearest(q, k, nprobe)
+        return [(str(self.row_entry[r]), float(s)) for r, s in zip(rows.tolist(), scores.tolist())]
+
+
+class SemanticSearch:
+    """
+    Запасной уровень поиска: вызывается, когда keyword-поиск ничего не нашёл.
+    Артефакт и эмбеддер открываются лениво (в каждом процессе свои), артефакт
+    перечитывается, если файл пересобрали.
+
+    asearch — для бота: сетевой эмбеддер идёт через AsyncLLM (тот же лимит
+    и повторы, что у чата), остальное — в потоке. search — синхронный, только
+    с локальным эмбеддером. Ошибка эмбеддинга не ошибка ответа: смыслового
+    уровня просто нет, ответ — «не найдено». Но такое «не найдено» временное,
+    поэтому оба возвращают None (уровень недоступен), а не [] — его не кэшируют.
+    """
+
+    def __init__(
+        self,
+        vectors_path: Path,
+        index_path: Path,
+        embedder: Dict,
+        top_k: int = 3,
+        min_score: float = 0.5,
+        nprobe: int = 8,
+    ):
+        self.vectors_path = Path(vectors_path)
+        self.index_path = Path(index_path)
+        self.embedder_config = embedder
+        self.top_k = top_k
+        self.min_score = min_score
+        self.nprobe = nprobe
+        self._embedder = None
+        self._store: Optional[VectorStore] = None
+        self._stamp = None
+
+    def __getstate__(self):
+        # в процессы-воркеры уходят только настройки, эмбеддер и memmap открываются там заново
+        state = dict(self.__dict__)
+        state.update(_embedder=None, _store=None, _stamp=None)
+        return state
+
+    def _ready(self) -> bool:
+        if self._embedder is None:
+            self._embedder = make_embedder(**self.embedder_config)
+            if self._embedder is None:
+                return False
+        try:
+            stamp = self.index_path.stat().st_mtime_ns
+        except OSError:
+            return False
+        if stamp != self._stamp:
+            self._stamp = stamp
+            self._store = VectorStore.load(self.vectors_path, self.index_path)
+        # вопрос и база должны быть закодированы одним и тем же эмбеддером
+        return self._store is not None and self._store.embedder == self._embedder.name
+
+    def warm_up(self) -> bool:
+        """Открыть эмбеддер и артефакт заранее, а не на первом вопросе без keyword-совпадений."""
+        return self._ready()
+
+    def search(self, index: KeywordIndex, question: str) -> Optional[List[Dict]]:
+        if not question.strip() or not self._ready() or self._embedder.remote:
+            return []
+        try:
+            q = self._embedder.embed([question])[0]
+        except Exception:
+            log.warning("question embedding failed, semantic tier skipped", exc_info=True)
+            return None
+        return self._lookup(index, q)
+
+    async def asearch(self, index: KeywordIndex, question: str) -> Optional[List[Dict]]:
+        if not question.strip() or not await asyncio.to_thread(self._ready):
+            return []
+        if not self._embedder.remote:
+            return await asyncio.to_thread(self.search, index, question)
+        from ai_responder.llm import ready_llm
+
+        try:
+            llm = await ready_llm()
+            if llm is None:
+                return []
+            q = (await self._embedder.aembed(llm, [question]))[0]
+        except Exception:
+            log.warning("question embedding failed, semantic tier skipped", exc_info=True)
+            return None
+        return await asyncio.to_thread(self._lookup, index, q)
+
+    def _lookup(self, index: KeywordIndex, q: "np.ndarray") -> List[Dict]:
+        results: List[Dict] = []
+        seen = set()
+        # строк на запись несколько — берём с запасом и оставляем лучшую строку каждой записи
+        for eid, score in self._store.query(q, k=self.top_k * 8, nprobe=self.nprobe):
+            if score < self.min_score:
+                break
+            entry_no = index.entry_by_id.get(eid)
+            if entry_no is None or eid in seen:  # запись другого устройства или удалена из базы
+                continue
+            seen.add(eid)
+            results.append(dict(index.describe(entry_no, TIER_SEMANTIC), score=round(score, 4)))
+            if len(results) >= self.top_k:
+                break
+        return results
+
+
+if __name__ == "__main__":
+    from bot.config import EMBEDDING_DIM, EMBEDDING_MODE, EMBEDDING_MODEL, OPENAI_API_KEY, OPENAI_BASE_URL
+    from ai_responder.kb import load_kb
+    from ai_responder.paths import KB_ARTIFACT, KB_SOURCES, VECTORS_INDEX, VECTORS_PATH
+
+    parser = argparse.ArgumentParser(description="Embed knowledge-base entries and build the vector index")
+    parser.add_argument("--embedder", default=EMBEDDING_MODE or "hashing", help="hashing or openai")
+    parser.add_argument("--lists", type=int, default=0, help="IVF clusters (default: sqrt of rows)")
+    args = parser.parse_args()
+    if np is None:
+        raise SystemExit("numpy is not installed")
+    embedder = make_embedder(args.embedder, EMBEDDING_MODEL, EMBEDDING_DIM, OPENAI_API_KEY, OPENAI_BASE_URL)
+    if embedder is None:
+        raise SystemExit("OPENAI_API_KEY is not set")
+    kb = load_kb(KB_SOURCES, KB_ARTIFACT)
+    print(build_store(list(kb.indexes.values()), embedder, VECTORS_PATH, VECTORS_INDEX, lists=args.lists))
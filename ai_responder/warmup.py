@@ -0,0 +1,74 @@
+# ai_responder/warmup.py
+"""
+Отложенная инициализация для быстрого холодного старта.
+
+Тяжёлое — разбор базы знаний, импорт SDK модели, словарь токенизатора —
+не делается при импорте модулей: бот начинает принимать апдейты сразу,
+а всё это строится в фоне (warm_up, запускается из main.on_startup).
+Запрос, пришедший раньше, ждёт только то, что нужно ему самому, и ждёт
+в отдельном потоке, не блокируя event loop.
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Callable, Dict, Generic, Optional, Sequence, Tuple, TypeVar
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+_UNSET = object()
+
+
+class Lazy(Generic[T]):
+    """
+    Значение, которое строится один раз при первом обращении. Прогрев и запрос
+    могут попросить его одновременно — сборка всё равно одна (под локом).
+    Если сборка упала, значение не запоминается: следующий get() попробует снова.
+    """
+
+    def __init__(self, build: Callable[[], T], name: str = ""):
+        self.build = build
+        self.name = name or getattr(build, "__name__", "lazy")
+        self.seconds: Optional[float] = None  # сколько заняла сборка
+        self._value = _UNSET
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._value is not _UNSET
+
+    def get(self) -> T:
+        if self._value is _UNSET:
+            with self._lock:
+                if self._value is _UNSET:
+                    started = time.perf_counter()
+                    value = self.build()
+                    self.seconds = time.perf_counter() - started
+                    self._value = value
+        return self._value
+
+    async def wait(self) -> T:
+        """get() из async-кода: если значения ещё нет, сборка (или ожидание чужой) — в потоке."""
+        if self._value is not _UNSET:
+            return self._value
+        return await asyncio.to_thread(self.get)
+
+
+async def warm_up(steps: Sequence[Tuple[str, Callable[[], object]]]) -> Dict[str, float]:
+    """
+    Выполняет шаги по очереди в отдельном потоке — порядок задаёт, что будет
+    готово раньше. Ошибка шага логируется и не мешает остальным: то, что не
+    прогрелось, соберётся при первом запросе. Возвращает секунды по шагам.
+    """
+    timings: Dict[str, float] = {}
+    for name, step in steps:
+        started = time.perf_counter()
+        try:
+            await asyncio.to_thread(step)
+        except Exception:
+            log.exception("warm-up step %s failed", name)
+            continue
+        timings[name] = round(time.perf_counter() - started, 3)
+    log.info("warm-up done: %s", ", ".join(f"{k}={v:.3f}s" for k, v in timings.items()))
+    return timings
@@ -0,0 +1,117 @@
+# bench/common.py
+"""Общие части бенчмарков: пути, корпус вопросов, синтетическая база, статистика."""
+import random
+import sys
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+# реальные формулировки пользователей (с опечатками и без)
+HANDWRITTEN = [
+    "как вывести деньги",
+    "как вывисти деньги на карту",
+    "верификация",
+    "верефикация аккаунта не праходит",
+    "где история ставок",
+    "где находится истрия ставок",
+    "можно ли иметь два аккаунта",
+    "можно ли иметь два акаунта",
+    "как поменять пароль",
+    "личные данные профиля",
+    "депозит не пришёл",
+    "бонус на первый депозит",
+    "how to change password",
+    "how to chnage password",
+    "withdrawal limits",
+    "privacy policy",
+    "account settings",
+    "2fa",
+    "привет",
+    "напиши код на python",
+    "сколько будет 2+2",
+]
+
+OFF_TOPIC = ["напиши функцию на python", "sql запрос для базы данных", "как сделать for в javascript"]
+
+
+def percentile(sorted_values: Sequence[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """samples — длительности в секундах."""
+    s = sorted(samples)
+    total = sum(s)
+    return {
+        "ops": len(s),
+        "ops_per_sec": round(len(s) / total, 1) if total else 0.0,
+        "p50_us": round(percentile(s, 50) * 1e6, 1),
+        "p95_us": round(percentile(s, 95) * 1e6, 1),
+        "p99_us": round(percentile(s, 99) * 1e6, 1),
+    }
+
+
+def _typo(word: str, rnd: random.Random) -> str:
+    if len(word) < 4:
+        return word
+    i = rnd.randrange(1, len(word) - 1)
+    kind = rnd.randrange(3)
+    if kind == 0:                       # пропуск буквы
+        return word[:i] + word[i + 1:]
+    if kind == 1:                       # перестановка соседних
+        return word[:i - 1] + word[i] + word[i - 1] + word[i + 1:]
+    return word[:i] + rnd.choice("аеиоуыэюяao") + word[i + 1:]  # замена гласной
+
+
+def make_corpus(keywords: Sequence[str], size: int, seed: int = 1) -> List[str]:
+    """Смесь точных keyword'ов, keyword'ов внутри фразы, опечаток, офтопа и ручных вопросов."""
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(size):
+        kw = rnd.choice(keywords)
+        r = rnd.random()
+        if r < 0.25:
+            out.append(kw)
+        elif r < 0.45:
+            out.append(rnd.choice(["подскажите ", "как ", "где ", "а "]) + kw + rnd.choice(["", "?", " пожалуйста"]))
+        elif r < 0.70:
+            out.append(" ".join(_typo(w, rnd) for w in kw.split()))
+        elif r < 0.75:
+            out.append(rnd.choice(OFF_TOPIC))
+        else:
+            out.append(rnd.choice(HANDWRITTEN))
+    return out
+
+
+def synthetic_kb(navigation: List[Dict], rules: List[Dict], target_keywords: int, seed: int = 1):
+    """
+    Раздувает базу до ~target_keywords keyword'ов: копии реальных записей
+    с изменёнными keyword'ами (перестановка слов, суффиксы, номер копии).
+    Возвращает (navigation, rules).
+    """
+    rnd = random.Random(seed)
+    base = [("navigation", e) for e in navigation] + [("rules", e) for e in rules]
+    count = sum(len(e.get("keywords") or []) for _, e in base)
+    nav, rul = list(navigation), list(rules)
+    copy_no = 0
+    while count < target_keywords:
+        copy_no += 1
+        kind, entry = rnd.choice(base)
+        kws = []
+        for kw in entry.get("keywords") or []:
+            words = kw.split()
+            rnd.shuffle(words)
+            kws.append(" ".join(words) + f" {rnd.choice(['вариант', 'тема', 'раздел', 'item'])}{copy_no}")
+        answer = entry.get("answer")
+        if isinstance(answer, str):
+            answer = f"{answer} ({copy_no})"
+        elif isinstance(answer, dict):
+            answer = dict(answer, title=f"{answer.get('title')} {copy_no}")
+        (nav if kind == "navigation" else rul).append({"keywords": kws, "answer": answer})
+        count += len(kws)
+    return nav, rul
@@ -0,0 +1,394 @@
+# bench/fakes.py
+"""
+Локальные заглушки внешних API для нагрузочных проверок без сети (aiohttp).
+
+FakeBotAPI — Bot API по адресу {url}/bot<token>/<method>: считает вызовы,
+сам соблюдает лимиты Telegram (на чат и общий) и отвечает на их нарушение
+429 с parameters.retry_after, как настоящий сервер; может дополнительно
+отвечать 429 на заданную долю запросов. Отдаёт апдейты через getUpdates
+(long polling): push_message() кладёт сообщение пользователя в очередь,
+wait_delivered() ждёт ответа бота в чат.
+
+FakeOpenAI — /v1/chat/completions (обычный ответ и поток SSE) с задержкой;
+может отвечать 429 / 503 с заголовком Retry-After на первые запросы
+(refuse_first) или на случайную долю всех (error_ratio).
+
+start_bot() — запустить main.py отдельным процессом против этих заглушек.
+
+    async with FakeBotAPI() as tg, FakeOpenAI() as ai:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(tg.url))
+        llm = AsyncLLM("test", base_url=ai.url + "/v1")
+"""
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+from common import ROOT
+
+
+# запросы, пришедшие в течение GRACE секунд после отказа, считаются отправленными до него (уже были в пути)
+GRACE = 0.1
+
+
+class _Bucket:
+    def __init__(self, rate: float, burst: float, jitter: float = 0.05):
+        self.rate, self.burst = rate, burst
+        self.tokens, self.updated = burst, time.monotonic()
+        # настоящий сервер считает лимит грубо; точное ведро отвергало бы запросы из-за сетевого разброса
+        self.slack = rate * jitter
+
+    def take(self) -> float:
+        """0 — можно; иначе сколько секунд осталось ждать. rate <= 0 — без ограничения."""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1 - self.slack:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class _Server:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host, self.port = host, port
+        self._runner: Optional[web.AppRunner] = None
+        self.url = ""
+
+    def app(self) -> web.Application:
+        raise NotImplementedError
+
+    async def __aenter__(self):
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{self.host}:{port}"
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._runner.cleanup()
+
+
+class FakeBotAPI(_Server):
+    def __init__(
+        self,
+        chat_rate: float = 1.0,
+        chat_burst: float = 3.0,
+        global_rate: float = 30.0,
+        flood_ratio: float = 0.0,
+        flood_retry_after: int = 1,
+        refuse_first: int = 0,
+        latency: float = 0.0,
+        seed: int = 1,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.chat_rate, self.chat_burst = chat_rate, chat_burst
+        self.global_bucket = _Bucket(global_rate, global_rate)
+        self.flood_ratio = flood_ratio
+        self.refuse_first = refuse_first  # первые N отправок получают 429 с flood_retry_after
+        self.flood_retry_after = flood_retry_after
+        self.latency = latency
+        self.rnd = random.Random(seed)
+        self._chats: Dict[object, _Bucket] = {}
+        self._paused: Dict[object, Tuple[float, float]] = {}  # чат -> (когда отказали, до какого момента)
+        self._message_id = 0
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.delivered: Dict[object, List[str]] = defaultdict(list)
+        self.refused = 0        # ответили 429
+        self.early_retries = 0  # повтор пришёл раньше, чем истёк retry_after
+        self.updates: List[Dict] = []
+        self.dropped = 0  # апдейты, выброшенные deleteWebhook(drop_pending_updates=True)
+        self._update_id = 0
+        self._has_updates = asyncio.Event()
+        self.delivered_at: Dict[object, List[float]] = defaultdict(list)  # time.time() каждого ответа в чат
+        # чат -> [(сколько ответов ждём, future)]: будим только ждущих этот чат, а не всех
+        self._waiters: Dict[object, List[Tuple[int, asyncio.Future]]] = defaultdict(list)
+
+    def _push(self, kind: str, payload: Dict) -> int:
+        self._update_id += 1
+        self.updates.append({"update_id": self._update_id, kind: payload})
+        self._has_updates.set()
+        return self._update_id
+
+    @staticmethod
+    def _user(chat_id: int, first_name: str) -> Dict:
+        return {"id": chat_id, "is_bot": False, "first_name": first_name}
+
+    def push_message(self, chat_id: int, text: str, first_name: str = "user") -> int:
+        """Сообщение пользователя chat_id (личный чат); номер апдейта."""
+        self._message_id += 1
+        return self._push("message", {
+            "message_id": self._message_id, "date": int(time.time()), "text": text,
+            "chat": {"id": chat_id, "type": "private", "first_name": first_name},
+            "from": self._user(chat_id, first_name),
+        })
+
+    def push_callback(self, chat_id: int, data: str, first_name: str = "user") -> int:
+        """Нажатие inline-кнопки с callback_data под последним сообщением бота в чате."""
+        message_id = self._message_id
+        return self._push("callback_query", {
+            "id": str(self._update_id + 1), "chat_instance": str(chat_id), "data": data,
+            "from": self._user(chat_id, first_name),
+            "message": {
+                "message_id": message_id, "date": int(time.time()), "text": "…",
+                "chat": {"id": chat_id, "type": "private", "first_name": first_name},
+            },
+        })
+
+    async def wait_delivered(self, chat_id, count: int = 1, timeout: float = 30.0) -> bool:
+        """Дождаться, пока в чат уйдёт count сообщений (send / edit); False по таймауту."""
+        if len(self.delivered[chat_id]) >= count:
+            return True
+        future = asyncio.get_running_loop().create_future()
+        waiter = (count, future)
+        self._waiters[chat_id].append(waiter)
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            waiters = self._waiters.get(chat_id)
+            if waiters and waiter in waiters:
+                waiters.remove(waiter)
+            if not waiters:
+                self._waiters.pop(chat_id, None)
+
+    def _wake(self, chat_id):
+        delivered = len(self.delivered[chat_id])
+        for count, future in self._waiters.get(chat_id, ()):
+            if delivered >= count and not future.done():
+                future.set_result(True)
+
+    async def _get_updates(self, params: Dict) -> List[Dict]:
+        offset = int(params.get("offset") or 0)
+        # подтверждённые (offset больше их номера) больше не отдаём
+        if self.updates and self.updates[0]["update_id"] < offset:
+            self.updates = [u for u in self.updates if u["update_id"] >= offset]
+        deadline = time.monotonic() + float(params.get("timeout") or 0)
+        while not self.updates and time.monotonic() < deadline:
+            self._has_updates.clear()
+            try:
+                await asyncio.wait_for(self._has_updates.wait(), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                break
+        return self.updates[: int(params.get("limit") or 100)]
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self.handle)
+        return app
+
+    @staticmethod
+    async def _params(request: web.Request) -> Dict:
+        if request.content_type == "application/json":
+            return await request.json()
+        data = dict(await request.post()) if request.can_read_body else {}
+        return {k: v for k, v in data.items() if isinstance(v, str)}
+
+    def _flood(self, chat_id, wait: float) -> web.Response:
+        self.refused += 1
+        now = time.monotonic()
+        self._paused[chat_id] = (now, now + max(1, math.ceil(wait)))
+        return self._flood_response(wait)
+
+    @staticmethod
+    def _flood_response(wait: float) -> web.Response:
+        retry_after = max(1, math.ceil(wait))
+        return web.json_response({
+            "ok": False,
+            "error_code": 429,
+            "description": f"Too Many Requests: retry after {retry_after}",
+            "parameters": {"retry_after": retry_after},
+        }, status=429)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        params = await self._params(request)
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method == "getupdates":
+            return web.json_response({"ok": True, "result": await self._get_updates(params)})
+        if method == "deletewebhook" and str(params.get("drop_pending_updates")).lower() in ("1", "true"):
+            self.dropped += len(self.updates)
+            self.updates = []
+        chat_id = params.get("chat_id")
+        if chat_id is not None:
+            chat_id = int(chat_id) if str(chat_id).lstrip("-").isdigit() else chat_id
+            refused_at, until = self._paused.get(chat_id, (0.0, 0.0))
+            now = time.monotonic()
+            if now < until:
+                if now - refused_at > GRACE:
+                    self.early_retries += 1
+                self.refused += 1
+                return self._flood_response(until - now)
+            if self.refuse_first > 0 or (self.flood_ratio and self.rnd.random() < self.flood_ratio):
+                self.refuse_first -= 1
+                return self._flood(chat_id, self.flood_retry_after)
+            chat = self._chats.get(chat_id)
+            if chat is None:
+                chat = self._chats[chat_id] = _Bucket(self.chat_rate, self.chat_burst)
+            wait = max(chat.take(), self.global_bucket.take())
+            if wait:
+                return self._flood(chat_id, wait)
+        return web.json_response({"ok": True, "result": self._result(method, chat_id, params)})
+
+    def _result(self, method: str, chat_id, params: Dict):
+        if method in ("sendmessage", "editmessagetext"):
+            if method == "sendmessage":
+                self._message_id += 1
+                message_id = self._message_id
+            else:
+                message_id = int(params.get("message_id") or 0)
+            text = params.get("text", "")
+            self.delivered[chat_id].append(text)
+            self.delivered_at[chat_id].append(time.time())
+            self._wake(chat_id)
+            chat = {"id": chat_id, "type": "private" if isinstance(chat_id, int) and chat_id > 0 else "group"}
+            if chat["type"] == "group":
+                chat["title"] = "group"
+            return {"message_id": message_id, "date": int(time.time()), "chat": chat, "text": text}
+        if method == "getme":
+            return {"id": 1, "is_bot": True, "first_name": "fake", "username": "fake_bot"}
+        return True
+
+
+class FakeOpenAI(_Server):
+    def __init__(
+        self,
+        latency: float = 0.05,
+        refuse_first: int = 0,
+        refuse_status: int = 429,
+        retry_after: Optional[float] = 1.0,
+        error_ratio: float = 0.0,
+        jitter: float = 0.0,
+        seed: int = 1,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.refuse_first = refuse_first
+        self.refuse_status = refuse_status
+        self.retry_after = retry_after
+        self.error_ratio = error_ratio
+        self.jitter = jitter  # задержка равномерно в latency ± jitter
+        self.rnd = random.Random(seed)
+        self.calls = 0
+        self.answered = 0
+        self.refused = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0  # сколько запросов максимум генерировались одновременно
+        self.request_times: List[float] = []
+        self.refused_at = 0.0
+        self.refused_until = 0.0
+        self.early_retries = 0  # запрос пришёл до конца Retry-After (и не был уже в пути)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.calls += 1
+        now = time.monotonic()
+        self.request_times.append(now)
+        if now < self.refused_until and now - self.refused_at > GRACE:
+            self.early_retries += 1
+        if self.refused < self.refuse_first or (self.error_ratio and self.rnd.random() < self.error_ratio):
+            self.refused += 1
+            headers = {}
+            if self.retry_after is not None:
+                headers["Retry-After"] = str(self.retry_after)
+                # GRACE отсчитывается от последнего отказа: запросы, ушедшие до него, ещё могли быть в пути
+                self.refused_at = now
+                self.refused_until = max(self.refused_until, now + self.retry_after)
+            return web.json_response(
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                status=self.refuse_status,
+                headers=headers,
+            )
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(max(0.0, self.latency + self.rnd.uniform(-self.jitter, self.jitter)))
+        finally:
+            self.in_flight -= 1
+        self.answered += 1
+        question = body["messages"][-1]["content"][-80:]
+        text = f"Ответ: {question}"
+        if body.get("stream"):
+            return await self._stream(request, body, text)
+        return web.json_response({
+            "id": f"chatcmpl-{self.calls}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+        })
+
+    async def _stream(self, request: web.Request, body: Dict, text: str) -> web.StreamResponse:
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await resp.prepare(request)
+        base = {"id": f"chatcmpl-{self.calls}", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": body.get("model", "fake")}
+        for word in text.split(" "):
+            chunk = dict(base, choices=[{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}])
+            await resp.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            await asyncio.sleep(self.latency / 10)
+        usage = dict(base, choices=[], usage={"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120})
+        await resp.write(f"data: {json.dumps(usage)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+        await resp.write_eof()
+        return resp
+
+
+# дочерний процесс: отметка времени до и после import main, затем обычный запуск в режиме polling
+BOT_CHILD = """
+import json, sys, time
+started = time.time()
+sys.path.insert(0, {root!r})
+import main
+print(json.dumps({{"started": started, "imported": time.time()}}), flush=True)
+main.asyncio.run(main.main())
+"""
+
+
+async def start_bot(tg_url: str, ai_url: str, stderr=asyncio.subprocess.DEVNULL, **env) -> asyncio.subprocess.Process:
+    """
+    main.py в отдельном процессе: Bot API и модель — заглушки, всё лишнее
+    (перезагрузка базы, метрики, кэш на диске) выключено. env дополняет или
+    переопределяет переменные окружения; первая строка stdout — JSON с отметками времени.
+    """
+    # значения по умолчанию для прогона; env их переопределяет (например, SESSION_BACKEND=sqlite)
+    base = dict(
+        BOT_TOKEN="42:fake",
+        BOT_MODE="polling",
+        TELEGRAM_API_URL=tg_url,
+        OPENAI_API_KEY="test",
+        OPENAI_BASE_URL=ai_url + "/v1",
+        SESSION_BACKEND="",
+        ANSWER_CACHE_PATH="",
+        KB_RELOAD_INTERVAL="0",
+        METRICS_PORT="0",
+        COALESCE_WINDOW="0",
+        LLM_STREAMING="0",
+    )
+    return await asyncio.create_subprocess_exec(
+        sys.executable, "-c", BOT_CHILD.format(root=str(ROOT)),
+        env=dict(os.environ, **dict(base, **{k: str(v) for k, v in env.items()})),
+        stdout=asyncio.subprocess.PIPE, stderr=stderr,
+    )
@@ -0,0 +1,125 @@
+# bench/fuzzy.py
+"""
+Сверка нечёткого уровня поиска с прежним путём через difflib:
+  - по keyword'ам: FuzzyIndex (кандидаты по символам + проверка difflib)
+    против полного прохода SequenceMatcher по всем keyword'ам;
+  - целиком: KeywordIndex.search против прежнего search_matches (цикл по всем
+    записям и keyword'ам: точное, вхождение, пересечение токенов, difflib).
+Вопросы — точные keyword'ы, keyword'ы внутри фразы, опечатки и ручные
+формулировки (common.make_corpus), для обоих устройств. Печатается число
+расхождений и время обоих путей. Код выхода 1, если есть расхождения.
+
+    python bench/fuzzy.py
+    python bench/fuzzy.py --queries 600 --seed 3
+"""
+import argparse
+import difflib
+import re
+import sys
+import time
+from typing import Dict, List, Set, Tuple
+
+from common import make_corpus  # (добавляет корень репозитория в sys.path)
+
+from ai_responder.index import FUZZY_THRESHOLD, OVERLAP_THRESHOLD, KeywordIndex, normalize, title_of  # noqa: E402
+from ai_responder.kb import build_kb  # noqa: E402
+from ai_responder.paths import KB_SOURCES  # noqa: E402
+
+
+def legacy_fuzzy(q: str, keywords: List[str]) -> Set[int]:
+    return {
+        kw_id for kw_id, kw in enumerate(keywords)
+        if difflib.SequenceMatcher(None, q, kw).ratio() >= FUZZY_THRESHOLD
+    }
+
+
+def _overlap(a: str, b: str) -> float:
+    a_tokens = set(re.findall(r'\w+', a))
+    b_tokens = set(re.findall(r'\w+', b))
+    if not a_tokens or not b_tokens:
+        return 0.0
+    return len(a_tokens & b_tokens) / max(len(a_tokens), len(b_tokens))
+
+
+def legacy_search(question: str, navigation: List[Dict], rules: List[Dict]) -> List[Tuple[str, str, str]]:
+    """Прежний search_matches: (type, title, value) в порядке выдачи."""
+    q = normalize(question)
+    matches, exact = [], []
+    for item_type, items in (("navigation", navigation), ("rules", rules)):
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            val = item.get("answer") if item.get("answer") is not None else item.get("hint", "")
+            for kw in item.get("keywords", []) or []:
+                kw_l = normalize(kw)
+                if kw_l and q == kw_l:
+                    exact.append((item_type, title_of(item, kw_l), str(val)))
+                    break
+                if (kw_l and kw_l in q) or _overlap(q, kw_l) >= OVERLAP_THRESHOLD or \
+                        difflib.SequenceMatcher(None, q, kw_l).ratio() >= FUZZY_THRESHOLD:
+                    matches.append((item_type, title_of(item, kw_l), str(val)))
+                    break
+    if exact:
+        return exact
+    unique, seen = [], set()
+    for m in matches:
+        if (m[0], m[2]) not in seen:
+            seen.add((m[0], m[2]))
+            unique.append(m)
+    return unique
+
+
+def fuzzy_parity(index: KeywordIndex, corpus: List[str]) -> Dict[str, float]:
+    """Нечёткий индекс против полного прохода difflib по всем keyword'ам."""
+    mismatches = 0
+    brute_s = fast_s = 0.0
+    for q in corpus:
+        q = normalize(q)
+        started = time.perf_counter()
+        brute = legacy_fuzzy(q, index.keywords)
+        brute_s += time.perf_counter() - started
+        started = time.perf_counter()
+        fast = {kw_id for kw_id in index.fuzzy.candidates(q) if index.fuzzy.is_match(q, kw_id)}
+        fast_s += time.perf_counter() - started
+        mismatches += brute != fast
+    return {"queries": len(corpus), "mismatches": mismatches,
+            "difflib_s": round(brute_s, 3), "index_s": round(fast_s, 3)}
+
+
+def search_parity(index: KeywordIndex, navigation: List[Dict], rules: List[Dict], corpus: List[str]) -> Dict:
+    mismatches = []
+    legacy_s = fast_s = 0.0
+    for q in corpus:
+        started = time.perf_counter()
+        old = legacy_search(q, navigation, rules)
+        legacy_s += time.perf_counter() - started
+        started = time.perf_counter()
+        new = [(m["type"], m["title"], str(m["value"])) for m in index.search(q)]
+        fast_s += time.perf_counter() - started
+        if old != new:
+            mismatches.append(q)
+    return {"queries": len(corpus), "mismatches": len(mismatches), "examples": mismatches[:5],
+            "legacy_s": round(legacy_s, 3), "index_s": round(fast_s, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fuzzy index vs the legacy per-keyword difflib path")
+    parser.add_argument("--queries", type=int, default=150, help="вопросов на устройство")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    kb = build_kb(KB_SOURCES)
+    failed = False
+    for device, navigation in (("desktop", kb.navigation_desktop), ("mobile", kb.navigation_mobile)):
+        index = kb.index(device)
+        corpus = make_corpus(index.keywords, args.queries, seed=args.seed)
+        keywords = fuzzy_parity(index, corpus)
+        search = search_parity(index, navigation, kb.rules, corpus)
+        failed |= bool(keywords["mismatches"] or search["mismatches"])
+        print(f"{device:<8} keywords: {keywords}")
+        print(f"{device:<8} search:   {search}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# bench/llm_concurrency.py
+"""
+Параллельность пути через модель: N пользователей одновременно задают вопросы,
+ответ на которые очеловечивает модель (ask_ai -> AsyncLLM -> локальная заглушка
+OpenAI из bench/fakes.py с задержкой --latency). Ожидание модели не блокирует
+event loop и чужие чаты, поэтому N вопросов отвечаются примерно за одну
+задержку (за одну «волну» на каждые --concurrency вызовов), а не за N.
+
+    python bench/llm_concurrency.py
+    python bench/llm_concurrency.py --users 64 --latency 0.5
+
+Печатается время одного вопроса, всех N одновременно, ожидание каждого
+пользователя (p50/max) и сколько запросов заглушка видела одновременно.
+Код выхода 1, если N вопросов заняли больше --max-ratio «волн» одного вызова
+или ответил не модель.
+"""
+import argparse
+import asyncio
+import math
+import os
+import sys
+import time
+from typing import Tuple
+
+from common import percentile  # (добавляет корень репозитория в sys.path)
+from fakes import FakeOpenAI
+
+os.environ.setdefault("MATCHING_MODE", "inline")
+os.environ["ANSWER_CACHE_PATH"] = ""  # только кэш в памяти: повторные запуски не должны попадать в старые ответы
+
+from bot.config import OPENAI_MAX_CONCURRENCY  # noqa: E402
+from ai_responder import llm as llm_module  # noqa: E402
+from ai_responder import responder  # noqa: E402
+from ai_responder.llm import AsyncLLM  # noqa: E402
+
+# ответ из базы — строка, которую очеловечивает модель; номер делает вопросы разными
+# (иначе их объединили бы кэш ответов и single-flight)
+QUESTION = "верификация"
+
+
+async def ask(user_id: int, text: str) -> Tuple[float, str]:
+    started = time.perf_counter()
+    answer = await responder.ask_ai(user_id, text)
+    return time.perf_counter() - started, str(answer)
+
+
+async def run(args):
+    async with FakeOpenAI(latency=args.latency) as ai:
+        llm_module._llm = AsyncLLM("test", base_url=ai.url + "/v1", max_concurrency=args.concurrency)
+        try:
+            for user_id in range(args.users + 1):
+                responder.sessions.mark_seen(user_id)
+                responder.sessions.set_device(user_id, "desktop")
+            single, _ = await ask(0, f"{QUESTION} (один вопрос)")
+            started = time.perf_counter()
+            results = await asyncio.gather(*(
+                ask(user_id, f"{QUESTION} вопрос {user_id}") for user_id in range(1, args.users + 1)
+            ))
+            total = time.perf_counter() - started
+        finally:
+            await llm_module._llm.aclose()
+            llm_module._llm = None
+    return single, total, results, ai
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent ask_ai calls against a fake completion server")
+    parser.add_argument("--users", type=int, default=OPENAI_MAX_CONCURRENCY, help="одновременных вопросов")
+    parser.add_argument("--concurrency", type=int, default=OPENAI_MAX_CONCURRENCY,
+                        help="одновременных вызовов модели (OPENAI_MAX_CONCURRENCY)")
+    parser.add_argument("--latency", type=float, default=0.3, help="задержка заглушки OpenAI, сек")
+    parser.add_argument("--max-ratio", type=float, default=1.5, help="допустимое время N вопросов в «волнах» одного")
+    args = parser.parse_args()
+
+    single, total, results, ai = asyncio.run(run(args))
+    waits = sorted(w for w, _ in results)
+    waves = math.ceil(args.users / args.concurrency)
+    from_model = sum(answer.startswith("Ответ:") for _, answer in results)
+    ok = total <= single * waves * args.max_ratio and from_model == args.users
+
+    print(f"one question:  {single:.3f}s")
+    print(f"{args.users} at once: {total:.3f}s  (x{total / single:.2f} of one; {waves} wave(s) of {args.concurrency}; "
+          f"sequential would be ~{single * args.users:.1f}s)")
+    print(f"per user wait: p50 {percentile(waits, 50):.3f}s  max {waits[-1]:.3f}s")
+    print(f"fake openai: calls={ai.calls} answered={ai.answered} peak_in_flight={ai.peak_in_flight}; "
+          f"answered by the model: {from_model}/{args.users}")
+    print("ok" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
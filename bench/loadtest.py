@@ -0,0 +1,314 @@
+# bench/loadtest.py
+"""
+Нагрузочный прогон бота целиком без сети: main.py запускается отдельным
+процессом (один воркер, polling) против локальных заглушек Bot API и OpenAI
+(bench/fakes.py), а тысячи имитированных пользователей проходят обычный
+путь: /start, выбор устройства (кнопкой или текстом), вопросы (ответ из
+базы, ответ через модель, несколько вариантов с выбором, не по теме, не
+найдено). Каждый пользователь ждёт ответа на своё сообщение и «думает»
+перед следующим.
+
+    python bench/loadtest.py
+    python bench/loadtest.py --users 5000 --ramp 30 --questions 5
+    python bench/loadtest.py --llm-latency 1.5 --llm-errors 0.05 --tg-flood 0.01
+    python bench/loadtest.py --env MATCHING_MODE=process --env MATCHING_WORKERS=2 --out load.json
+
+Печатает пропускную способность (ответов в секунду), задержку от апдейта до
+ответа бота по типам шагов (p50/p95/p99), таймауты, память (RSS, пик) и
+процессорное время процесса бота, а также счётчики заглушек.
+Код выхода 1, если доля шагов без ответа больше --max-timeouts.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from common import percentile  # (добавляет корень репозитория в sys.path)
+from fakes import FakeBotAPI, FakeOpenAI, start_bot  # noqa: E402
+
+from ai_responder.kb import build_kb  # noqa: E402
+from ai_responder.paths import KB_SOURCES  # noqa: E402
+
+OFF_TOPIC = ["напиши функцию на python", "sql запрос для базы данных", "как сделать for в javascript"]
+UNKNOWN = ["какая погода завтра", "посоветуй фильм", "что такое квазар", "сколько стоит билет в кино"]
+CHOICES = ["1", "2", "первый", "второй", "1)"]
+
+
+def question_pools(sample: int, seed: int) -> Dict[str, List[str]]:
+    """Вопросы из keyword'ов базы, разложенные по тому, какой путь ответа они вызовут."""
+    kb = build_kb(KB_SOURCES)
+    index = kb.index("desktop")
+    rnd = random.Random(seed)
+    keywords = rnd.sample(index.keywords, min(sample, len(index.keywords)))
+    pools: Dict[str, List[str]] = {"kb": [], "llm": [], "choice": [], "off_topic": OFF_TOPIC, "unknown": UNKNOWN}
+    for kw in keywords:
+        found = index.search(kw)
+        if len(found) > 1:
+            pools["choice"].append(kw)
+        elif len(found) == 1:
+            pools["kb" if isinstance(found[0]["value"], dict) else "llm"].append(kw)
+    return pools
+
+
+class Stats:
+    def __init__(self):
+        self.latency: Dict[str, List[float]] = defaultdict(list)
+        self.timeouts: Dict[str, int] = defaultdict(int)
+        self.first = self.last = None
+
+    def add(self, kind: str, seconds: Optional[float]):
+        if seconds is None:
+            self.timeouts[kind] += 1
+            return
+        now = time.monotonic()
+        self.first = self.first or now
+        self.last = now
+        self.latency[kind].append(seconds)
+
+    @property
+    def replies(self) -> int:
+        return sum(len(v) for v in self.latency.values())
+
+
+class User:
+    def __init__(self, chat_id: int, tg: FakeBotAPI, stats: Stats, pools: Dict[str, List[str]], args, rnd: random.Random):
+        self.chat_id, self.tg, self.stats, self.pools, self.args, self.rnd = chat_id, tg, stats, pools, args, rnd
+        self.expected = 0
+
+    async def step(self, kind: str, text: str = "", callback: str = "") -> bool:
+        self.expected += 1
+        started = time.monotonic()
+        if callback:
+            self.tg.push_callback(self.chat_id, callback)
+        else:
+            self.tg.push_message(self.chat_id, text)
+        ok = await self.tg.wait_delivered(self.chat_id, self.expected, timeout=self.args.timeout)
+        self.stats.add(kind, time.monotonic() - started if ok else None)
+        if ok:
+            # в чат могли уйти лишние сообщения (длинный ответ частями) — дальше считаем от факта
+            self.expected = len(self.tg.delivered[self.chat_id])
+        return ok
+
+    async def think(self):
+        await asyncio.sleep(self.rnd.expovariate(1 / self.args.think) if self.args.think > 0 else 0)
+
+    async def run(self):
+        if not await self.step("start", "/start"):
+            return
+        await self.think()
+        device = self.rnd.choice(("mobile", "desktop"))
+        if self.rnd.random() < 0.5:
+            ok = await self.step("device_callback", callback=f"device:{device}")
+        else:
+            ok = await self.step("device_text", "📱 Смартфон" if device == "mobile" else "💻 Компьютер")
+        if not ok:
+            return
+        kinds, weights = zip(*[(k, w) for k, w in self.args.mix.items() if self.pools.get(k)])
+        for _ in range(self.args.questions):
+            await self.think()
+            kind = self.rnd.choices(kinds, weights)[0]
+            if not await self.step(kind, self.rnd.choice(self.pools[kind])):
+                return
+            if kind == "choice":
+                await self.think()
+                if not await self.step("choice_pick", self.rnd.choice(CHOICES)):
+                    return
+
+
+class ProcessProbe:
+    """RSS и процессорное время процесса бота из /proc (Linux); без /proc — пусто."""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.max_rss = 0
+        self._tick = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+    def _status(self) -> Dict[str, int]:
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                return {k: int(v.split()[0]) * 1024 for k, v in (line.split(":", 1) for line in f)
+                        if k in ("VmRSS", "VmHWM")}
+        except (OSError, ValueError):
+            return {}
+
+    def cpu_seconds(self) -> Optional[float]:
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / self._tick  # utime + stime
+        except (OSError, IndexError, ValueError):
+            return None
+
+    def sample(self) -> Dict[str, int]:
+        status = self._status()
+        self.max_rss = max(self.max_rss, status.get("VmRSS", 0))
+        return status
+
+    async def run(self, interval: float = 0.5):
+        while True:
+            self.sample()
+            await asyncio.sleep(interval)
+
+
+def parse_env(pairs: List[str]) -> Dict[str, str]:
+    env = {}
+    for pair in pairs:
+        key, sep, value = pair.partition("=")
+        if not sep:
+            raise SystemExit(f"--env expects KEY=VALUE, got {pair!r}")
+        env[key] = value
+    return env
+
+
+async def load(args) -> Tuple[Dict, bool]:
+    pools = question_pools(args.sample, args.seed)
+    stats = Stats()
+    global_rate = args.global_rate if args.global_rate > 0 else 0
+    async with FakeBotAPI(
+        chat_rate=args.chat_rate, chat_burst=3, global_rate=global_rate,
+        flood_ratio=args.tg_flood, latency=args.tg_latency, seed=args.seed,
+    ) as tg, FakeOpenAI(
+        latency=args.llm_latency, jitter=args.llm_jitter, error_ratio=args.llm_errors,
+        refuse_status=args.llm_error_status, retry_after=1.0 if args.llm_error_status == 429 else None,
+        seed=args.seed,
+    ) as ai:
+        env = dict(
+            TELEGRAM_GLOBAL_RATE=global_rate,
+            TELEGRAM_CHAT_RATE=args.chat_rate,
+            SESSION_MAX_USERS=max(100_000, args.users * 2),
+        )
+        env.update(parse_env(args.env))
+        spawned = time.monotonic()
+        proc = await start_bot(tg.url, ai.url, stderr=None if args.verbose else asyncio.subprocess.DEVNULL, **env)
+        probe = ProcessProbe(proc.pid)
+        sampler = None
+        try:
+            await asyncio.wait_for(proc.stdout.readline(), args.timeout)
+            # бот готов, когда ответил на первое сообщение
+            tg.push_message(1, "/start")
+            if not await tg.wait_delivered(1, 1, timeout=args.timeout):
+                raise RuntimeError("bot did not answer the readiness probe")
+            ready = time.monotonic() - spawned
+            idle = probe.sample()
+            cpu_before = probe.cpu_seconds()
+            sampler = asyncio.create_task(probe.run())
+
+            rnd = random.Random(args.seed)
+            users = [User(1000 + n, tg, stats, pools, args, random.Random(rnd.random())) for n in range(args.users)]
+
+            async def arrive(user: User, delay: float):
+                await asyncio.sleep(delay)
+                await user.run()
+
+            started = time.monotonic()
+            harness_cpu = time.process_time()
+            await asyncio.gather(*(arrive(u, args.ramp * n / max(1, args.users)) for n, u in enumerate(users)))
+            elapsed = time.monotonic() - started
+            harness_cpu = time.process_time() - harness_cpu
+            final = probe.sample()
+            cpu_after = probe.cpu_seconds()
+        finally:
+            if sampler is not None:
+                sampler.cancel()
+            proc.terminate()
+            await proc.wait()
+
+    busy = (stats.last - stats.first) if stats.first and stats.last and stats.last > stats.first else elapsed
+    steps = {}
+    for kind in sorted(set(stats.latency) | set(stats.timeouts)):
+        s = sorted(stats.latency.get(kind, []))
+        steps[kind] = {
+            "replies": len(s),
+            "timeouts": stats.timeouts.get(kind, 0),
+            "p50_ms": round(percentile(s, 50) * 1000, 1),
+            "p95_ms": round(percentile(s, 95) * 1000, 1),
+            "p99_ms": round(percentile(s, 99) * 1000, 1),
+        }
+    timeouts = sum(stats.timeouts.values())
+    cpu = (cpu_after - cpu_before) if cpu_before is not None and cpu_after is not None else None
+    result = {
+        "meta": {
+            "users": args.users, "questions": args.questions, "ramp_s": args.ramp, "think_s": args.think,
+            "llm_latency_s": args.llm_latency, "llm_errors": args.llm_errors, "tg_flood": args.tg_flood,
+            "env": parse_env(args.env), "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "ready_s": round(ready, 2),
+        "elapsed_s": round(elapsed, 2),
+        "replies": stats.replies,
+        "timeouts": timeouts,
+        "throughput_rps": round(stats.replies / busy, 1) if busy else 0.0,
+        "steps": steps,
+        "memory_mb": {
+            "idle_rss": round(idle.get("VmRSS", 0) / 2 ** 20, 1),
+            "max_rss": round(probe.max_rss / 2 ** 20, 1),
+            "peak_hwm": round(final.get("VmHWM", 0) / 2 ** 20, 1),
+            "per_user_kb": round((probe.max_rss - idle.get("VmRSS", 0)) / 1024 / max(1, args.users), 1),
+        },
+        "cpu": {"seconds": round(cpu, 2), "utilization": round(cpu / elapsed, 2)} if cpu is not None else None,
+        # заглушки и пользователи живут в одном процессе: если он упёрся в ядро, задержки завышены им, а не ботом
+        "harness_cpu": round(harness_cpu / elapsed, 2),
+        "telegram": {"calls": dict(tg.calls), "refused_429": tg.refused, "early_retries": tg.early_retries},
+        "openai": {"calls": ai.calls, "answered": ai.answered, "refused": ai.refused, "early_retries": ai.early_retries},
+    }
+    total = stats.replies + timeouts
+    return result, (timeouts / total if total else 1.0) <= args.max_timeouts
+
+
+def report(r: Dict):
+    print(f"users={r['meta']['users']} ready={r['ready_s']}s elapsed={r['elapsed_s']}s "
+          f"replies={r['replies']} timeouts={r['timeouts']} throughput={r['throughput_rps']} replies/s")
+    print(f"{'step':<16} {'replies':>8} {'timeouts':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for kind, s in r["steps"].items():
+        print(f"{kind:<16} {s['replies']:>8} {s['timeouts']:>8} {s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f} {s['p99_ms']:>9.1f}")
+    m = r["memory_mb"]
+    print(f"memory: idle {m['idle_rss']} MB, max {m['max_rss']} MB, peak {m['peak_hwm']} MB, ~{m['per_user_kb']} KB/user")
+    if r["cpu"]:
+        print(f"cpu: {r['cpu']['seconds']}s ({r['cpu']['utilization'] * 100:.0f}% of one core)")
+    print(f"harness cpu: {r['harness_cpu'] * 100:.0f}% of one core"
+          + ("  (saturated: latencies include the harness itself)" if r["harness_cpu"] > 0.9 else ""))
+    print(f"telegram: {r['telegram']}")
+    print(f"openai: {r['openai']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end load test against fake Bot API / OpenAI servers")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--ramp", type=float, default=10.0, help="seconds over which users arrive")
+    parser.add_argument("--questions", type=int, default=3, help="questions per user after choosing a device")
+    parser.add_argument("--think", type=float, default=1.0, help="mean pause between a reply and the next message")
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds to wait for each reply")
+    parser.add_argument("--mix", default="kb=4,llm=3,choice=2,off_topic=1,unknown=1",
+                        help="question mix, kind=weight (kb, llm, choice, off_topic, unknown)")
+    parser.add_argument("--sample", type=int, default=400, help="keywords sampled to build question pools")
+    parser.add_argument("--llm-latency", type=float, default=0.8)
+    parser.add_argument("--llm-jitter", type=float, default=0.3)
+    parser.add_argument("--llm-errors", type=float, default=0.0, help="share of model calls answered with an error")
+    parser.add_argument("--llm-error-status", type=int, default=429, choices=(429, 500, 503))
+    parser.add_argument("--tg-latency", type=float, default=0.02)
+    parser.add_argument("--tg-flood", type=float, default=0.0, help="share of Bot API calls answered with 429")
+    parser.add_argument("--chat-rate", type=float, default=1.0, help="Telegram per-chat limit, messages/s")
+    parser.add_argument("--global-rate", type=float, default=0.0,
+                        help="Telegram global limit, messages/s (0 — off: measure the worker, not Telegram)")
+    parser.add_argument("--env", action="append", default=[], help="extra KEY=VALUE for the bot process")
+    parser.add_argument("--max-timeouts", type=float, default=0.01, help="allowed share of steps without a reply")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write the result as JSON")
+    parser.add_argument("--verbose", action="store_true", help="show the bot's log")
+    args = parser.parse_args()
+    args.mix = {k: float(w) for k, _, w in (p.partition("=") for p in args.mix.split(","))}
+
+    result, ok = asyncio.run(load(args))
+    report(result)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
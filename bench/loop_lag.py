@@ -0,0 +1,76 @@
+# bench/loop_lag.py
+"""
+Лаг event loop под синтетической конкурентной нагрузкой на поиск по базе.
+
+    python bench/loop_lag.py [--users 200] [--rounds 5] [--modes inline,thread,process]
+
+Для каждого режима MatchingService одновременно «пишут» --users пользователей
+(вопросы с опечатками — самый дорогой, fuzzy-путь), а LoopLagMonitor меряет,
+на сколько event loop не успевает проснуться вовремя. В режиме inline лаг
+равен длительности поиска; в thread/process loop остаётся отзывчивым.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from ai_responder.looplag import LoopLagMonitor  # noqa: E402
+from ai_responder.kb import load_kb  # noqa: E402
+from ai_responder.matching import MatchingService  # noqa: E402
+from ai_responder.paths import KB_SOURCES  # noqa: E402
+QUESTIONS = [
+    "как вывисти деньги на карту",
+    "верефикация аккаунта не праходит",
+    "где находится истрия ставок",
+    "можно ли иметь два акаунта",
+    "how to chnage password",
+    "личные данные профиля",
+]
+
+
+async def run_mode(mode: str, kb, users: int, rounds: int, workers: int) -> dict:
+    service = MatchingService(mode=mode, workers=workers, kb_paths=KB_SOURCES)
+    if mode != "inline":
+        await service.search("прогрев", "desktop", kb)  # поднять пул заранее
+    monitor = LoopLagMonitor(interval=0.005)
+    monitor.start()
+    await asyncio.sleep(0)  # монитор должен успеть заснуть до начала нагрузки
+    started = time.perf_counter()
+
+    async def user(i: int):
+        for r in range(rounds):
+            await service.search(QUESTIONS[(i + r) % len(QUESTIONS)], "mobile" if i % 2 else "desktop", kb)
+
+    await asyncio.gather(*(user(i) for i in range(users)))
+    elapsed = time.perf_counter() - started
+    await asyncio.sleep(monitor.interval * 2)  # дать монитору зафиксировать последний лаг
+    await monitor.stop()
+    service.shutdown()
+    report = {"mode": mode, "queries": users * rounds, "qps": round(users * rounds / elapsed, 1)}
+    report.update({f"lag_{k}": v for k, v in monitor.report().items()})
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Event loop lag under matching load")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--modes", default="inline,thread,process")
+    args = parser.parse_args()
+
+    kb = load_kb(KB_SOURCES)
+    results = [
+        asyncio.run(run_mode(mode, kb, args.users, args.rounds, args.workers))
+        for mode in args.modes.split(",")
+    ]
+    print(json.dumps(results, ensure_ascii=False, indent=1))
+
+
+if __name__ == "__main__":
+    main()
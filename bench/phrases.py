@@ -0,0 +1,196 @@
+# bench/phrases.py
+"""
+Микробенчмарк проверок по спискам фраз: прежние циклы с `in` против
+текущими проверками (PhraseMatcher из ai_responder/automaton.py для оффтопа,
+циклы с проверкой границ слова — в остальных местах) и, для сравнения,
+Automaton на чистом Python. Печатает ops/sec, p50/p95 в мкс и число расхождений с
+прежним поведением (ожидаемы: границы слов) с примерами. «same p50» — p50
+циклов / новой проверки только на входах, где ответ не изменился: там, где
+граница слова отсекла совпадение, новая проверка идёт дальше по списку
+и честно медленнее.
+
+    python bench/phrases.py
+    python bench/phrases.py --queries 20000
+"""
+import argparse
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+from common import HANDWRITTEN, OFF_TOPIC, make_corpus, summarize  # noqa: E402  (добавляет корень репозитория в sys.path)
+
+from ai_responder.automaton import Automaton  # noqa: E402
+from ai_responder.kb import build_kb  # noqa: E402
+from ai_responder.index import KeywordIndex  # noqa: E402
+from ai_responder.matching import OFF_TOPIC_KEYWORDS, is_off_topic, parse_choice  # noqa: E402
+from ai_responder.paths import KB_SOURCES  # noqa: E402
+from ai_responder.responder import device_from_text  # noqa: E402
+from handlers.messages import FALLBACK_PHRASES  # noqa: E402
+
+# --- прежние реализации (циклы с `in` без границ слова) ---
+
+LEGACY_FALLBACK = [
+    "не могу", "не смог", "не нашел", "не нашёл", "не понимаю",
+    "не найдено", "не удалось найти", "извините, я не могу", "не могу помочь"
+]
+
+
+def legacy_off_topic(question: str) -> bool:
+    q = (question or "").lower()
+    for kw in OFF_TOPIC_KEYWORDS:
+        if kw in q:
+            return True
+    return False
+
+
+def legacy_fallback(text: str) -> bool:
+    t = text.strip().lower()
+    for p in LEGACY_FALLBACK:
+        if p in t:
+            return True
+    return False
+
+
+def legacy_device(text: str) -> Optional[str]:
+    t = text.lower()
+    if any(x in t for x in ("смартфон", "телефон", "mobile", "мобил")):
+        return "mobile"
+    if any(x in t for x in ("компьютер", "пк", "desktop", "ноут")):
+        return "desktop"
+    return None
+
+
+def legacy_parse_choice(text: str, options: List[Dict]) -> Optional[int]:
+    if not text or not options:
+        return None
+    t = text.strip().lower()
+    map_num = {
+        "1": 0, "первое": 0, "первый": 0,
+        "2": 1, "второе": 1, "второй": 1,
+        "3": 2, "третье": 2, "третий": 2,
+        "4": 3, "четвёртое": 3, "четвертое": 3, "четвёртый": 3, "четвертый": 3,
+        "5": 4, "пятое": 4, "пятый": 4
+    }
+    if t in map_num and map_num[t] < len(options):
+        return map_num[t]
+    if "правил" in t or "правила" in t or "услов" in t or "можно" in t or "запрещ" in t:
+        for i, opt in enumerate(options):
+            if opt.get("type") == "rules":
+                return i
+    if "раздел" in t or "где" in t or "куда" in t or "найти" in t or "странице" in t or "зайти" in t:
+        for i, opt in enumerate(options):
+            if opt.get("type") == "navigation":
+                return i
+    for i, opt in enumerate(options):
+        title = (opt.get("title") or "").lower()
+        if title:
+            for word in title.split():
+                if word and word in t:
+                    return i
+    for token in t.replace(")", " ").replace(".", " ").split():
+        if token.isdigit():
+            idx = int(token) - 1
+            if 0 <= idx < len(options):
+                return idx
+    return None
+
+
+_automaton = Automaton()
+for _kw in OFF_TOPIC_KEYWORDS:
+    _automaton.add(_kw, _kw)
+_automaton.build()
+
+
+def automaton_off_topic(question: str) -> bool:
+    for _ in _automaton.find((question or "").lower()):
+        return True
+    return False
+
+
+def new_fallback(text: str) -> bool:
+    t = text.strip().lower()
+    for p in FALLBACK_PHRASES:
+        if p in t:
+            return True
+    return False
+
+
+# --- входные данные ---
+
+ANSWERS = [
+    "Перейдите в «Профиль» → «Вывод средств» и выберите способ.",
+    "Извините, я не могу помочь с этим вопросом.",
+    "Не нашёл информации по вашему вопросу.",
+    "Иметь два аккаунта нельзя: это запрещено правилами.",
+    "Верификация проходит в разделе «Личные данные» — загрузите документ.",
+    "К сожалению, не удалось найти такой раздел.",
+    "Невозможно изменить дату рождения самостоятельно, обратитесь в поддержку.",
+]
+DEVICE_REPLIES = ["смартфон", "с телефона", "мобильная версия", "компьютер", "пк", "с ноутбука", "ПКМ не работает",
+                  "не знаю", "desktop", "на планшете"]
+CHOICE_REPLIES = ["1", "второй", "правила", "где раздел", "нигде не нашёл", "вывод", "невозможно войти", "3)"]
+
+
+def run(fn: Callable, inputs: Sequence) -> Dict[str, float]:
+    samples = []
+    for item in inputs:
+        started = time.perf_counter()
+        fn(*item)
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def diff(old: Callable, new: Callable, inputs: Sequence, shown: int = 3):
+    changed = [(item, old(*item), new(*item)) for item in inputs]
+    changed = [c for c in changed if c[1] != c[2]]
+    seen, examples = set(), []
+    for item, a, b in changed:
+        key = item[0]
+        if key not in seen:
+            seen.add(key)
+            examples.append(f"{key!r}: {a} -> {b}")
+        if len(examples) >= shown:
+            break
+    return len(changed), examples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Phrase-list checks: legacy loops vs current checks")
+    parser.add_argument("--queries", type=int, default=5000)
+    args = parser.parse_args()
+
+    kb = build_kb(KB_SOURCES)
+    index = KeywordIndex(kb.navigation_desktop, kb.rules)
+    corpus = make_corpus(index.keywords, args.queries) + HANDWRITTEN + OFF_TOPIC + ["промокод", "google play", "формат"]
+    questions = [(q,) for q in corpus]
+    answers = [(ANSWERS[i % len(ANSWERS)],) for i in range(args.queries)]
+    devices = [(DEVICE_REPLIES[i % len(DEVICE_REPLIES)],) for i in range(args.queries)]
+    option_lists = [m for m in (index.search(q) for q in corpus[:300]) if len(m) > 1] or [[
+        {"type": "navigation", "title": "вывод средств", "value": "..."},
+        {"type": "rules", "title": "правила вывода", "value": "..."},
+    ]]
+    choices = [(CHOICE_REPLIES[i % len(CHOICE_REPLIES)], option_lists[i % len(option_lists)]) for i in range(args.queries)]
+
+    cases = [
+        ("is_off_topic", questions, legacy_off_topic, [("automaton", automaton_off_topic), ("phrases", is_off_topic)]),
+        ("fallback", answers, legacy_fallback, [("current", new_fallback)]),
+        ("device", devices, legacy_device, [("current", device_from_text)]),
+        ("parse_choice", choices, legacy_parse_choice, [("current", parse_choice)]),
+    ]
+    print(f"{'check':<14} {'impl':<10} {'ops/s':>10} {'p50 us':>8} {'p95 us':>8} {'changed':>8} {'same p50':>12}")
+    for name, inputs, legacy, impls in cases:
+        r = run(legacy, inputs)
+        print(f"{name:<14} {'loops':<10} {r['ops_per_sec']:>10.1f} {r['p50_us']:>8.2f} {r['p95_us']:>8.2f} {'-':>8}")
+        for label, fn in impls:
+            r = run(fn, inputs)
+            changed, examples = diff(legacy, fn, inputs)
+            same = [item for item in inputs if legacy(*item) == fn(*item)]
+            same_p50 = f"{run(legacy, same)['p50_us']:.2f}/{run(fn, same)['p50_us']:.2f}" if same else "-"
+            print(f"{name:<14} {label:<10} {r['ops_per_sec']:>10.1f} {r['p50_us']:>8.2f} {r['p95_us']:>8.2f} {changed:>8}"
+                  f" {same_p50:>12}")
+            for e in examples:
+                print(f"    {e}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+# bench/pipeline.py
+"""
+Бенчмарк конвейера ответа: search_matches, is_off_topic, parse_choice и ask_ai
+на текущей базе и на синтетически раздутых базах. LLM заменён заглушкой,
+сеть не нужна. search_cached — тот же поиск через кэш результатов
+(responder.search_matches) на повторных вопросах, записанных иначе: регистр
+и лишние пробелы; ask_ai начинает с пустого кэша.
+
+    python bench/pipeline.py                                  # текущая база, 10k и 100k keyword'ов
+    python bench/pipeline.py --sizes current,20000 --queries 500
+    python bench/pipeline.py --out bench.json                 # сохранить результат
+    python bench/pipeline.py --baseline bench.json            # сравнить и упасть при регрессии p95
+    python bench/pipeline.py --parity 200                     # сверить нечёткий индекс с difflib (bench/fuzzy.py)
+
+Для каждой пары (размер базы, стадия) печатаются ops/sec и p50/p95/p99 в мкс,
+для каждой базы — доля попаданий в кэш поиска в ask_ai.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import sys
+import time
+from types import SimpleNamespace
+from typing import Dict, List, Tuple
+
+from common import make_corpus, summarize, synthetic_kb  # noqa: E402  (добавляет корень репозитория в sys.path)
+
+os.environ.setdefault("MATCHING_MODE", "inline")
+
+from ai_responder import llm as llm_module  # noqa: E402
+from ai_responder import responder  # noqa: E402
+from ai_responder.index import KeywordIndex  # noqa: E402
+from ai_responder.matching import is_off_topic, parse_choice  # noqa: E402
+from ai_responder.snapshot import Snapshot  # noqa: E402
+from fuzzy import fuzzy_parity  # noqa: E402
+
+CHOICE_REPLIES = ["1", "2", "второй", "правила", "где раздел", "3)", "вывод", "непонятно"]
+
+
+class FakeLLM:
+    """Заглушка AsyncLLM: сразу отвечает переформулированным текстом."""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def complete(self, model, messages, temperature=0.2):
+        self.calls += 1
+        await asyncio.sleep(0)
+        text = "Коротко: " + messages[-1]["content"][-120:]
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+
+class BenchKB:
+    """Одна и та же база для обоих устройств — вдвое меньше памяти на больших размерах."""
+
+    def __init__(self, navigation: List, rules: List, version: str):
+        self.navigation_desktop = self.navigation_mobile = navigation
+        self.rules = rules
+        self.version = version
+        index = KeywordIndex(navigation, rules)
+        self.indexes = {"desktop": index, "mobile": index}
+
+    def index(self, device: str) -> KeywordIndex:
+        return self.indexes["desktop"]
+
+
+def timed(fn, items) -> List[float]:
+    samples = []
+    for item in items:
+        started = time.perf_counter()
+        fn(item)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def timed_ask_ai(questions: List[str], users: int) -> List[float]:
+    for uid in range(1, users + 1):
+        responder.sessions.mark_seen(uid)
+        responder.sessions.set_device(uid, "mobile" if uid % 2 else "desktop")
+    samples = []
+    for i, q in enumerate(questions):
+        uid = i % users + 1
+        responder.sessions.clear_pending(uid)
+        started = time.perf_counter()
+        await responder.ask_ai(uid, q)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def respelled(q: str, i: int) -> str:
+    """Тот же вопрос от другого пользователя: другой регистр и пробелы, та же нормализованная форма."""
+    return ("  " + q.upper() + " ") if i % 2 else q.capitalize().replace(" ", "  ")
+
+
+def run_size(label: str, kb: BenchKB, queries: int) -> Tuple[List[Dict], Dict[str, float]]:
+    keywords = kb.index("desktop").keywords
+    corpus = make_corpus(keywords, queries)
+    index = kb.index("desktop")
+
+    # варианты для parse_choice — реальные списки с несколькими совпадениями
+    option_lists = [m for m in (index.search(q) for q in corpus[:200]) if len(m) > 1] or [[
+        {"type": "navigation", "title": "вывод средств", "value": "..."},
+        {"type": "rules", "title": "правила вывода", "value": "..."},
+    ]]
+    choice_inputs = [
+        (CHOICE_REPLIES[i % len(CHOICE_REPLIES)], option_lists[i % len(option_lists)])
+        for i in range(queries)
+    ]
+
+    stages = {
+        "search_matches": timed(index.search, corpus),
+        "is_off_topic": timed(is_off_topic, corpus),
+        "parse_choice": timed(lambda a: parse_choice(*a), choice_inputs),
+    }
+
+    current = responder.current()
+    cache = responder.search_cache
+    responder.snapshots.swap(Snapshot(kb, current.system_prompt, current.prompt_version, {}))
+    try:
+        for q in corpus:
+            responder.search_matches(q, "desktop")
+        stages["search_cached"] = timed(
+            lambda a: responder.search_matches(respelled(*a), "desktop"), list(zip(corpus, range(queries))),
+        )
+        cache.invalidate()
+        cache.hits = cache.misses = 0
+        stages["ask_ai"] = asyncio.run(timed_ask_ai(corpus, users=500))
+        cache_stats = cache.stats()
+    finally:
+        responder.snapshots.swap(current)
+        cache.invalidate()
+
+    return [
+        dict({"kb": label, "keywords": len(keywords), "stage": stage}, **summarize(samples))
+        for stage, samples in stages.items()
+    ], cache_stats
+
+
+def compare(results: List[Dict], baseline_path: str, tolerance: float) -> bool:
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["kb"], r["stage"]): r for r in json.load(f)["results"]}
+    ok = True
+    for r in results:
+        b = baseline.get((r["kb"], r["stage"]))
+        if not b or not b["p95_us"]:
+            continue
+        ratio = r["p95_us"] / b["p95_us"]
+        flag = "REGRESSION" if ratio > 1 + tolerance else ""
+        ok = ok and not flag
+        print(f"{r['kb']:>8} {r['stage']:<15} p95 {b['p95_us']:>10.1f} -> {r['p95_us']:>10.1f} us  x{ratio:5.2f} {flag}",
+              file=sys.stderr)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Matching/answering pipeline benchmark")
+    parser.add_argument("--sizes", default="current,10000,100000", help="current или число keyword'ов, через запятую")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--out", help="записать результат в JSON-файл")
+    parser.add_argument("--baseline", help="JSON предыдущего прогона для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимый рост p95 (0.2 = +20%%)")
+    parser.add_argument("--parity", type=int, default=0, help="сверить fuzzy-индекс с difflib на N вопросах")
+    args = parser.parse_args()
+
+    llm_module._llm = FakeLLM()
+    base = responder.current().kb
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "matching_mode": responder.matcher.mode,
+            "queries": args.queries,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": [],
+        "search_cache": {},
+    }
+
+    for size in args.sizes.split(","):
+        if size == "current":
+            nav, rules = base.navigation_desktop, base.rules
+        else:
+            nav, rules = synthetic_kb(base.navigation_desktop, base.rules, int(size))
+        started = time.perf_counter()
+        kb = BenchKB(nav, rules, version=f"bench-{size}")
+        # индекс живёт до конца прогона: без freeze проходы сборщика по нему шумят в замерах
+        gc.collect()
+        gc.freeze()
+        print(f"[{size}] index built in {time.perf_counter() - started:.2f}s, "
+              f"{len(kb.index('desktop').keywords)} keywords", file=sys.stderr)
+        rows, cache_stats = run_size(size, kb, args.queries)
+        for row in rows:
+            report["results"].append(row)
+            print(f"{row['kb']:>8} {row['stage']:<15} {row['ops_per_sec']:>10.1f} ops/s  "
+                  f"p50 {row['p50_us']:>9.1f}  p95 {row['p95_us']:>9.1f}  p99 {row['p99_us']:>9.1f} us",
+                  file=sys.stderr)
+        p50 = {row["stage"]: row["p50_us"] for row in rows}
+        report["search_cache"][size] = dict(cache_stats, hit_rate=round(cache_stats["hit_rate"], 3))
+        print(f"{size:>8} search cache: ask_ai hit rate {cache_stats['hit_rate']:.1%}, repeated query p50 "
+              f"x{p50['search_matches'] / max(p50['search_cached'], 0.1):.1f} faster", file=sys.stderr)
+        if args.parity and size == "current":
+            index = kb.index("desktop")
+            report["fuzzy_parity"] = fuzzy_parity(index, make_corpus(index.keywords, args.parity, seed=7))
+            print(f"fuzzy parity: {report['fuzzy_parity']}", file=sys.stderr)
+
+    report["meta"]["llm_calls"] = llm_module._llm.calls
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+    else:
+        print(json.dumps(report, ensure_ascii=False))
+
+    if args.baseline and not compare(report["results"], args.baseline, args.tolerance):
+        sys.exit(1)
+    if report.get("fuzzy_parity", {}).get("mismatches"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# bench/pregenerated.py
+"""
+Офлайн-сборка готовых ответов против локальной заглушки OpenAI (bench/fakes.py):
+pregenerated.build() генерирует ответы для правил базы во временный
+humanized.json, затем ask_ai отвечает на вопросы по этим правилам — готовые
+тексты должны отдаваться из артефакта, ни одного вызова модели.
+
+    python bench/pregenerated.py
+    python bench/pregenerated.py --concurrency 16 --latency 0.05
+
+Печатается итог build(), сколько ответов пришло из артефакта и сколько раз
+заглушку вызвали при ответах. Код выхода 1, если сборка что-то не сгенерировала,
+ответы вызывали модель или ни один ответ не был готовым.
+"""
+import argparse
+import asyncio
+import functools
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from fakes import FakeOpenAI  # (через common добавляет корень репозитория в sys.path)
+
+os.environ.setdefault("MATCHING_MODE", "inline")
+os.environ["ANSWER_CACHE_PATH"] = ""  # ответы из кэша на диске не должны подменять готовые
+
+from ai_responder import llm as llm_module  # noqa: E402
+from ai_responder import responder  # noqa: E402
+from ai_responder.llm import AsyncLLM  # noqa: E402
+from ai_responder.pregenerated import _collect, build  # noqa: E402
+
+
+async def run(args, artifact: Path):
+    async with FakeOpenAI(latency=args.latency) as ai:
+        llm_module._llm = AsyncLLM("test", base_url=ai.url + "/v1")
+        try:
+            snap = responder.current()
+            items = _collect(snap.kb.rules)
+            started = time.perf_counter()
+            report = await build(
+                artifact,
+                items,
+                snap.prompt_version,
+                functools.partial(responder.generate_humanized, kind="rules"),
+                concurrency=args.concurrency,
+            )
+            report["seconds"] = round(time.perf_counter() - started, 2)
+
+            # бот подхватывает артефакт новым срезом, как после перезагрузки базы
+            responder.PATH_HUMANIZED = artifact
+            responder.snapshots.swap(responder._snapshot_for(snap.kb))
+            snap = responder.current()
+
+            calls = ai.calls
+            served = 0
+            for user_id, (key, item) in enumerate(items.items(), start=1):
+                responder.sessions.mark_seen(user_id)
+                responder.sessions.set_device(user_id, "desktop")
+                answer = await responder.ask_ai(user_id, item["question"])
+                ready = snap.rendered.pregenerated(key)
+                served += ready is not None and answer == ready
+            return report, served, ai.calls - calls
+        finally:
+            await llm_module._llm.aclose()
+            llm_module._llm = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build pre-generated answers against a fake completion server")
+    parser.add_argument("--concurrency", type=int, default=8, help="одновременных вызовов модели при сборке")
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка заглушки OpenAI, сек")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        report, served, calls = asyncio.run(run(args, Path(tmp) / "humanized.json"))
+    ok = report["generated"] == report["total"] and not report["failed"] and served and calls == 0
+
+    print(f"build: {report}")
+    print(f"ask_ai: {served}/{report['total']} answered from the artifact; model calls while answering: {calls}")
+    print("ok" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
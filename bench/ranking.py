@@ -0,0 +1,79 @@
+# bench/ranking.py
+"""
+Обычный поиск против TF-IDF-ранжирования (RANKING_MODE=tfidf): задержка и
+то, чем заканчивается вопрос — ответ сразу, список вариантов (лишний шаг
+«напишите номер» через sessions.set_pending) или «не нашёл». Нужен numpy.
+
+    python bench/ranking.py
+    python bench/ranking.py --sizes current,10000 --queries 1000 --confidence 0.55
+"""
+import argparse
+import sys
+import time
+from typing import Callable, Dict, List
+
+from common import make_corpus, summarize, synthetic_kb  # noqa: E402  (добавляет корень репозитория в sys.path)
+
+from ai_responder import ranking  # noqa: E402
+from ai_responder.index import KeywordIndex  # noqa: E402
+from ai_responder.kb import build_kb  # noqa: E402
+from ai_responder.paths import KB_SOURCES  # noqa: E402
+
+
+def outcomes(fn: Callable[[str], List[Dict]], corpus: List[str]) -> Dict:
+    samples, answered, pending, empty = [], 0, 0, 0
+    for q in corpus:
+        started = time.perf_counter()
+        found = fn(q)
+        samples.append(time.perf_counter() - started)
+        if not found:
+            empty += 1
+        elif len(found) == 1:
+            answered += 1
+        else:
+            pending += 1
+    n = len(corpus)
+    return dict(
+        summarize(samples),
+        answered=round(answered / n, 3),
+        pending=round(pending / n, 3),
+        not_found=round(empty / n, 3),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keyword search vs TF-IDF ranking")
+    parser.add_argument("--sizes", default="current,10000", help="current или число keyword'ов, через запятую")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--confidence", type=float, default=0.6)
+    parser.add_argument("--margin", type=float, default=0.1)
+    parser.add_argument("--min-score", type=float, default=0.45)
+    args = parser.parse_args()
+    if not ranking.available():
+        sys.exit("numpy is not installed")
+
+    params = dict(top_k=args.top_k, confidence=args.confidence, margin=args.margin, min_score=args.min_score)
+    base = build_kb(KB_SOURCES)
+    print(f"{'kb':>8} {'engine':<8} {'ops/s':>9} {'p50 us':>9} {'p95 us':>9} "
+          f"{'answered':>9} {'pending':>8} {'not found':>9}")
+    for size in args.sizes.split(","):
+        if size == "current":
+            nav, rules = base.navigation_desktop, base.rules
+        else:
+            nav, rules = synthetic_kb(base.navigation_desktop, base.rules, int(size))
+        index = KeywordIndex(nav, rules)
+        started = time.perf_counter()
+        index.ranker()
+        print(f"[{size}] tf-idf matrix built in {time.perf_counter() - started:.2f}s, "
+              f"{index.ranker().n_rows} rows x {len(index.ranker().vocab)} features", file=sys.stderr)
+        corpus = make_corpus(index.keywords, args.queries)
+
+        for engine, fn in (("search", index.search), ("tfidf", lambda q: index.rank(q, **params))):
+            r = outcomes(fn, corpus)
+            print(f"{size:>8} {engine:<8} {r['ops_per_sec']:>9.1f} {r['p50_us']:>9.1f} {r['p95_us']:>9.1f} "
+                  f"{r['answered']:>9.1%} {r['pending']:>8.1%} {r['not_found']:>9.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+# bench/ratelimit.py
+"""
+Лимиты и повторы исходящих вызовов против локальных заглушек (bench/fakes.py),
+которые сами отвечают 429, как Telegram и OpenAI. Сеть не нужна, нужен aiohttp.
+Код выхода 1, если какой-то сценарий не сошёлся.
+
+    python bench/ratelimit.py
+    python bench/ratelimit.py --chats 50 --messages 5
+
+Сценарии:
+  telegram_burst   — серия сообщений в много чатов через OutboundLimiter: всё доставлено,
+                     повторов раньше retry_after нет, лишних 429 от лимитов нет;
+  telegram_no_lim  — то же без лимитера: видно, сколько отправок Telegram отверг бы;
+  telegram_flood   — сервер случайно отвечает 429: каждый отказ повторён после retry_after;
+  telegram_shed    — один чат, очередь больше queue_limit: лишнее сразу отброшено (Overloaded);
+  telegram_pause   — 429 в начале серии в один чат: очередь ждёт retry_after и уходит после него
+                     с прежним интервалом, а не залпом (новых отказов после паузы нет);
+  llm_retry_after  — модель отвечает 429 с Retry-After: все вызовы ждут паузу и проходят;
+  llm_give_up      — Retry-After больше max_wait: вызов сразу отдаёт ошибку, а не висит,
+                     и не ставит на паузу следующие вызовы.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from typing import Dict, Tuple
+
+from fakes import FakeBotAPI, FakeOpenAI  # (через common добавляет корень репозитория в sys.path)
+
+from aiogram import Bot  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+from aiogram.exceptions import TelegramRetryAfter  # noqa: E402
+
+from ai_responder.llm import AsyncLLM  # noqa: E402
+from ai_responder.ratelimit import Overloaded  # noqa: E402
+from bot.outbound import OutboundLimiter  # noqa: E402
+
+TOKEN = "42:fake"
+
+
+def make_bot(url: str, limiter=None) -> Bot:
+    bot = Bot(TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(url)))
+    if limiter is not None:
+        bot.session.middleware(limiter)
+    return bot
+
+
+async def send_all(bot: Bot, chats: int, messages: int) -> Dict[str, int]:
+    result = {"ok": 0, "retry_after": 0, "overloaded": 0}
+
+    async def one(chat_id: int, n: int):
+        try:
+            await bot.send_message(chat_id, f"msg {n}")
+            result["ok"] += 1
+        except TelegramRetryAfter:
+            result["retry_after"] += 1
+        except Overloaded:
+            result["overloaded"] += 1
+
+    await asyncio.gather(*(one(c, n) for c in range(1, chats + 1) for n in range(messages)))
+    return result
+
+
+async def telegram_burst(args) -> Tuple[bool, Dict]:
+    async with FakeBotAPI() as tg:
+        bot = make_bot(tg.url, OutboundLimiter(max_wait=60))
+        try:
+            sent = await send_all(bot, args.chats, args.messages)
+        finally:
+            await bot.session.close()
+    ok = sent["ok"] == args.chats * args.messages and tg.refused == 0
+    return ok, dict(sent, refused_by_server=tg.refused)
+
+
+async def telegram_no_limiter(args) -> Tuple[bool, Dict]:
+    async with FakeBotAPI() as tg:
+        bot = make_bot(tg.url)
+        try:
+            sent = await send_all(bot, args.chats, args.messages)
+        finally:
+            await bot.session.close()
+    # справочный сценарий: проверяем только, что заглушка действительно ограничивает
+    return tg.refused > 0, dict(sent, refused_by_server=tg.refused)
+
+
+async def telegram_flood(args) -> Tuple[bool, Dict]:
+    async with FakeBotAPI(flood_ratio=0.1) as tg:
+        bot = make_bot(tg.url, OutboundLimiter(max_retries=10, max_wait=120))
+        try:
+            sent = await send_all(bot, max(1, args.chats // 4), args.messages)
+        finally:
+            await bot.session.close()
+    ok = sent["ok"] == max(1, args.chats // 4) * args.messages and tg.early_retries == 0
+    return ok, dict(sent, refused_by_server=tg.refused, early_retries=tg.early_retries)
+
+
+async def telegram_shed(args) -> Tuple[bool, Dict]:
+    async with FakeBotAPI() as tg:
+        limiter = OutboundLimiter(queue_limit=5, max_wait=60)
+        bot = make_bot(tg.url, limiter)
+        started = time.monotonic()
+        try:
+            sent = await send_all(bot, 1, 30)
+        finally:
+            await bot.session.close()
+    # в очереди не больше 5 ждущих + запас ведра; остальные отброшены без вызова API
+    ok = sent["overloaded"] > 0 and sent["ok"] + sent["overloaded"] == 30 and tg.refused == 0
+    return ok, dict(sent, seconds=round(time.monotonic() - started, 1))
+
+
+async def telegram_pause(args) -> Tuple[bool, Dict]:
+    async with FakeBotAPI(refuse_first=1, flood_retry_after=5) as tg:
+        bot = make_bot(tg.url, OutboundLimiter(max_wait=60))
+        started = time.monotonic()
+        try:
+            sent = await send_all(bot, 1, args.messages + 5)
+        finally:
+            await bot.session.close()
+    # отказ получают первый вызов и ушедшие вместе с ним в запасе ведра (burst); после паузы — никто
+    ok = sent["ok"] == args.messages + 5 and tg.refused <= OutboundLimiter().chat_burst and tg.early_retries == 0
+    return ok, dict(sent, refused_by_server=tg.refused, early_retries=tg.early_retries,
+                    seconds=round(time.monotonic() - started, 1))
+
+
+async def llm_retry_after(args) -> Tuple[bool, Dict]:
+    async with FakeOpenAI(refuse_first=2, retry_after=1.0) as ai:
+        llm = AsyncLLM("test", base_url=ai.url + "/v1", max_retries=3, max_wait=10)
+        started = time.monotonic()
+        try:
+            resps = await asyncio.gather(*(
+                llm.complete("fake", [{"role": "user", "content": f"вопрос {i}"}]) for i in range(args.llm_calls)
+            ), return_exceptions=True)
+        finally:
+            await llm.aclose()
+    failed = sum(isinstance(r, Exception) for r in resps)
+    ok = failed == 0 and ai.early_retries == 0
+    return ok, {"calls": args.llm_calls, "failed": failed, "upstream": ai.calls, "refused": ai.refused,
+                "early_retries": ai.early_retries, "seconds": round(time.monotonic() - started, 1)}
+
+
+async def llm_give_up(args) -> Tuple[bool, Dict]:
+    async with FakeOpenAI(refuse_first=1, retry_after=60) as ai:
+        llm = AsyncLLM("test", base_url=ai.url + "/v1", max_retries=3, max_wait=5)
+        started = time.monotonic()
+        try:
+            await llm.complete("fake", [{"role": "user", "content": "вопрос"}])
+            failed = False
+        except Exception:
+            failed = True
+        # сдавшийся вызов не просил паузу: следующий уходит сразу
+        try:
+            await llm.complete("fake", [{"role": "user", "content": "следующий вопрос"}])
+            next_ok = True
+        except Exception:
+            next_ok = False
+        finally:
+            await llm.aclose()
+    seconds = time.monotonic() - started
+    return failed and next_ok and seconds < 1, {
+        "failed": failed, "next_ok": next_ok, "upstream": ai.calls, "seconds": round(seconds, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rate limits and retries against fake Bot API / OpenAI servers")
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=5, help="сообщений в каждый чат одновременно")
+    parser.add_argument("--llm-calls", type=int, default=20)
+    args = parser.parse_args()
+
+    failed = False
+    for name, scenario in (
+        ("telegram_burst", telegram_burst),
+        ("telegram_no_lim", telegram_no_limiter),
+        ("telegram_flood", telegram_flood),
+        ("telegram_shed", telegram_shed),
+        ("telegram_pause", telegram_pause),
+        ("llm_retry_after", llm_retry_after),
+        ("llm_give_up", llm_give_up),
+    ):
+        ok, info = asyncio.run(scenario(args))
+        failed |= not ok
+        print(f"{name:<16} {'ok' if ok else 'FAIL':<5} {info}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# bench/rendering.py
+"""
+Стоимость подготовки ответа из базы к отправке: прежняя сборка на каждый
+ответ (текст шагов построчно + новый InlineKeyboardMarkup) против поиска
+в готовых текстах среза (ai_responder/rendering.py) и кэша клавиатур.
+Дополнительно проверяет, что тексты совпадают с прежними, а нарезка длинных
+ответов укладывается в лимит Telegram. Код выхода 1, если проверка не сошлась.
+
+    python bench/rendering.py
+    python bench/rendering.py --replies 50000
+"""
+import argparse
+import html
+import sys
+import time
+from typing import Callable, Dict, List
+
+from common import summarize  # (добавляет корень репозитория в sys.path)
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup  # noqa: E402
+
+from ai_responder.kb import build_kb  # noqa: E402
+from ai_responder.paths import KB_SOURCES  # noqa: E402
+from ai_responder.rendering import MESSAGE_LIMIT, RenderedAnswers, render  # noqa: E402
+from handlers.messages import inline_markup  # noqa: E402
+
+BUTTONS = [{"text": "Смартфон", "data": "device:mobile"}, {"text": "Компьютер", "data": "device:desktop"}]
+
+
+def legacy_steps(match: Dict) -> str:
+    data = match["value"]
+    lines = [f"Чтобы {data.get('title')}, выполните следующие шаги:"]
+    for i, step in enumerate(data["steps"], start=1):
+        lines.append(f"{i}. {step}.")
+    return "\n".join(lines)
+
+
+def legacy_markup(buttons: List[Dict]) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text=b.get("text", "?"), callback_data=b.get("data", ""))]
+            for b in buttons
+        ]
+    )
+
+
+def run(fn: Callable, inputs: List) -> Dict[str, float]:
+    samples = []
+    for item in inputs:
+        started = time.perf_counter()
+        fn(item)
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-reply rendering vs pre-rendered snapshot texts")
+    parser.add_argument("--replies", type=int, default=20000)
+    args = parser.parse_args()
+
+    kb = build_kb(KB_SOURCES)
+    started = time.perf_counter()
+    rendered = RenderedAnswers(kb, {})
+    build_ms = (time.perf_counter() - started) * 1000
+
+    index = kb.index("desktop")
+    steps = [index.describe(no, "exact") for no, (_, item) in enumerate(index.entries)
+             if isinstance(item.get("answer"), dict)]
+    matches = [steps[i % len(steps)] for i in range(args.replies)]
+
+    # ответы совпадают с прежними (в базе нет символов, которые нужно экранировать)
+    mismatched = sum(rendered.steps(m) != html.escape(legacy_steps(m), quote=False) for m in steps)
+    long_text = ("Пункт меню «Профиль» → «Вывод средств» & <лимиты>.\n" * 400).strip()
+    parts = render(long_text).parts
+    split_ok = len(parts) > 1 and all(len(html.unescape(p)) <= MESSAGE_LIMIT for p in parts) and \
+        html.unescape("\n".join(parts)) == long_text
+
+    print(f"render snapshot: {len(rendered)} texts in {build_ms:.1f} ms")
+    print(f"{'stage':<10} {'impl':<10} {'ops/s':>11} {'p50 us':>8} {'p95 us':>8}")
+    for stage, impls in (
+        ("steps", (("per-reply", legacy_steps), ("lookup", rendered.steps))),
+        ("markup", (("per-reply", legacy_markup), ("cached", inline_markup))),
+    ):
+        inputs = matches if stage == "steps" else [BUTTONS] * args.replies
+        for label, fn in impls:
+            r = run(fn, inputs)
+            print(f"{stage:<10} {label:<10} {r['ops_per_sec']:>11.1f} {r['p50_us']:>8.2f} {r['p95_us']:>8.2f}")
+    print(f"texts differ from legacy: {mismatched}; split {len(long_text)} chars into {len(parts)} parts: "
+          f"{'ok' if split_ok else 'FAIL'}")
+    sys.exit(0 if split_ok and not mismatched else 1)
+
+
+if __name__ == "__main__":
+    main()
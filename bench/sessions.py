@@ -0,0 +1,104 @@
+# bench/sessions.py
+"""
+Память SessionStore при большом числе пользователей.
+
+    python bench/sessions.py [--users 1000000] [--max-users 100000] [--history 20]
+
+Каждый симулированный пользователь проходит типичный диалог (приветствие,
+выбор устройства, несколько сообщений, pending-варианты). RSS и оценка
+memory_report() печатаются по ходу: после заполнения до max_users они
+должны оставаться на одном уровне.
+
+Перед замером проверяется, что backend'ы (память и SQLite) удаляют просроченные
+сессии: сломанный prune фоновый run_sweeper только пишет в лог, здесь он — ошибка.
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from ai_responder.session_backends import MemoryBackend, SQLiteBackend  # noqa: E402
+from ai_responder.sessions import SessionStore  # noqa: E402
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        import resource
+        return pages * resource.getpagesize()
+    except Exception:
+        return 0
+
+
+def simulate_user(store: SessionStore, user_id: int, messages: int):
+    store.mark_seen(user_id)
+    store.add_history(user_id, "assistant", "greet_asked_device")
+    store.set_device(user_id, "mobile" if user_id % 2 else "desktop")
+    for i in range(messages):
+        store.add_history(user_id, "user", f"как вывести деньги {i}")
+        store.add_history(user_id, "assistant", "Чтобы вывести средства, откройте «Кошелёк».")
+    if user_id % 5 == 0:
+        store.set_pending(user_id, [{"type": "rules", "title": "вывод", "value": "..."}])
+    if user_id % 7 == 0:
+        store.add_failed(user_id)
+
+
+def check_sweep():
+    """Просроченные записи уходят из backend'а, свежие остаются; иначе — SystemExit."""
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in (MemoryBackend(), SQLiteBackend(str(Path(tmp) / "sessions.db"))):
+            store = SessionStore(ttl=60, backend=backend)
+            simulate_user(store, 1, 1)
+            simulate_user(store, 2, 1)
+            store.flush()
+            name = type(backend).__name__
+            try:
+                removed = backend.prune(time.time() + 1)
+            except Exception as exc:
+                raise SystemExit(f"{name}.prune failed: {exc!r}")
+            if removed != 2 or backend.load(1) is not None:
+                raise SystemExit(f"{name}.prune removed {removed} of 2 expired sessions")
+            simulate_user(store, 3, 1)
+            store.flush()
+            if backend.prune(time.time() - 60) != 0 or backend.load(3) is None:
+                raise SystemExit(f"{name}.prune removed a fresh session")
+            backend.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--max-users", type=int, default=100_000)
+    parser.add_argument("--history", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=15, help="сообщений на пользователя")
+    parser.add_argument("--json", action="store_true", help="машиночитаемый вывод")
+    args = parser.parse_args()
+
+    check_sweep()
+    store = SessionStore(max_users=args.max_users, history_limit=args.history)
+    step = max(args.users // 10, 1)
+    points = []
+    for user_id in range(1, args.users + 1):
+        simulate_user(store, user_id, args.messages)
+        if user_id % step == 0:
+            report = store.memory_report()
+            report["simulated"] = user_id
+            report["rss_bytes"] = rss_bytes()
+            points.append(report)
+            if not args.json:
+                print(
+                    f"{user_id:>9} users  kept={report['users']:>7}  "
+                    f"approx={report['approx_bytes'] / 2**20:8.1f} MiB  "
+                    f"rss={report['rss_bytes'] / 2**20:8.1f} MiB"
+                )
+    if args.json:
+        print(json.dumps(points))
+
+
+if __name__ == "__main__":
+    main()
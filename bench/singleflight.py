@@ -0,0 +1,129 @@
+# bench/singleflight.py
+"""
+Проверка single-flight вокруг вызова модели: N одновременных одинаковых
+вопросов должны дать ровно один вызов LLM. LLM заменён медленной заглушкой,
+сеть не нужна. Код выхода 1, если какой-то сценарий не сошёлся.
+
+    python bench/singleflight.py
+    python bench/singleflight.py --users 500 --latency 0.5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+from common import percentile  # (добавляет корень репозитория в sys.path)
+
+os.environ.setdefault("MATCHING_MODE", "inline")
+os.environ["ANSWER_CACHE_PATH"] = ""  # только кэш в памяти: повторные запуски не должны попадать в старые ответы
+
+from ai_responder import llm as llm_module  # noqa: E402
+from ai_responder import responder  # noqa: E402
+
+
+class SlowLLM:
+    """Заглушка AsyncLLM: отвечает через latency секунд; первые fail вызовов падают."""
+
+    def __init__(self, latency: float, fail: int = 0):
+        self.latency = latency
+        self.fail = fail
+        self.calls = 0
+
+    async def complete(self, model, messages, temperature=0.2):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.calls <= self.fail:
+            raise RuntimeError("upstream error")
+        text = f"Ответ #{self.calls}: " + messages[-1]["content"][-60:]
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+
+# сколько ждал ответа каждый пользователь сценария (сек)
+waits = []
+
+
+async def waited(coro):
+    started = time.perf_counter()
+    try:
+        return await coro
+    finally:
+        waits.append(time.perf_counter() - started)
+
+
+async def identical(users: int, latency: float):
+    llm_module._llm = llm = SlowLLM(latency)
+    short = "Вывод средств → Профиль → Вывод (identical)"
+    started = time.perf_counter()
+    texts = await asyncio.gather(*(
+        waited(responder.humanize_answer_async(short, "Как вывести деньги?")) for _ in range(users)
+    ))
+    ok = llm.calls == 1 and len(set(texts)) == 1 and texts[0] != short
+    return ok, llm.calls, time.perf_counter() - started
+
+
+async def distinct(users: int, latency: float):
+    llm_module._llm = llm = SlowLLM(latency)
+    short = "Вывод средств → Профиль → Вывод (distinct)"
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        waited(responder.humanize_answer_async(short, f"как вывести деньги вариант {i}")) for i in range(users)
+    ))
+    return llm.calls == users, llm.calls, time.perf_counter() - started
+
+
+async def cancelled_leader(users: int, latency: float):
+    """Первый ждущий отменён посреди вызова — остальные всё равно получают ответ."""
+    llm_module._llm = llm = SlowLLM(latency)
+    short = "Правила: один аккаунт на человека (cancel)"
+    started = time.perf_counter()
+    leader = asyncio.ensure_future(responder.humanize_answer_async(short, "два аккаунта"))
+    await asyncio.sleep(0)
+    followers = [
+        asyncio.ensure_future(waited(responder.humanize_answer_async(short, "два аккаунта"))) for _ in range(users - 1)
+    ]
+    await asyncio.sleep(latency / 2)
+    leader.cancel()
+    texts = await asyncio.gather(*followers)
+    ok = leader.cancelled() and llm.calls == 1 and all(t != short for t in texts)
+    return ok, llm.calls, time.perf_counter() - started
+
+
+async def failed_flight(users: int, latency: float):
+    """Упавший вызов не запоминается: следующая волна вопросов снова идёт к модели."""
+    llm_module._llm = llm = SlowLLM(latency, fail=1)
+    short = "Верификация: загрузите документ (error)"
+    started = time.perf_counter()
+    first = await asyncio.gather(*(waited(responder.humanize_answer_async(short, "верификация")) for _ in range(users)))
+    second = await asyncio.gather(*(waited(responder.humanize_answer_async(short, "верификация")) for _ in range(users)))
+    ok = llm.calls == 2 and all(t == short for t in first) and all(t != short for t in second)
+    return ok, llm.calls, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Single-flight deduplication of LLM calls")
+    parser.add_argument("--users", type=int, default=100, help="одновременных вопросов в сценарии")
+    parser.add_argument("--latency", type=float, default=0.2, help="задержка заглушки LLM, сек")
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'scenario':<18} {'users':>6} {'llm calls':>10} {'seconds':>8} {'p50 wait':>9} {'max wait':>9}  result")
+    for name, scenario in (
+        ("identical", identical),
+        ("distinct", distinct),
+        ("cancelled_leader", cancelled_leader),
+        ("failed_flight", failed_flight),
+    ):
+        waits.clear()
+        ok, calls, seconds = asyncio.run(scenario(args.users, args.latency))
+        failed |= not ok
+        w = sorted(waits)
+        print(f"{name:<18} {args.users:>6} {calls:>10} {seconds:>8.2f} {percentile(w, 50):>9.3f} {w[-1]:>9.3f}  "
+              f"{'ok' if ok else 'FAIL'}")
+    print(responder.inflight.stats(), file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
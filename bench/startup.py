@@ -0,0 +1,107 @@
+# bench/startup.py
+"""
+Холодный старт бота: сколько времени проходит от запуска процесса до первых
+ответов. Бот запускается отдельным процессом (python main.py в режиме polling)
+против локальных заглушек Bot API и OpenAI (bench/fakes.py); апдейты лежат в
+очереди ещё до старта — как сообщения, пришедшие во время перезапуска.
+
+    python bench/startup.py
+    python bench/startup.py --runs 5 --compare-warmup   # ещё и с WARMUP=0
+    python bench/startup.py --imports 15                # самые тяжёлые импорты (python -X importtime)
+
+Печатаются медианы по запускам, секунды от старта процесса:
+  interpreter   — до первой строки кода (сам интерпретатор);
+  import_main   — import main (aiogram, обработчики, ai_responder);
+  greeting      — первый ответ: приветствие нового пользователя (база не нужна);
+  kb_answer     — первый ответ из базы знаний (шаги навигации);
+  llm_answer    — первый ответ через модель (заглушка OpenAI).
+Код выхода 1, если бот не ответил на какое-то сообщение.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+from common import ROOT
+from fakes import FakeBotAPI, FakeOpenAI, start_bot  # noqa: E402
+
+# что спросить и с какого id: новый пользователь, ответ из базы, ответ через модель
+SCRIPT = {
+    "greeting": (101, ["привет"]),
+    "kb_answer": (102, ["💻 Компьютер", "история ставок"]),
+    "llm_answer": (103, ["💻 Компьютер", "верификация"]),
+}
+
+async def one_run(args, warmup: bool) -> Dict[str, float]:
+    async with FakeBotAPI(chat_rate=100, chat_burst=100) as tg, FakeOpenAI(latency=0.05) as ai:
+        for chat_id, texts in SCRIPT.values():
+            for text in texts:
+                tg.push_message(chat_id, text)
+        spawned = time.time()
+        proc = await start_bot(tg.url, ai.url, WARMUP=int(warmup))
+        try:
+            stamps = json.loads(await asyncio.wait_for(proc.stdout.readline(), args.timeout))
+            result = {"interpreter": stamps["started"] - spawned, "import_main": stamps["imported"] - spawned}
+            for name, (chat_id, texts) in SCRIPT.items():
+                ok = await tg.wait_delivered(chat_id, len(texts), timeout=args.timeout)
+                # последний ответ в чат — ответ на сам вопрос (до него — выбор устройства)
+                result[name] = tg.delivered_at[chat_id][len(texts) - 1] - spawned if ok else float("nan")
+        finally:
+            proc.terminate()
+            await proc.wait()
+    return result
+
+
+def report(label: str, runs: List[Dict[str, float]]) -> bool:
+    print(f"{label}:")
+    ok = True
+    for key in runs[0]:
+        values = [r[key] for r in runs]
+        if any(v != v for v in values):  # nan — ответа не было
+            ok = False
+            print(f"  {key:<12} no reply")
+            continue
+        print(f"  {key:<12} {statistics.median(values):7.3f}s  (min {min(values):.3f}, max {max(values):.3f})")
+    return ok
+
+
+def top_imports(n: int):
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT, env=dict(os.environ, BOT_TOKEN="42:fake"), capture_output=True, text=True,
+    ).stderr
+    rows = []
+    for line in out.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2].rstrip()))
+    print(f"top {n} imports by cumulative time:")
+    for us, name in sorted(rows, reverse=True)[:n]:
+        print(f"  {us / 1e6:7.3f}s {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start: import and first-response times")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--compare-warmup", action="store_true", help="also run with WARMUP=0")
+    parser.add_argument("--imports", type=int, default=0, help="print the N heaviest imports of main")
+    args = parser.parse_args()
+
+    ok = True
+    modes = [True, False] if args.compare_warmup else [True]
+    for warmup in modes:
+        runs = [asyncio.run(one_run(args, warmup)) for _ in range(args.runs)]
+        ok &= report(f"WARMUP={int(warmup)}", runs)
+    if args.imports:
+        top_imports(args.imports)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# bench/vectors.py
+"""
+IVF-индекс векторов против полного перебора: задержка запроса и recall@k
+на текущей базе и синтетически раздутых (эмбеддер hashing, без сети). Нужен numpy.
+
+    python bench/vectors.py
+    python bench/vectors.py --sizes 10000,100000 --nprobe 4,8,16
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from common import make_corpus, summarize, synthetic_kb  # noqa: E402  (добавляет корень репозитория в sys.path)
+
+from ai_responder import embeddings  # noqa: E402
+from ai_responder.index import KeywordIndex  # noqa: E402
+from ai_responder.kb import build_kb  # noqa: E402
+from ai_responder.paths import KB_SOURCES  # noqa: E402
+from ai_responder.vectors import VectorStore, build_store  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IVF vector index vs brute force")
+    parser.add_argument("--sizes", default="current,10000,100000", help="current или число keyword'ов, через запятую")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--nprobe", default="4,8,16")
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+    if not embeddings.available():
+        sys.exit("numpy is not installed")
+    np = embeddings.np
+
+    embedder = embeddings.HashingEmbedder(256)
+    base = build_kb(KB_SOURCES)
+    print(f"{'kb':>8} {'rows':>8} {'search':<10} {'ops/s':>9} {'p50 us':>9} {'p95 us':>9} {'recall@k':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes.split(","):
+            if size == "current":
+                nav, rules = base.navigation_desktop, base.rules
+            else:
+                nav, rules = synthetic_kb(base.navigation_desktop, base.rules, int(size))
+            index = KeywordIndex(nav, rules)
+            vectors, ivf = Path(tmp) / f"{size}.npy", Path(tmp) / f"{size}.idx.npz"
+            info = build_store([index], embedder, vectors, ivf)
+            print(f"[{size}] {info}", file=sys.stderr)
+            store = VectorStore.load(vectors, ivf)
+            matrix = np.asarray(store.vectors)
+            queries = embedder.embed(make_corpus(index.keywords, args.queries, seed=3))
+
+            # полный перебор — эталон для recall
+            samples, truth = [], []
+            for q in queries:
+                started = time.perf_counter()
+                scores = matrix @ q
+                top = np.argpartition(-scores, args.k - 1)[:args.k]
+                samples.append(time.perf_counter() - started)
+                truth.append(set(top.tolist()))
+            r = summarize(samples)
+            print(f"{size:>8} {info['rows']:>8} {'brute':<10} {r['ops_per_sec']:>9.1f} {r['p50_us']:>9.1f} {r['p95_us']:>9.1f} {1.0:>9.3f}")
+
+            for nprobe in (int(n) for n in args.nprobe.split(",")):
+                samples, hits = [], 0
+                for q, expected in zip(queries, truth):
+                    started = time.perf_counter()
+                    found, _ = store.nearest(q, args.k, nprobe)
+                    samples.append(time.perf_counter() - started)
+                    hits += len(expected & set(found.tolist()))
+                r = summarize(samples)
+                recall = hits / (len(queries) * args.k)
+                print(f"{size:>8} {info['rows']:>8} {'ivf/' + str(nprobe):<10} {r['ops_per_sec']:>9.1f} "
+                      f"{r['p50_us']:>9.1f} {r['p95_us']:>9.1f} {recall:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# bench/webhook.py
+"""
+Задержка подтверждения апдейтов в webhook-режиме.
+
+    python bench/webhook.py [--updates 2000] [--concurrency 50]
+
+Поднимает webhook-приложение бота на локальном порту и шлёт синтетические
+апдейты Telegram с правильным и неправильным секретом. Меряется только время
+до ответа HTTP 200 — обработка идёт фоном (ответы в Telegram из песочницы
+уйти не смогут, это ожидаемо и на замер не влияет).
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ.setdefault("BOT_TOKEN", "123456:TEST-TOKEN-FOR-LOCAL-BENCH")
+
+from aiohttp import ClientSession  # noqa: E402
+from aiohttp.test_utils import TestServer  # noqa: E402
+
+SECRET = "bench-secret"
+PATH = "/webhook"
+
+
+def make_update(update_id: int) -> dict:
+    user = {"id": 10_000 + update_id % 500, "is_bot": False, "first_name": "u"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user["id"], "type": "private"},
+            "from": user,
+            "text": "как вывести деньги",
+        },
+    }
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+async def run(updates: int, concurrency: int) -> dict:
+    import main
+    from bot.webhook import create_webhook_app
+
+    app = create_webhook_app(main.dp, main.bot, PATH, SECRET)
+    server = TestServer(app)
+    await server.start_server()
+    url = str(server.make_url(PATH))
+    latencies = []
+    statuses = {}
+    sem = asyncio.Semaphore(concurrency)
+
+    async with ClientSession() as http:
+        async def post(i: int, secret: str):
+            async with sem:
+                started = time.perf_counter()
+                async with http.post(
+                    url,
+                    data=json.dumps(make_update(i)),
+                    headers={"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": secret},
+                ) as resp:
+                    await resp.read()
+                    if secret == SECRET:
+                        latencies.append(time.perf_counter() - started)
+                    statuses[resp.status] = statuses.get(resp.status, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(post(i, SECRET) for i in range(1, updates + 1)))
+        elapsed = time.perf_counter() - started
+        await post(updates + 1, "wrong")
+
+    await server.close()
+    await main.bot.session.close()
+    return {
+        "updates": updates,
+        "statuses": statuses,
+        "ack_per_sec": round(updates / elapsed, 1),
+        "ack_p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "ack_p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "ack_p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Webhook acknowledgement latency")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.updates, args.concurrency)), indent=1))
@@ -8,3 +8,114 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY") or os.getenv("OPENAI_KEY")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 LOGS_DIR = os.getenv("LOGS_DIR", "logs")
+
+# LLM: адрес API (для прокси / локального стенда), таймаут одного вызова и
+# сколько запросов к модели можно держать одновременно
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "20"))
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "16"))
+# лимит вызовов модели: в секунду (0 — без ограничения) и запас для всплеска; сколько вызовов
+# может ждать лимита; повторы после 429 / 5xx / сетевых ошибок и сколько всего ждать (сек)
+OPENAI_RATE = float(os.getenv("OPENAI_RATE", "0"))
+OPENAI_BURST = float(os.getenv("OPENAI_BURST", "10"))
+OPENAI_QUEUE_LIMIT = int(os.getenv("OPENAI_QUEUE_LIMIT", "200"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+OPENAI_MAX_WAIT = float(os.getenv("OPENAI_MAX_WAIT", "20"))
+
+# кэш очеловеченных ответов: размер, время жизни (сек), файл SQLite (пусто — только память)
+# и как часто новые ответы записываются в него (сек)
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "2000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", str(7 * 24 * 3600)))
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "")
+ANSWER_CACHE_FLUSH_INTERVAL = float(os.getenv("ANSWER_CACHE_FLUSH_INTERVAL", "1.0"))
+
+# кэш результатов поиска по базе (нормализованный вопрос + устройство + версия базы); 0 — выключен
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "5000"))
+
+# сессии: максимум пользователей в памяти, время простоя до удаления (сек), длина истории
+SESSION_MAX_USERS = int(os.getenv("SESSION_MAX_USERS", "100000"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(24 * 3600)))
+SESSION_HISTORY_LIMIT = int(os.getenv("SESSION_HISTORY_LIMIT", "20"))
+# общее хранилище сессий для нескольких воркеров: "" (только память) / "sqlite" / "memory"
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "")
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.db")
+# как часто перечитывать сессию из хранилища и сбрасывать в него изменения (сек)
+SESSION_SYNC_INTERVAL = float(os.getenv("SESSION_SYNC_INTERVAL", "1.0"))
+SESSION_FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", "0.5"))
+
+# режим работы: "polling" (по умолчанию) или "webhook"
+# webhook несколькими процессами:
+#   gunicorn main:create_app --worker-class aiohttp.GunicornWebWorker --workers 4 --bind 0.0.0.0:$PORT
+# (сессии между воркерами — через SESSION_BACKEND=sqlite)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")          # публичный https-адрес, например https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("PORT") or os.getenv("WEBAPP_PORT", "8080"))
+
+# обработка апдейтов: сколько одновременно (на процесс) и окно склейки серии сообщений (сек, 0 — выкл.)
+DISPATCH_MAX_CONCURRENCY = int(os.getenv("DISPATCH_MAX_CONCURRENCY", "64"))
+COALESCE_WINDOW = float(os.getenv("COALESCE_WINDOW", "0"))
+
+# где выполнять поиск по базе: "inline" (в event loop), "thread" или "process", и сколько воркеров
+MATCHING_MODE = os.getenv("MATCHING_MODE", "thread")
+MATCHING_WORKERS = int(os.getenv("MATCHING_WORKERS", "2"))
+
+# как часто проверять data/*.json и system_prompt.txt на изменения (сек, 0 — без перезагрузки)
+KB_RELOAD_INTERVAL = float(os.getenv("KB_RELOAD_INTERVAL", "5"))
+
+# база знаний, SDK модели и токенизатор собираются в фоне после старта, пока бот уже принимает апдейты
+# (0 — по первому запросу, которому они нужны)
+WARMUP = os.getenv("WARMUP", "1").lower() in ("1", "true", "yes")
+# отбросить апдейты, накопившиеся, пока бот перезапускался (по умолчанию они обрабатываются)
+DROP_PENDING_UPDATES = os.getenv("DROP_PENDING_UPDATES", "0").lower() in ("1", "true", "yes")
+
+# метрики в формате Prometheus на http://METRICS_HOST:METRICS_PORT/metrics (0 — выключено)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# ранжирование кандидатов: "" (обычный поиск) или "tfidf" (нужен numpy, см. ai_responder/ranking.py)
+RANKING_MODE = os.getenv("RANKING_MODE", "")
+RANKING_TOP_K = int(os.getenv("RANKING_TOP_K", "5"))
+# отвечать сразу, если лучшая оценка >= CONFIDENCE и выше второй на MARGIN; ниже MIN_SCORE — «не нашёл»
+RANKING_CONFIDENCE = float(os.getenv("RANKING_CONFIDENCE", "0.6"))
+RANKING_MARGIN = float(os.getenv("RANKING_MARGIN", "0.1"))
+RANKING_MIN_SCORE = float(os.getenv("RANKING_MIN_SCORE", "0.45"))
+
+# смысловой поиск — запасной уровень, когда по keyword'ам ничего не нашлось:
+# "" (выкл.), "hashing" (локальный эмбеддер без сети) или "openai" (EMBEDDING_MODEL)
+# артефакт: python -m ai_responder.vectors; нужен numpy
+EMBEDDING_MODE = os.getenv("EMBEDDING_MODE", "")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "256"))  # только для hashing
+EMBEDDING_TOP_K = int(os.getenv("EMBEDDING_TOP_K", "3"))
+# порог косинуса подбирается под эмбеддер: у hashing оценки ниже, чем у модели
+EMBEDDING_MIN_SCORE = float(os.getenv("EMBEDDING_MIN_SCORE", "0.5"))
+EMBEDDING_NPROBE = int(os.getenv("EMBEDDING_NPROBE", "8"))
+
+# бюджет токенов запроса к модели (0 — без ограничения): весь запрос и отдельно системный промпт
+# (сверх бюджета разделы промпта отбрасываются с конца файла, см. ai_responder/prompting.py)
+PROMPT_MAX_TOKENS = int(os.getenv("PROMPT_MAX_TOKENS", "6000"))
+PROMPT_SYSTEM_BUDGET = int(os.getenv("PROMPT_SYSTEM_BUDGET", "0"))
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+
+# потоковый вывод ответа модели правками сообщения: вкл./выкл., как часто править (сек), текст заглушки
+LLM_STREAMING = os.getenv("LLM_STREAMING", "0").lower() in ("1", "true", "yes")
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+STREAM_PLACEHOLDER = os.getenv("STREAM_PLACEHOLDER", "✍️ Готовлю ответ…")
+
+# адрес Bot API (пусто — api.telegram.org); например, локальный сервер Bot API или тестовая заглушка
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+
+# лимиты исходящих сообщений Bot API (в секунду): всего, в личный чат (+ запас для всплеска), в группу;
+# сколько сообщений может ждать в очереди одного чата и в общей очереди бота, повторы после retry_after / 5xx и сколько ждать (сек)
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_CHAT_BURST = float(os.getenv("TELEGRAM_CHAT_BURST", "3"))
+TELEGRAM_GROUP_RATE = float(os.getenv("TELEGRAM_GROUP_RATE", str(20 / 60)))
+TELEGRAM_QUEUE_LIMIT = int(os.getenv("TELEGRAM_QUEUE_LIMIT", "20"))
+TELEGRAM_GLOBAL_QUEUE_LIMIT = int(os.getenv("TELEGRAM_GLOBAL_QUEUE_LIMIT", "300"))
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "3"))
+TELEGRAM_MAX_WAIT = float(os.getenv("TELEGRAM_MAX_WAIT", "30"))
@@ -0,0 +1,37 @@
+import logging
+from typing import Optional
+
+from aiohttp import web
+
+from ai_responder.metrics import REGISTRY
+
+log = logging.getLogger(__name__)
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(
+        text=REGISTRY.render(),
+        content_type="text/plain",
+        headers={"X-Content-Type-Options": "nosniff"},
+        charset="utf-8",
+    )
+
+
+async def start_metrics_server(host: str, port: int) -> Optional[web.AppRunner]:
+    """
+    Отдельный маленький HTTP-сервер с одним маршрутом /metrics.
+    Если порт занят (например, его уже слушает соседний воркер gunicorn),
+    бот работает дальше без метрик в этом процессе.
+    """
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as e:
+        log.warning("metrics endpoint %s:%s not started: %s", host, port, e)
+        await runner.cleanup()
+        return None
+    log.info("metrics endpoint on http://%s:%s/metrics", host, port)
+    return runner
@@ -0,0 +1,101 @@
+# bot/outbound.py
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter, TelegramServerError
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from ai_responder.metrics import RETRIES, SHED
+from ai_responder.ratelimit import KeyedBuckets, Overloaded, TokenBucket, backoff
+
+log = logging.getLogger(__name__)
+
+
+class OutboundLimiter(BaseRequestMiddleware):
+    """
+    Лимиты Bot API на исходящие вызовы бота (bot.session.middleware(...)):
+      - общий — не больше global_rate сообщений в секунду на бота;
+      - на чат — chat_rate в личном чате (с запасом burst на короткую серию:
+        ответ + кнопки + предложение поддержки), group_rate в группах;
+      - TelegramRetryAfter: чат замолкает на retry_after секунд (очередь
+        чата ждёт вместе с ним), вызов повторяется; TelegramServerError — повтор
+        с экспоненциальной задержкой. Сетевые ошибки не повторяются: запрос
+        мог дойти, и пользователь получил бы сообщение дважды.
+    Ограничиваются только вызовы с chat_id (отправка, правка, удаление);
+    getUpdates, answerCallbackQuery и служебные методы идут без очереди.
+    Если очередь чата длиннее queue_limit, общая очередь — длиннее
+    global_queue_limit или ждать дольше max_wait, вызов не выполняется —
+    обработчик получает Overloaded.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        chat_burst: float = 3.0,
+        group_rate: float = 20 / 60,
+        queue_limit: int = 20,
+        global_queue_limit: int = 300,
+        max_retries: int = 3,
+        max_wait: float = 30.0,
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_rate, max_waiters=global_queue_limit)
+        self.chats = KeyedBuckets(self._chat_bucket)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.queue_limit = queue_limit
+        self.max_retries = max_retries
+        self.max_wait = max_wait
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        # id групп и каналов отрицательные, @username — публичный канал
+        group = not isinstance(chat_id, int) or chat_id < 0
+        if group:
+            return TokenBucket(self.group_rate, 1.0, max_waiters=self.queue_limit)
+        return TokenBucket(self.chat_rate, self.chat_burst, max_waiters=self.queue_limit)
+
+    async def _acquire(self, chat: TokenBucket, deadline: float):
+        # сначала общий лимит, потом лимит чата: ожидание общего не должно сдвигать сообщения
+        # чата друг к другу (в чате лимит строже и его нарушение заметнее)
+        try:
+            await self.global_bucket.acquire(max_wait=deadline - time.monotonic())
+            await chat.acquire(max_wait=deadline - time.monotonic())
+        except Overloaded:
+            SHED.inc("telegram")
+            raise
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id: Optional[object] = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+
+        chat = self.chats.get(chat_id)
+        deadline = time.monotonic() + self.max_wait
+        attempt = 0
+        while True:
+            await self._acquire(chat, deadline)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt >= self.max_retries or time.monotonic() + e.retry_after > deadline:
+                    raise
+                chat.pause(e.retry_after)
+                RETRIES.inc("telegram", "retry_after")
+                log.info("flood control in chat %s: retry in %ss", chat_id, e.retry_after)
+            except TelegramServerError:
+                delay = backoff(attempt)
+                if attempt >= self.max_retries or time.monotonic() + delay > deadline:
+                    raise
+                RETRIES.inc("telegram", "server")
+                await asyncio.sleep(delay)
+            attempt += 1
@@ -0,0 +1,21 @@
+from typing import Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
+
+
+def create_webhook_app(dp: Dispatcher, bot: Bot, path: str, secret: Optional[str]) -> web.Application:
+    """
+    aiohttp-приложение, принимающее апдейты от Telegram.
+    Заголовок X-Telegram-Bot-Api-Secret-Token сверяется с secret (иначе 401),
+    а сам апдейт обрабатывается фоновой задачей — Telegram сразу получает 200.
+    """
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=secret,
+        handle_in_background=True,
+    ).register(app, path=path)
+    return app
@@ -3,7 +3,7 @@ from aiogram import Router
 from aiogram.filters import Command
 from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton
 
-from ai_responder.responder import user_device, sessions
+from ai_responder.responder import sessions
 
 router = Router()
 
@@ -27,7 +27,6 @@ async def cmd_start(msg: Message):
 
     # Полностью очищаем сессию — история, pending, device и флаг приветствия
     sessions.clear(user)
-    user_device.pop(user, None)
 
     await msg.answer(
         "<b>Добро пожаловать!</b> 😊\n\n"
@@ -58,7 +57,6 @@ async def cmd_reset(msg: Message):
     """Принудительная очистка сессии для текущего пользователя."""
     user = msg.from_user.id
     sessions.clear(user)
-    user_device.pop(user, None)
     await msg.answer(
         "✅ Сессия успешно сброшена. Давайте начнём заново — выберите устройство:",
         reply_markup=device_keyboard
@@ -1,4 +1,10 @@
+import logging
+import time
+from functools import lru_cache
+from typing import Dict, Optional, Sequence, Tuple
+
 from aiogram import Router
+from aiogram.exceptions import TelegramRetryAfter
 from aiogram.types import (
     Message,
     ReplyKeyboardMarkup,
@@ -8,7 +14,14 @@ from aiogram.types import (
     InlineKeyboardButton,
     CallbackQuery,
 )
+from ai_responder.metrics import HANDLER_ERRORS, LIVE_SUPPORT, REQUEST_SECONDS, STAGE_SECONDS
+from ai_responder.ratelimit import Overloaded
+from ai_responder.rendering import message_parts
 from ai_responder.responder import ask_ai, sessions
+from bot.config import LLM_STREAMING, STREAM_EDIT_INTERVAL, STREAM_PLACEHOLDER
+from handlers.streaming import TelegramStreamer
+
+log = logging.getLogger(__name__)
 
 router = Router()
 
@@ -18,25 +31,31 @@ LIVE_SUPPORT_URL = "https://cutt.ly/atghzvA0"
 
 # Сколько подряд "провалов" считать триггером для предложения живой поддержки
 MAX_FAILS_BEFORE_SUPPORT = 3
+# фразы отказа: ответ с ними тоже считается «провалом»
+FALLBACK_PHRASES = (
+    "не могу", "не смог", "не нашел", "не нашёл", "не понимаю",
+    "не найдено", "не удалось найти", "извините, я не могу", "не могу помочь",
+)
+
+# Кнопка с ссылкой на Com100. Клавиатуры не меняются — собираем один раз и переиспользуем.
+LIVE_SUPPORT_MARKUP = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [
+            InlineKeyboardButton(
+                text="Написать живой поддержке",
+                url=LIVE_SUPPORT_URL
+            )
+        ]
+    ]
+)
 
-# Временное хранение счётчиков неудачных ответов по user_id
-_failed_answers = {}  # user_id -> int
 
 def build_live_support_markup() -> InlineKeyboardMarkup:
     """
     Кнопка с ссылкой на Com100.
     Текст кнопки: "Написать живой поддержке"
     """
-    return InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(
-                    text="Написать живой поддержке",
-                    url=LIVE_SUPPORT_URL
-                )
-            ]
-        ]
-    )
+    return LIVE_SUPPORT_MARKUP
 # ---------------------------------------------------------------
 
 
@@ -48,37 +67,95 @@ device_keyboard = ReplyKeyboardMarkup(
     resize_keyboard=True,
     one_time_keyboard=True,
 )
+remove_keyboard = ReplyKeyboardRemove()
+
+
+@lru_cache(maxsize=256)
+def _inline_markup(buttons: Tuple[Tuple[str, str], ...]) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text=text, callback_data=data)]
+            for text, data in buttons
+        ]
+    )
+
+
+def inline_markup(buttons: Sequence[Dict]) -> Optional[InlineKeyboardMarkup]:
+    """Кнопки из ответа ask_ai; одинаковые наборы кнопок — один и тот же объект клавиатуры."""
+    if not buttons:
+        return None
+    return _inline_markup(tuple((b.get("text", "?"), b.get("data", "")) for b in buttons))
+
+
+async def _send(msg: Message, text: str, **kwargs):
+    """msg.answer с замером стадии send (сетевой вызов Bot API)."""
+    with STAGE_SECONDS.time("send"):
+        return await msg.answer(text, **kwargs)
+
+
+async def _reply(msg: Message, answer, streamer: Optional[TelegramStreamer] = None):
+    """
+    Ответ ask_ai в чат: с кнопками (dict), итогом потока или текстом. Текст
+    длиннее лимита Telegram уходит несколькими сообщениями; у ответов из базы
+    части нарезаны заранее (ai_responder/rendering.py).
+    """
+    if isinstance(answer, dict):
+        await _send(msg, answer.get("text", ""), reply_markup=inline_markup(answer.get("buttons")))
+    elif streamer is not None and streamer.started:
+        await streamer.finish(answer if isinstance(answer, str) else str(answer))
+    else:
+        for part in message_parts(answer if isinstance(answer, str) else str(answer)):
+            await _send(msg, part)
+
+
+def _streamer(reply_to: Message):
+    """Потоковый вывод ответа модели (LLM_STREAMING=1) — иначе None и ответ приходит целиком."""
+    if not LLM_STREAMING:
+        return None
+    return TelegramStreamer(reply_to, interval=STREAM_EDIT_INTERVAL, placeholder=STREAM_PLACEHOLDER)
 
 
 # -------------------- MESSAGE HANDLER --------------------
 @router.message()
 async def handle_message(msg: Message):
+    with REQUEST_SECONDS.time("message"):
+        return await _handle_message(msg)
+
+
+async def _handle_message(msg: Message):
     user_id = msg.from_user.id
     text_raw = msg.text or ""
     text = text_raw.strip().lower()
+    # с общим хранилищем сессий: запись могла измениться в другом воркере (чтение — в потоке)
+    await sessions.refresh(user_id)
 
     # --- ключевое слово: "помощь оператора" ---
     if "помощь оператора" in text:
-        await msg.answer(
+        LIVE_SUPPORT.inc("keyword")
+        await _send(
+            msg,
             "Чтобы связаться с живой поддержкой, нажмите на кнопку ниже",
-            reply_markup=build_live_support_markup()
+            reply_markup=LIVE_SUPPORT_MARKUP
         )
         # не считаем это попыткой AI — сразу отдадим пользователю ссылку
         return
 
     # --- если пользователь ещё не выбрал устройство ---
-    if not sessions.has_device(user_id):
+    with STAGE_SECONDS.time("device_routing"):
+        has_device = sessions.has_device(user_id)
+    if not has_device:
         # обработка кнопок
         if text in ("📱 смартфон", "смартфон", "телефон", "mobile"):
             sessions.set_device(user_id, "mobile")
             sessions.mark_seen(user_id)
             sessions.add_history(user_id, "assistant", "device_set_mobile")
 
-            return await msg.answer(
+            return await _send(
+                msg,
                 "Отлично 👌\n"
                 "Вы используете 📱 мобильную версию сайта.\n\n"
                 "Задайте вопрос — я подскажу, куда перейти и что сделать.",
-                reply_markup=ReplyKeyboardRemove(),
+                reply_markup=remove_keyboard,
                 parse_mode="Markdown"
             )
 
@@ -87,11 +164,12 @@ async def handle_message(msg: Message):
             sessions.mark_seen(user_id)
             sessions.add_history(user_id, "assistant", "device_set_desktop")
 
-            return await msg.answer(
+            return await _send(
+                msg,
                 "Отлично 👌\n"
                 "Вы используете версию сайта для компьютера 💻.\n\n"
                 "Задайте вопрос — я помогу разобраться.",
-                reply_markup=ReplyKeyboardRemove(),
+                reply_markup=remove_keyboard,
                 parse_mode="Markdown"
             )
 
@@ -99,7 +177,8 @@ async def handle_message(msg: Message):
         sessions.mark_seen(user_id)
         sessions.add_history(user_id, "assistant", "greet_asked_device")
 
-        return await msg.answer(
+        return await _send(
+            msg,
             "Здравствуйте! 👋\n\n"
             "Чтобы я подсказывал вам точную навигацию, выберите, "
             "с какого устройства вы пользуетесь сайтом:",
@@ -109,9 +188,12 @@ async def handle_message(msg: Message):
     # --- устройство выбрано → обычная работа ---
     sessions.add(user_id, "user", text_raw)
 
+    streamer = _streamer(msg)
     try:
-        answer = await ask_ai(user_id, text_raw)
+        with STAGE_SECONDS.time("ask_ai"):
+            answer = await ask_ai(user_id, text_raw, sink=streamer)
 
+        check_started = time.perf_counter()
         # --- определим, считать ли это "провалом" ответа AI ---
         failed = False
         # если нет ответа
@@ -129,59 +211,49 @@ async def handle_message(msg: Message):
 
         # дополнительно: если AI вернул очевидную фразу отказа/фоллбека — считаем провалом
         if not failed:
-            fallback_phrases = [
-                "не могу", "не смог", "не нашел", "не нашёл", "не понимаю",
-                "не найдено", "не удалось найти", "извините, я не могу", "не могу помочь"
-            ]
-            t = text_to_check
-            for p in fallback_phrases:
-                if p in t:
+            for p in FALLBACK_PHRASES:
+                if p in text_to_check:
                     failed = True
                     break
 
         # если провал — увеличиваем счётчик, иначе сбрасываем
+        # (счётчик хранится в сессии пользователя и вытесняется вместе с ней)
+        fails = 0
         if failed:
-            _failed_answers[user_id] = _failed_answers.get(user_id, 0) + 1
+            fails = sessions.add_failed(user_id)
         else:
-            _failed_answers[user_id] = 0
+            sessions.reset_failed(user_id)
+        STAGE_SECONDS.observe(time.perf_counter() - check_started, "failure_check")
 
         # если достигнут порог — предложить живую поддержку и сбросить счётчик
-        if _failed_answers.get(user_id, 0) >= MAX_FAILS_BEFORE_SUPPORT:
-            _failed_answers[user_id] = 0  # сброс
-            await msg.answer(
+        if fails >= MAX_FAILS_BEFORE_SUPPORT:
+            sessions.reset_failed(user_id)  # сброс
+            LIVE_SUPPORT.inc("failures")
+            if streamer is not None:
+                await streamer.abort()  # как и без потока: вместо ответа — только предложение поддержки
+            await _send(
+                msg,
                 "❗ Если я не могу помочь вам с этим вопросом, "
                 "вы можете обратиться к живой поддержке.\n\n"
                 "Нажмите кнопку ниже, чтобы связаться с оператором.",
-                reply_markup=build_live_support_markup()
+                reply_markup=LIVE_SUPPORT_MARKUP
             )
             return
 
-        # --- ответ с кнопками (inline)
-        if isinstance(answer, dict):
-            text_to_send = answer.get("text", "")
-            buttons = answer.get("buttons", [])
-
-            if buttons:
-                markup = InlineKeyboardMarkup(
-                    inline_keyboard=[
-                        [
-                            InlineKeyboardButton(
-                                text=b.get("text", "?"),
-                                callback_data=b.get("data", "")
-                            )
-                        ]
-                        for b in buttons
-                    ]
-                )
-                await msg.answer(text_to_send, reply_markup=markup)
-            else:
-                await msg.answer(text_to_send)
-            return
+        # ответ с кнопками (inline) или обычный текст
+        await _reply(msg, answer, streamer)
 
-        # обычный текст
-        await msg.answer(str(answer))
+    except (Overloaded, TelegramRetryAfter) as e:
+        # чат упёрся в лимит Bot API: сообщение об ошибке туда тоже не уйдёт
+        HANDLER_ERRORS.inc("message")
+        log.warning("reply to user %s dropped by rate limiting: %s", user_id, e)
+        if streamer is not None:
+            await streamer.abort()
 
     except Exception as e:
+        HANDLER_ERRORS.inc("message")
+        if streamer is not None:
+            await streamer.abort()
         await msg.answer(
             "⚠️ Произошла ошибка при обработке запроса.\n"
             f"Техническая информация: <code>{e}</code>",
@@ -192,35 +264,25 @@ async def handle_message(msg: Message):
 # -------------------- CALLBACK HANDLER --------------------
 @router.callback_query()
 async def handle_callback(callback: CallbackQuery):
+    with REQUEST_SECONDS.time("callback"):
+        return await _handle_callback(callback)
+
+
+async def _handle_callback(callback: CallbackQuery):
     user_id = callback.from_user.id
     data = callback.data or ""
+    await sessions.refresh(user_id)
 
+    streamer = _streamer(callback.message)
     try:
-        answer = await ask_ai(user_id, data)
-
-        if isinstance(answer, dict):
-            text_to_send = answer.get("text", "")
-            buttons = answer.get("buttons", [])
-
-            if buttons:
-                markup = InlineKeyboardMarkup(
-                    inline_keyboard=[
-                        [
-                            InlineKeyboardButton(
-                                text=b.get("text", "?"),
-                                callback_data=b.get("data", "")
-                            )
-                        ]
-                        for b in buttons
-                    ]
-                )
-                await callback.message.answer(text_to_send, reply_markup=markup)
-            else:
-                await callback.message.answer(text_to_send)
-        else:
-            await callback.message.answer(str(answer))
+        with STAGE_SECONDS.time("ask_ai"):
+            answer = await ask_ai(user_id, data, sink=streamer)
 
+        await _reply(callback.message, answer, streamer)
         await callback.answer()
 
     except Exception:
+        HANDLER_ERRORS.inc("callback")
+        if streamer is not None:
+            await streamer.abort()
         await callback.answer("Ошибка обработки действия", show_alert=True)
@@ -0,0 +1,92 @@
+# handlers/ordering.py
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+
+class _UserSlot:
+    __slots__ = ("lock", "inflight", "latest", "superseded")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()  # FIFO: апдейты пользователя идут строго по очереди
+        self.inflight = 0
+        self.latest = 0             # номер последнего пришедшего текстового сообщения
+        self.superseded: List[Tuple[int, str]] = []  # (номер, текст) сообщений, склеенных в следующее
+
+
+class UserOrderingMiddleware(BaseMiddleware):
+    """
+    Порядок и нагрузка поверх роутеров:
+      - апдейты одного пользователя обрабатываются последовательно
+        (нет гонок на pending и счётчике неудач в сессии);
+      - одновременно обрабатывается не больше max_concurrency апдейтов всех пользователей;
+      - coalesce_window > 0 включает склейку: серия текстовых сообщений,
+        набранных подряд с паузами меньше окна, обрабатывается одним
+        сообщением — последним, с текстами всех по порядку через перевод строки.
+    Команды и нажатия кнопок не склеиваются.
+    """
+
+    def __init__(self, max_concurrency: int = 64, coalesce_window: float = 0.0):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.coalesce_window = coalesce_window
+        self._users: Dict[int, _UserSlot] = {}
+        self._seq = 0
+        self.superseded = 0
+
+    def _coalescable(self, event: TelegramObject) -> bool:
+        if self.coalesce_window <= 0 or not isinstance(event, Message):
+            return False
+        text = event.text or ""
+        return bool(text) and not text.startswith("/")
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = getattr(event, "from_user", None)
+        if user is None or not isinstance(event, (Message, CallbackQuery)):
+            async with self.semaphore:
+                return await handler(event, data)
+
+        user_id = user.id
+        slot = self._users.get(user_id)
+        if slot is None:
+            slot = self._users[user_id] = _UserSlot()
+        slot.inflight += 1
+        try:
+            coalesce = self._coalescable(event)
+            if coalesce:
+                self._seq += 1
+                seq = slot.latest = self._seq
+                # ждём: вдруг пользователь допишет ещё одно сообщение
+                await asyncio.sleep(self.coalesce_window)
+                if slot.latest != seq:
+                    return self._supersede(slot, seq, event)
+            async with slot.lock:
+                # пока стояли в очереди, могло прийти более новое сообщение
+                if coalesce and slot.latest != seq:
+                    return self._supersede(slot, seq, event)
+                if coalesce and slot.superseded:
+                    event = self._joined(slot, event)
+                async with self.semaphore:
+                    return await handler(event, data)
+        finally:
+            slot.inflight -= 1
+            if slot.inflight == 0:
+                self._users.pop(user_id, None)
+
+    def _supersede(self, slot: _UserSlot, seq: int, event: Message) -> None:
+        # текст не теряется: его получит следующее сообщение серии
+        self.superseded += 1
+        slot.superseded.append((seq, event.text))
+        return None
+
+    @staticmethod
+    def _joined(slot: _UserSlot, event: Message) -> Message:
+        parts = [text for _, text in sorted(slot.superseded)]
+        slot.superseded.clear()
+        return event.model_copy(update={"text": "\n".join(parts + [event.text])})
@@ -0,0 +1,106 @@
+# handlers/streaming.py
+import asyncio
+import html
+import time
+from typing import Optional
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message
+
+from ai_responder.metrics import STAGE_SECONDS
+from ai_responder.rendering import MESSAGE_LIMIT, message_parts, render
+
+
+class TelegramStreamer:
+    """
+    Приёмник потокового ответа модели (sink для ask_ai):
+      - start()  — сразу отправляет заглушку, пользователь видит, что ответ готовится;
+      - update() — запоминает накопленный текст и не чаще раза в interval секунд
+                   правит сообщение в фоне (чтение потока не ждёт Bot API);
+      - finish() — заменяет заглушку итоговым текстом;
+      - abort()  — убирает заглушку, если обработка упала.
+    Промежуточный текст экранируется: незакрытые теги и «<» из недописанного
+    ответа не должны ломать parse_mode="HTML". Итоговый — ответ ask_ai (уже
+    экранированный render()), а если Telegram всё же не разобрал разметку —
+    экранированным ещё раз.
+    """
+
+    def __init__(self, reply_to: Message, interval: float = 1.0, placeholder: str = "…"):
+        self.reply_to = reply_to
+        self.interval = interval
+        self.placeholder = placeholder
+        self.message: Optional[Message] = None
+        self._latest = ""
+        self._shown = ""
+        self._last_edit = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self.edits = 0
+
+    @property
+    def started(self) -> bool:
+        return self.message is not None
+
+    async def start(self):
+        if self.message is None:
+            with STAGE_SECONDS.time("send"):
+                self.message = await self.reply_to.answer(self.placeholder)
+            self._last_edit = time.monotonic()
+
+    async def update(self, text: str):
+        self._latest = text
+        if self.message is None or (self._task is not None and not self._task.done()):
+            return
+        if time.monotonic() - self._last_edit < self.interval:
+            return
+        self._task = asyncio.create_task(self._edit_partial())
+
+    async def _edit_partial(self):
+        text = self._latest
+        if text == self._shown:
+            return
+        self._last_edit = time.monotonic()
+        try:
+            await self.message.edit_text(html.escape(text[:MESSAGE_LIMIT - 2]) + " ▌", parse_mode="HTML")
+            self._shown = text
+            self.edits += 1
+        except TelegramBadRequest:
+            pass  # «message is not modified» и т.п. — следующая правка всё равно придёт
+
+    async def _settle(self):
+        if self._task is not None:
+            try:
+                await self._task
+            except Exception:
+                pass
+            self._task = None
+
+    async def finish(self, text: str, **kwargs):
+        """Итоговый текст: правка заглушки; то, что не влезло в одно сообщение, — отдельными сообщениями."""
+        await self._settle()
+        # без итога — то, что успело прийти потоком: это сырой текст модели
+        text = text or render(self._latest or self.placeholder)
+        head, *rest = message_parts(text)
+        with STAGE_SECONDS.time("send"):
+            if self.message is None:
+                await self.reply_to.answer(head, **kwargs)
+            else:
+                try:
+                    await self.message.edit_text(head, **kwargs)
+                except TelegramBadRequest as e:
+                    if "not modified" not in str(e):
+                        # Telegram не разобрал разметку — отправляем экранированным; режется
+                        # исходный текст, а не экранированный: иначе «&amp;» разрезался бы пополам
+                        head, *more = render(head).parts
+                        await self.message.edit_text(head, **dict(kwargs, parse_mode="HTML"))
+                        rest = more + rest
+            for part in rest:
+                await self.reply_to.answer(part)
+
+    async def abort(self):
+        await self._settle()
+        if self.message is not None:
+            try:
+                await self.message.delete()
+            except Exception:
+                pass
+            self.message = None
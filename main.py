@@ -1,23 +1,165 @@
 import asyncio
+import logging
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.types import BotCommand
-from bot.config import BOT_TOKEN
+from bot.config import (
+    BOT_TOKEN, SESSION_FLUSH_INTERVAL, ANSWER_CACHE_FLUSH_INTERVAL,
+    BOT_MODE, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBAPP_HOST, WEBAPP_PORT,
+    DISPATCH_MAX_CONCURRENCY, COALESCE_WINDOW, KB_RELOAD_INTERVAL, WARMUP, DROP_PENDING_UPDATES,
+    METRICS_HOST, METRICS_PORT, LOG_LEVEL, TELEGRAM_API_URL,
+    TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST, TELEGRAM_GROUP_RATE,
+    TELEGRAM_QUEUE_LIMIT, TELEGRAM_GLOBAL_QUEUE_LIMIT, TELEGRAM_MAX_RETRIES, TELEGRAM_MAX_WAIT,
+)
 from handlers import commands, messages  # callbacks optional
+from handlers.ordering import UserOrderingMiddleware
+from bot.outbound import OutboundLimiter
+from ai_responder.llm import close_llm
+from ai_responder.metrics import REGISTRY
+from ai_responder.paths import KB_SOURCES, PATH_HUMANIZED, PATH_PROMPT
+from ai_responder.responder import (
+    answer_cache, inflight, matcher, rebuild_snapshot, search_cache, sessions, snapshots, warm_up,
+)
+from ai_responder.snapshot import KnowledgeReloader
 
-bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
+logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+log = logging.getLogger(__name__)
+
+
+def _bot_session():
+    """Сессия Bot API на другом адресе (TELEGRAM_API_URL) — для локального сервера или тестовой заглушки."""
+    if not TELEGRAM_API_URL:
+        return None
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+
+    return AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL))
+
+
+bot = Bot(token=BOT_TOKEN, session=_bot_session(), default=DefaultBotProperties(parse_mode="HTML"))
+# все исходящие вызовы Bot API — через лимиты Telegram (общий и на чат) с повтором после retry_after
+bot.session.middleware(OutboundLimiter(
+    global_rate=TELEGRAM_GLOBAL_RATE,
+    chat_rate=TELEGRAM_CHAT_RATE,
+    chat_burst=TELEGRAM_CHAT_BURST,
+    group_rate=TELEGRAM_GROUP_RATE,
+    queue_limit=TELEGRAM_QUEUE_LIMIT,
+    global_queue_limit=TELEGRAM_GLOBAL_QUEUE_LIMIT,
+    max_retries=TELEGRAM_MAX_RETRIES,
+    max_wait=TELEGRAM_MAX_WAIT,
+))
 dp = Dispatcher()
 
 dp.include_router(commands.router)
 dp.include_router(messages.router)
 
+# один общий экземпляр: очередь пользователя и лимит едины для сообщений и кнопок
+ordering = UserOrderingMiddleware(DISPATCH_MAX_CONCURRENCY, COALESCE_WINDOW)
+dp.message.outer_middleware(ordering)
+dp.callback_query.outer_middleware(ordering)
+
+# фоновые задачи процесса (в webhook-режиме — у каждого воркера свои)
+_background = []
+_metrics_runner = None
+
+# значения, которые считаются в момент выдачи /metrics
+REGISTRY.gauge("bot_sessions_users", "Sessions held in memory", lambda: len(sessions))
+REGISTRY.gauge("bot_answer_cache_hit_rate", "Humanized answer cache hit rate", lambda: answer_cache.stats()["hit_rate"])
+REGISTRY.gauge("bot_search_cache_hit_rate", "Knowledge base search cache hit rate", lambda: search_cache.stats()["hit_rate"])
+REGISTRY.gauge("bot_llm_in_flight", "Distinct LLM generations running right now", lambda: len(inflight))
+REGISTRY.gauge("bot_kb_reloads", "Knowledge base snapshot swaps since start", lambda: snapshots.swaps)
+REGISTRY.gauge("bot_coalesced_updates", "Messages merged into a newer one from the same user", lambda: ordering.superseded)
+
+
+async def _set_commands(bot: Bot):
+    try:
+        await bot.set_my_commands([
+            BotCommand(command="start", description="Запуск бота"),
+            BotCommand(command="help", description="Помощь"),
+        ])
+    except Exception:
+        log.warning("set_my_commands failed", exc_info=True)
+
+
+@dp.startup()
+async def on_startup(bot: Bot):
+    """
+    Здесь — только то, без чего нельзя принимать апдейты; остальное в фоне:
+    пока идёт прогрев, бот уже отвечает (приветствие и выбор устройства базу не ждут).
+    """
+    global _metrics_runner
+    if WARMUP:
+        _background.append(asyncio.create_task(warm_up()))
+    if BOT_MODE == "webhook":
+        if WEBHOOK_URL:
+            # под gunicorn сюда приходит каждый воркер: одновременные setWebhook
+            # получают 429, но вебхук уже поставлен соседом — старт не роняем
+            try:
+                await bot.set_webhook(
+                    WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                    secret_token=WEBHOOK_SECRET,
+                )
+            except Exception:
+                log.warning("set_webhook failed", exc_info=True)
+    else:
+        await bot.delete_webhook(drop_pending_updates=DROP_PENDING_UPDATES)
+    # список команд меню не меняется между запусками — не задерживаем им старт
+    _background.append(asyncio.create_task(_set_commands(bot)))
+    _background.append(asyncio.create_task(sessions.run_sweeper()))
+    _background.append(asyncio.create_task(sessions.run_flusher(SESSION_FLUSH_INTERVAL)))
+    _background.append(asyncio.create_task(answer_cache.run_flusher(ANSWER_CACHE_FLUSH_INTERVAL)))
+    if KB_RELOAD_INTERVAL > 0:
+        reloader = KnowledgeReloader(
+            snapshots,
+            rebuild_snapshot,
+            (*KB_SOURCES, PATH_PROMPT, PATH_HUMANIZED),
+            interval=KB_RELOAD_INTERVAL,
+            # результаты поиска по прежней версии базы больше не понадобятся
+            on_swap=lambda snapshot: search_cache.invalidate(snapshot.kb.version),
+        )
+        _background.append(asyncio.create_task(reloader.run()))
+    if METRICS_PORT > 0:
+        from bot.metrics import start_metrics_server
+        _metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+
+
+@dp.shutdown()
+async def on_shutdown():
+    global _metrics_runner
+    for task in _background:
+        task.cancel()
+    # фоновые задачи дописывают начатое (например, пачку сессий) — ждём их до close()
+    await asyncio.gather(*_background, return_exceptions=True)
+    _background.clear()
+    if _metrics_runner is not None:
+        await _metrics_runner.cleanup()
+        _metrics_runner = None
+    sessions.close()
+    answer_cache.close()
+    matcher.shutdown()
+    await close_llm()
+
+
+async def create_app():
+    """
+    Фабрика aiohttp-приложения для webhook-режима (в том числе под gunicorn).
+    Корутина: GunicornWebWorker принимает только Application или async-фабрику.
+    """
+    from aiogram.webhook.aiohttp_server import setup_application
+    from bot.webhook import create_webhook_app
+
+    app = create_webhook_app(dp, bot, WEBHOOK_PATH, WEBHOOK_SECRET)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
 async def main():
-    await bot.delete_webhook(drop_pending_updates=True)
-    await bot.set_my_commands([
-        BotCommand(command="start", description="Запуск бота"),
-        BotCommand(command="help", description="Помощь"),
-    ])
-    await dp.start_polling(bot)
+    # апдейты обрабатываются задачами: ожидание LLM в одном чате не задерживает другие
+    await dp.start_polling(bot, handle_as_tasks=True)
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if BOT_MODE == "webhook":
+        from aiohttp import web
+        web.run_app(create_app(), host=WEBAPP_HOST, port=WEBAPP_PORT)
+    else:
+        asyncio.run(main())